@@ -0,0 +1,137 @@
+import os
+import re
+import json
+from typing import Dict, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from database import pool_wait_stats, POOL_SIZE
+
+# Configuration
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# In-flight requests per worker above which normal (write) requests are shed
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+# Extra in-flight slots only the priority lane (auth and reads) may use
+ADMISSION_PRIORITY_RESERVE = int(os.getenv("ADMISSION_PRIORITY_RESERVE", "16"))
+ADMISSION_MAX_HEAVY = int(os.getenv("ADMISSION_MAX_HEAVY", "4"))
+# Heavy requests are only admitted while the worker is below this share of ADMISSION_MAX_IN_FLIGHT
+ADMISSION_HEAVY_MAX_LOAD = float(os.getenv("ADMISSION_HEAVY_MAX_LOAD", "0.5"))
+# Pool pressure at which normal and heavy requests are shed
+ADMISSION_MAX_POOL_WAITERS = int(os.getenv("ADMISSION_MAX_POOL_WAITERS", str(POOL_SIZE)))
+ADMISSION_MAX_POOL_WAIT_MS = float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", "250"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+PRIORITY = "priority"
+NORMAL = "normal"
+HEAVY = "heavy"
+LANES = (PRIORITY, NORMAL, HEAVY)
+
+# Aggregations, file transfers and bulk sync; slow and DB-heavy by design
+HEAVY_PATH_PATTERN = re.compile(r"(summary|export|import|reconcile)/?$|/sync/?$")
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Return the lane of a request, or None for requests that are never shed."""
+    if not path.startswith("/api/"):
+        # Probes, docs and the root endpoint
+        return None
+    if path.endswith("/events"):
+        # Event streams stay open indefinitely and hold no DB connection
+        return None
+    if HEAVY_PATH_PATTERN.search(path):
+        return HEAVY
+    if "/auth/" in path or method in READ_METHODS:
+        return PRIORITY
+    return NORMAL
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds load with a fast 503 and Retry-After instead of letting requests
+    queue on an exhausted connection pool until the pool timeout.
+
+    Requests are split into lanes. Heavy summary/export/import requests are
+    capped and shed first, writes are shed at ADMISSION_MAX_IN_FLIGHT or
+    when the pool is under pressure, and auth and read requests keep a
+    reserve of extra slots so logins and page loads keep working.
+    """
+
+    def __init__(self, app: ASGIApp, enabled: bool = ADMISSION_ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.in_flight: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.admitted: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.shed: Dict[str, int] = {lane: 0 for lane in LANES}
+
+    @property
+    def total_in_flight(self) -> int:
+        return sum(self.in_flight.values())
+
+    def _pool_under_pressure(self) -> bool:
+        return (
+            pool_wait_stats.waiting > ADMISSION_MAX_POOL_WAITERS
+            or pool_wait_stats.avg_wait_ms > ADMISSION_MAX_POOL_WAIT_MS
+        )
+
+    def rejection_reason(self, lane: str) -> Optional[str]:
+        total = self.total_in_flight
+        if lane == PRIORITY:
+            if total >= ADMISSION_MAX_IN_FLIGHT + ADMISSION_PRIORITY_RESERVE:
+                return "Too many requests in flight"
+            return None
+        if total >= ADMISSION_MAX_IN_FLIGHT:
+            return "Too many requests in flight"
+        if self._pool_under_pressure():
+            return "Database connection pool is saturated"
+        if lane == HEAVY:
+            if self.in_flight[HEAVY] >= ADMISSION_MAX_HEAVY:
+                return "Too many report requests in flight"
+            if total >= ADMISSION_MAX_IN_FLIGHT * ADMISSION_HEAVY_MAX_LOAD:
+                return "Server is busy; report requests are paused"
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": dict(self.in_flight),
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+            "pool_waiting": pool_wait_stats.waiting,
+            "pool_avg_wait_ms": round(pool_wait_stats.avg_wait_ms, 2),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        lane = classify(scope["method"], scope["path"])
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = self.rejection_reason(lane)
+        if reason is not None:
+            self.shed[lane] += 1
+            await self._reject(send, reason)
+            return
+
+        self.admitted[lane] += 1
+        self.in_flight[lane] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[lane] -= 1
+
+    async def _reject(self, send: Send, reason: str):
+        body = json.dumps({"detail": {"code": "SERVER_BUSY", "message": reason}}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
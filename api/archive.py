@@ -0,0 +1,100 @@
+"""
+Archive tier of the finance ledgers.
+
+The finance_archive job (job_handlers.py) moves soft-deleted records, and
+settled records of closed financial years, out of resident_finances and
+society_finances into resident_finances_archive and society_finances_archive.
+The hot tables and their indexes then hold only what day-to-day requests
+read. Finance summaries read both tables through with_archive(), so their
+totals do not change when records are archived; list and get endpoints do
+so when passed include_archived=true. Archived records are read-only.
+"""
+
+import os
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import and_, delete, func, insert, not_, or_, select, union_all
+from sqlalchemy.orm import Session, aliased
+
+import models
+
+# Configuration
+# First month of the financial year (April to March by default)
+FINANCE_YEAR_START_MONTH = int(os.getenv("FINANCE_YEAR_START_MONTH", "4"))
+# Closed financial years kept in the hot tables besides the current one
+FINANCE_ARCHIVE_KEEP_YEARS = int(os.getenv("FINANCE_ARCHIVE_KEEP_YEARS", "2"))
+
+# Records in these states stay in the hot tables whatever their date
+OPEN_PAYMENT_STATUSES = ("pending", "overdue", "partially_paid")
+
+ARCHIVES = {
+    models.ResidentFinance: models.ArchivedResidentFinance,
+    models.SocietyFinance: models.ArchivedSocietyFinance,
+}
+LEDGER_DATES = {
+    models.ResidentFinance: models.ResidentFinance.due_date,
+    models.SocietyFinance: models.SocietyFinance.expense_date,
+}
+
+
+def _with_archive_alias(model):
+    hot, archive = model.__table__, ARCHIVES[model].__table__
+    names = [column.name for column in hot.columns]
+    rows = union_all(
+        select(*[hot.c[name] for name in names]),
+        select(*[archive.c[name] for name in names]),
+    ).subquery(hot.name)
+    return aliased(model, rows, adapt_on_names=True)
+
+
+_WITH_ARCHIVE = {model: _with_archive_alias(model) for model in ARCHIVES}
+
+
+def with_archive(model, include_archived: bool):
+    """
+    The model itself, or an alias of it reading the hot table and its
+    archive (UNION ALL). Conditions on the alias reach both tables, so date
+    filters still prune partitions of the hot table.
+    """
+    return _WITH_ARCHIVE[model] if include_archived else model
+
+
+def financial_year_start(day: date, start_month: int = FINANCE_YEAR_START_MONTH) -> date:
+    year = day.year if day.month >= start_month else day.year - 1
+    return date(year, start_month, 1)
+
+
+def archive_cutoff(today: Optional[date] = None, keep_years: int = FINANCE_ARCHIVE_KEEP_YEARS) -> date:
+    """Start of the oldest financial year kept in the hot tables; settled records dated before it are archived."""
+    start = financial_year_start(today or date.today())
+    return start.replace(year=start.year - keep_years)
+
+
+def archivable(model, closed_before: date):
+    """Condition selecting the records of a hot table that belong in the archive."""
+    ledger_date = LEDGER_DATES[model]
+    settled = or_(model.payment_status.is_(None), model.payment_status.notin_(OPEN_PAYMENT_STATUSES))
+    closed = and_(ledger_date < closed_before, settled)
+    if model is models.SocietyFinance:
+        # Active recurring templates keep generating entries
+        closed = and_(closed, not_(and_(model.recurring == True, model.is_active == True)))
+    return or_(model.is_active == False, closed)
+
+
+def archive_batch(db: Session, model, condition, batch_size: int) -> int:
+    """
+    Move up to batch_size records matching condition into the archive, in
+    one statement, and return how many moved. Rows locked by a concurrent
+    write are skipped and picked up by a later batch.
+    """
+    hot, archive = model.__table__, ARCHIVES[model].__table__
+    names = [column.name for column in hot.columns]
+    batch = select(hot.c.id).where(condition).limit(batch_size).with_for_update(skip_locked=True)
+    moved = delete(hot).where(hot.c.id.in_(batch)).returning(*[hot.c[name] for name in names]).cte("moved")
+    statement = (
+        insert(archive)
+        .from_select(names + ["archived_at"], select(*[moved.c[name] for name in names], func.now()))
+        .add_cte(moved)
+    )
+    return db.execute(statement).rowcount
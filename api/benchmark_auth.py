@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent logins on the synchronous and asynchronous DB paths.
+
+The sync path reproduces how the auth endpoints used to work: async def
+handlers calling the blocking SessionLocal, which stalls the event loop for
+every query. The async path uses the AsyncSessionLocal stack the auth
+endpoints use now.
+
+Besides throughput, the benchmark reports the longest event loop stall seen
+while the logins run: on the sync path every other request served by the
+same worker waits that long.
+
+Usage:
+    python benchmark_auth.py --username admin --password changeme123 --requests 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+import models
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine
+from endpoints.auth import verify_password
+from starlette.concurrency import run_in_threadpool
+
+
+async def sync_path_login(username: str, password: str, check_password: bool):
+    """One login through the blocking session, as the old handlers did."""
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == username).first()
+        if not user:
+            user = db.query(models.User).filter(models.User.email == username).first()
+        if not user or (check_password and not verify_password(password, user.password_hash)):
+            raise RuntimeError(f"Login failed for {username}")
+        setattr(user, "last_login", datetime.utcnow())
+        db.commit()
+        db.query(models.Role).filter(models.Role.id == user.role_id).first()
+    finally:
+        db.close()
+
+
+async def async_path_login(username: str, password: str, check_password: bool):
+    """One login through the async session stack."""
+    async with AsyncSessionLocal() as db:
+        query = select(models.User).options(selectinload(models.User.resident))
+        user = (await db.execute(query.filter(models.User.username == username))).scalars().first()
+        if not user:
+            user = (await db.execute(query.filter(models.User.email == username))).scalars().first()
+        if not user or (check_password and not await run_in_threadpool(verify_password, password, user.password_hash)):
+            raise RuntimeError(f"Login failed for {username}")
+        setattr(user, "last_login", datetime.utcnow())
+        await db.commit()
+        (await db.execute(select(models.Role).filter(models.Role.id == user.role_id))).scalars().first()
+
+
+async def watch_loop(stalls: list, interval: float = 0.005):
+    """Record how late the event loop wakes up a sleeping task."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run(login, args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with semaphore:
+            await login(args.username, args.password, args.check_password)
+
+    # Warm up connections so pool creation is not measured
+    await asyncio.gather(*(one() for _ in range(min(args.concurrency, 5))))
+
+    stalls = [0.0]
+    watcher = asyncio.create_task(watch_loop(stalls))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    # Let the watcher wake once more, so a stall covering the whole run is recorded too
+    await asyncio.sleep(0.01)
+    watcher.cancel()
+    return elapsed, max(stalls)
+
+
+async def main_async(args):
+    print(f"Benchmarking {args.requests} logins with concurrency {args.concurrency} "
+          f"({'with' if args.check_password else 'without'} password verification)")
+
+    results = {}
+    for name, login in (("sync", sync_path_login), ("async", async_path_login)):
+        elapsed, max_stall = await run(login, args)
+        results[name] = elapsed
+        print(f"{name:>5} path: {elapsed:.3f}s total, {args.requests / elapsed:.1f} logins/s, "
+              f"max event loop stall {max_stall * 1000:.1f}ms")
+
+    print(f"Speedup (async vs sync): {results['sync'] / results['async']:.2f}x")
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare concurrent login throughput on sync and async DB paths")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--check-password", action="store_true",
+                        help="Include bcrypt verification (dominates the timing, off by default)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
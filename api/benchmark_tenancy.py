@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark tenant scoping of the list endpoints: filtering in the
+application (get_society_scope resolves the caller's societies on the async
+session and adds `society_id IN (...)` to the query) against Postgres
+row-level security (TENANT_RLS=true: the scope is resolved on the request's
+own connection and set with set_config, and the policies filter).
+
+Requests go through the real app in process, so both modes include
+authentication and serialization. Besides throughput, the benchmark counts
+SQL statements per request, which is where the modes differ.
+
+Row-level security needs migration 0005 and a user restricted to some
+societies (a society admin or resident, not a system admin).
+
+Usage:
+    python benchmark_tenancy.py --username societyadmin --password changeme123 --requests 500 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from sqlalchemy import event
+
+import tenancy
+from database import engine, async_engine
+from main import app
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        for target in (engine, async_engine.sync_engine):
+            event.listen(target, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+async def run(client: httpx.AsyncClient, args, headers: dict):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    rows = []
+
+    async def one():
+        async with semaphore:
+            response = await client.get(args.path, headers=headers)
+            response.raise_for_status()
+            rows.append(len(response.json()))
+
+    # Warm up pools and caches so they are not measured
+    await asyncio.gather(*(one() for _ in range(min(args.concurrency, 10))))
+    rows.clear()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    return time.perf_counter() - start, rows
+
+
+async def main_async(args):
+    counter = StatementCounter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        response = await client.post("/api/v1/auth/token", data={"username": args.username, "password": args.password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        print(f"Benchmarking {args.requests} requests to {args.path} with concurrency {args.concurrency}")
+        results = {}
+        for name, rls in (("app", False), ("rls", True)):
+            tenancy.TENANT_RLS = rls
+            before = counter.count
+            elapsed, rows = await run(client, args, headers)
+            statements = (counter.count - before) / (args.requests + min(args.concurrency, 10))
+            results[name] = elapsed
+            print(f"{name:>3} scoping: {elapsed:.3f}s total, {args.requests / elapsed:.1f} requests/s, "
+                  f"{statements:.1f} SQL statements/request, {rows[0] if rows else 0} rows/response")
+
+    print(f"Speedup (rls vs app): {results['app'] / results['rls']:.2f}x")
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare app-side tenant filtering with Postgres row-level security")
+    parser.add_argument("--username", required=True, help="A user restricted to some societies")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--path", default="/api/v1/residents/?include=")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
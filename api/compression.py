@@ -0,0 +1,273 @@
+import os
+import gzip
+import hashlib
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Brotli is optional - fall back to gzip only when it is not installed
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Configuration
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_STREAMING = os.getenv("COMPRESSION_STREAMING", "true").lower() == "true"
+COMPRESSION_CACHE_ENTRIES = int(os.getenv("COMPRESSION_CACHE_ENTRIES", "256"))
+COMPRESSION_CACHE_MAX_BODY = int(os.getenv("COMPRESSION_CACHE_MAX_BODY", str(2 * 1024 * 1024)))
+
+# Content types that must never be compressed or buffered by the middleware
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the best supported encoding from an Accept-Encoding header.
+    Brotli wins over gzip when the client accepts both with equal weight.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[token] = quality
+
+    candidates = []
+    if brotli is not None:
+        candidates.append("br")
+    candidates.append("gzip")
+
+    best = None
+    best_quality = 0.0
+    for encoding in candidates:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_body(body: bytes, encoding: str, gzip_level: int, brotli_quality: int) -> bytes:
+    """Compress a complete response body with the given encoding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressedBodyCache:
+    """
+    Small LRU cache of compressed bodies keyed by encoding and a digest of the
+    uncompressed body, so identical responses are only compressed once.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(body: bytes, encoding: str) -> Tuple[str, bytes]:
+        return encoding, hashlib.blake2b(body, digest_size=16).digest()
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[bytes]:
+        compressed = self._entries.get(key)
+        if compressed is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return compressed
+
+    def set(self, key: Tuple[str, bytes], compressed: bytes):
+        self._entries[key] = compressed
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class _StreamCompressor:
+    """Incremental compressor that flushes each chunk so clients can decode as they go."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 produces a gzip container
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses with brotli or gzip.
+
+    - Bodies smaller than ``minimum_size`` are sent as-is.
+    - Streaming responses (e.g. exports) are compressed chunk by chunk when
+      ``streaming`` is enabled, and passed through untouched otherwise.
+    - Compressed bodies of cacheable GET responses are kept in an LRU cache.
+    - Every response with a compressible content type gets
+      ``Vary: Accept-Encoding``, compressed or not, so caches keep the
+      encodings apart.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+        streaming: bool = COMPRESSION_STREAMING,
+        cache_entries: int = COMPRESSION_CACHE_ENTRIES,
+        cache_max_body: int = COMPRESSION_CACHE_MAX_BODY,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.streaming = streaming
+        self.cache_max_body = cache_max_body
+        self.cache = CompressedBodyCache(cache_entries) if cache_entries > 0 else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = _CompressionResponder(self, encoding, scope["method"], send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: Optional[str], method: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.method = method
+        self.downstream_send = send
+        self.start_message: Optional[Message] = None
+        self.passthrough = False
+        self.compressor: Optional[_StreamCompressor] = None
+
+    def _should_skip(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return True
+        content_type = headers.get("content-type", "")
+        return any(content_type.startswith(excluded) for excluded in EXCLUDED_CONTENT_TYPES)
+
+    def _is_cacheable(self, headers: Headers) -> bool:
+        if self.middleware.cache is None or self.method != "GET":
+            return False
+        if self.start_message["status"] != 200:
+            return False
+        return "no-store" not in headers.get("cache-control", "")
+
+    def _compress(self, body: bytes, headers: Headers) -> bytes:
+        middleware = self.middleware
+        cacheable = self._is_cacheable(headers) and len(body) <= middleware.cache_max_body
+        if cacheable:
+            key = middleware.cache.make_key(body, self.encoding)
+            compressed = middleware.cache.get(key)
+            if compressed is not None:
+                return compressed
+        compressed = compress_body(body, self.encoding, middleware.gzip_level, middleware.brotli_quality)
+        if cacheable:
+            middleware.cache.set(key, compressed)
+        return compressed
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # Hold the start message until we know the shape of the body
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.downstream_send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is not None:
+            # Subsequent chunk of a compressed stream
+            chunk = self.compressor.compress(body)
+            if not more_body:
+                chunk += self.compressor.finish()
+            await self.downstream_send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+
+        if self._should_skip(headers):
+            await self._pass_through(message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        if self.encoding is None:
+            # The client accepts no encoding we support
+            await self._pass_through(message)
+            return
+
+        if not more_body:
+            # Complete body in a single message
+            if len(body) < self.middleware.minimum_size:
+                await self._pass_through(message)
+                return
+            compressed = self._compress(body, headers)
+            headers["Content-Encoding"] = self.encoding
+            headers["Content-Length"] = str(len(compressed))
+            await self.downstream_send(self.start_message)
+            await self.downstream_send({"type": "http.response.body", "body": compressed})
+            return
+
+        # Streaming body
+        if not self.middleware.streaming:
+            await self._pass_through(message)
+            return
+
+        self.compressor = _StreamCompressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+        headers["Content-Encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        await self.downstream_send(self.start_message)
+        await self.downstream_send({
+            "type": "http.response.body",
+            "body": self.compressor.compress(body),
+            "more_body": True,
+        })
+
+    async def _pass_through(self, message: Message):
+        self.passthrough = True
+        await self.downstream_send(self.start_message)
+        await self.downstream_send(message)
@@ -1,7 +1,10 @@
-from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import NamedTuple, Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -13,7 +16,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
-from database import get_db
+from database import get_async_db
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +36,16 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
 
+class BatchPrincipal(NamedTuple):
+    """
+    The caller of a /batch request, resolved once and handed to its
+    sub-requests. Only the id travels: each sub-request loads the user in
+    its own session, so a write to the user commits with that session.
+    """
+    user_id: UUID
+    username: str
+
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     """Verify if plain password matches the hashed password."""
@@ -46,18 +59,21 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def get_user_by_username_or_email(db: Session, username_or_email: str):
+async def get_user_by_username_or_email(db: AsyncSession, username_or_email: str):
     """Get user by username or email."""
-    user = db.query(models.User).filter(models.User.username == username_or_email).first()
+    # Load the linked resident up front; async sessions cannot lazy load it later
+    query = select(models.User).options(selectinload(models.User.resident))
+    user = (await db.execute(query.filter(models.User.username == username_or_email))).scalars().first()
     if not user:
-        user = db.query(models.User).filter(models.User.email == username_or_email).first()
+        user = (await db.execute(query.filter(models.User.email == username_or_email))).scalars().first()
     return user
 
 
-def authenticate_user(db: Session, username_or_email: str, password: str):
+async def authenticate_user(db: AsyncSession, username_or_email: str, password: str):
     """Authenticate user by username or email."""
-    user = get_user_by_username_or_email(db, username_or_email)
-    if not user or not verify_password(password, user.password_hash):
+    user = await get_user_by_username_or_email(db, username_or_email)
+    # bcrypt is CPU-bound, keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, password, user.password_hash):
         return None
     return user
 
@@ -74,13 +90,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_user_from_token(token: str, db: AsyncSession):
+    """Decode a JWT access token and load its user, or return None if invalid."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if not username:
+        return None
+    return await get_user_by_username_or_email(db, username)
+
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """Get current user from token."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+    # Sub-requests of a /batch call reuse the principal resolved once by the batch
+    batch_principal = request.scope.get("batch_principal")
+    if batch_principal is not None:
+        user = (await db.execute(
+            select(models.User).options(selectinload(models.User.resident))
+            .filter(models.User.id == batch_principal.user_id)
+        )).scalars().first()
+        if user is None:
+            raise credentials_exception
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
@@ -93,16 +133,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if not token_data.username:
         raise credentials_exception
         
-    user = get_user_by_username_or_email(db, token_data.username)
+    user = await get_user_by_username_or_email(db, token_data.username)
     if user is None:
         raise credentials_exception
     return user
 
 
-async def get_current_active_user(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_current_active_user(current_user = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """Check if current user is active."""
     # Need to query the database to check is_active status
-    is_active = db.query(models.User.is_active).filter(models.User.id == current_user.id).scalar()
+    is_active = (await db.execute(select(models.User.is_active).filter(models.User.id == current_user.id))).scalar()
     if not is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
@@ -112,12 +152,12 @@ async def get_current_active_user(current_user = Depends(get_current_user), db:
 @router.post("/auth/token", response_model=schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -127,7 +167,7 @@ async def login_for_access_token(
     
     # Update last login time
     setattr(user, "last_login", datetime.utcnow())
-    db.commit()
+    await db.commit()
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -149,67 +189,67 @@ async def change_password(
     current_password: str,
     new_password: str,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Change current user's password.
     """
     # Verify current password
-    if not verify_password(current_password, current_user.password_hash):
+    if not await run_in_threadpool(verify_password, current_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect current password"
         )
     
     # Hash and set new password
-    setattr(current_user, "password_hash", get_password_hash(new_password))
-    db.commit()
+    setattr(current_user, "password_hash", await run_in_threadpool(get_password_hash, new_password))
+    await db.commit()
     return {"message": "Password changed successfully"}
 
 
 @router.get("/auth/user-permissions", response_model=List[schemas.Permission])
-async def get_user_permissions(current_user = Depends(get_current_active_user), db: Session = Depends(get_db)):
+async def get_user_permissions(current_user = Depends(get_current_active_user), db: AsyncSession = Depends(get_async_db)):
     """
     Get all permissions for the current user based on their role.
     """
-    permissions = db.query(models.Permission).join(
+    permissions = (await db.execute(select(models.Permission).join(
         models.RolePermission,
         models.Permission.id == models.RolePermission.permission_id
     ).filter(
         models.RolePermission.role_id == current_user.role_id
-    ).all()
+    ))).scalars().all()
     
     return permissions
 
 
 # Function to check if a user has a specific permission
-def has_permission(
+async def has_permission(
     resource_type: str, 
     action: str, 
     user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Check if a user has a specific permission.
     """
     # Check if user is system admin (has all permissions)
-    is_system_admin = db.query(models.Role).filter(
+    is_system_admin = (await db.execute(select(models.Role.id).filter(
         models.Role.id == user.role_id,
         models.Role.name == "system_admin"
-    ).first() is not None
+    ))).first() is not None
     
     if is_system_admin:
         return True
     
     # Check for specific permission
-    has_specific_permission = db.query(models.Permission).join(
+    has_specific_permission = (await db.execute(select(models.Permission.id).join(
         models.RolePermission,
         models.Permission.id == models.RolePermission.permission_id
     ).filter(
         models.RolePermission.role_id == user.role_id,
         models.Permission.resource_type == resource_type,
         models.Permission.action == action
-    ).first() is not None
+    ))).first() is not None
     
     return has_specific_permission
 
@@ -217,13 +257,13 @@ def has_permission(
 @router.post("/auth/signup", response_model=schemas.User, status_code=201)
 async def signup(
     user_data: schemas.SignupRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new user account (signup).
     """
     # Check if username already exists
-    db_username = db.query(models.User).filter(models.User.username == user_data.username).first()
+    db_username = (await db.execute(select(models.User.id).filter(models.User.username == user_data.username))).first()
     if db_username:
         raise HTTPException(
             status_code=400, 
@@ -231,7 +271,7 @@ async def signup(
         )
     
     # Check if email already exists
-    db_email = db.query(models.User).filter(models.User.email == user_data.email).first()
+    db_email = (await db.execute(select(models.User.id).filter(models.User.email == user_data.email))).first()
     if db_email:
         raise HTTPException(
             status_code=400, 
@@ -239,7 +279,7 @@ async def signup(
         )
     
     # Get default role (resident) for new signups
-    default_role = db.query(models.Role).filter(models.Role.name == "resident").first()
+    default_role = (await db.execute(select(models.Role).filter(models.Role.name == "resident"))).scalars().first()
     if not default_role:
         raise HTTPException(
             status_code=500, 
@@ -247,7 +287,7 @@ async def signup(
         )
     
     # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     db_user = models.User(
         username=user_data.username,
         email=user_data.email,
@@ -258,8 +298,8 @@ async def signup(
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
@@ -267,12 +307,12 @@ async def signup(
 @router.post("/auth/login", response_model=dict)
 async def login(
     login_data: schemas.LoginRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Login endpoint for web app (alternative to OAuth2 token).
     """
-    user = authenticate_user(db, login_data.username, login_data.password)
+    user = await authenticate_user(db, login_data.username, login_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -281,10 +321,10 @@ async def login(
     
     # Update last login time
     setattr(user, "last_login", datetime.utcnow())
-    db.commit()
+    await db.commit()
     
     # Get role information
-    role = db.query(models.Role).filter(models.Role.id == user.role_id).first()
+    role = (await db.execute(select(models.Role).filter(models.Role.id == user.role_id))).scalars().first()
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schemas
+from database import get_async_db
+from endpoints.auth import BatchPrincipal, get_user_from_token
+
+router = APIRouter()
+
+# Configuration
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+# Upper bound on sub-requests running at once, so one batch cannot drain the DB pool
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "5"))
+
+READ_ONLY_METHODS = {"GET", "HEAD"}
+ALLOWED_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE"}
+API_PREFIX = "/api/v1/"
+# Sub-request headers not forwarded: those the batch sets itself, and
+# transport and hop-by-hop headers, which do not apply to an in-process
+# request. Without Accept-Encoding a sub-response is never compressed, so
+# its JSON body can be embedded in the batch response.
+DROPPED_SUB_REQUEST_HEADERS = {
+    "authorization", "content-length", "content-type",
+    "accept-encoding", "content-encoding", "transfer-encoding", "te", "trailer",
+    "connection", "keep-alive", "upgrade", "proxy-authorization", "proxy-connection",
+}
+
+# Authentication is optional for the batch itself; sub-requests enforce their own rules
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token", auto_error=False)
+
+
+def _validate_sub_request(index: int, sub_request: schemas.BatchSubRequest):
+    method = sub_request.method.upper()
+    if method not in ALLOWED_METHODS:
+        error_detail = {
+            "code": "INVALID_METHOD",
+            "message": f"Request {index}: method must be one of: {', '.join(sorted(ALLOWED_METHODS))}",
+            "field": f"requests[{index}].method"
+        }
+        raise HTTPException(status_code=400, detail=error_detail)
+
+    path = sub_request.path.split("?", 1)[0]
+    if not path.startswith(API_PREFIX) or path.rstrip("/").endswith("/batch"):
+        error_detail = {
+            "code": "INVALID_PATH",
+            "message": f"Request {index}: path must be an API path under {API_PREFIX} and cannot be /batch",
+            "field": f"requests[{index}].path"
+        }
+        raise HTTPException(status_code=400, detail=error_detail)
+
+
+def _build_scope(request: Request, sub_request: schemas.BatchSubRequest, body: bytes, principal) -> dict:
+    path, _, query_string = sub_request.path.partition("?")
+
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    authorization = request.headers.get("authorization")
+    if authorization:
+        headers.append((b"authorization", authorization.encode("latin-1")))
+    for name, value in (sub_request.headers or {}).items():
+        if name.lower() not in DROPPED_SUB_REQUEST_HEADERS:
+            headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+
+    return {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": sub_request.method.upper(),
+        "scheme": request.scope.get("scheme", "http"),
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": request.scope.get("root_path", ""),
+        "query_string": query_string.encode(),
+        "headers": headers,
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+        "batch_principal": principal,
+    }
+
+
+async def _dispatch(request: Request, sub_request: schemas.BatchSubRequest, principal) -> dict:
+    """Run a single sub-request through the application in-process."""
+    body = json.dumps(sub_request.body, default=str).encode() if sub_request.body is not None else b""
+    scope = _build_scope(request, sub_request, body, principal)
+
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    response = {"status": 500, "headers": {}, "chunks": []}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                name.decode("latin-1"): value.decode("latin-1")
+                for name, value in message.get("headers", [])
+                if name.lower() not in (b"content-length",)
+            }
+        elif message["type"] == "http.response.body":
+            response["chunks"].append(message.get("body", b""))
+
+    await request.app(scope, receive, send)
+
+    raw_body = b"".join(response["chunks"])
+    content_type = response["headers"].get("content-type", "")
+    if not raw_body:
+        parsed_body = None
+    elif content_type.startswith("application/json"):
+        parsed_body = json.loads(raw_body)
+    else:
+        parsed_body = raw_body.decode("utf-8", errors="replace")
+
+    return {"status": response["status"], "headers": response["headers"], "body": parsed_body}
+
+
+@router.post("/batch", response_model=schemas.BatchResponse)
+async def run_batch(
+    batch: schemas.BatchRequest,
+    request: Request,
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Run several API requests in one round trip.
+
+    The caller is authenticated once and sub-requests run as that user, each
+    loading it in its own session. Consecutive read-only sub-requests run
+    concurrently; a write waits for everything before it and blocks
+    everything after it, so writes keep their order. Responses are returned
+    in request order.
+    """
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        error_detail = {
+            "code": "TOO_MANY_REQUESTS",
+            "message": f"A batch may contain at most {BATCH_MAX_REQUESTS} requests",
+            "field": "requests"
+        }
+        raise HTTPException(status_code=400, detail=error_detail)
+
+    for index, sub_request in enumerate(batch.requests):
+        _validate_sub_request(index, sub_request)
+
+    principal = None
+    if token:
+        user = await get_user_from_token(token, db)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        if not user.is_active:
+            raise HTTPException(status_code=400, detail="Inactive user")
+        principal = BatchPrincipal(user.id, user.username)
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def run_one(sub_request):
+        async with semaphore:
+            return await _dispatch(request, sub_request, principal)
+
+    responses: List[dict] = []
+    pending_reads = []
+    for sub_request in batch.requests:
+        if sub_request.method.upper() in READ_ONLY_METHODS:
+            pending_reads.append(sub_request)
+            continue
+        if pending_reads:
+            responses.extend(await asyncio.gather(*(run_one(read) for read in pending_reads)))
+            pending_reads = []
+        responses.append(await _dispatch(request, sub_request, principal))
+
+    if pending_reads:
+        responses.extend(await asyncio.gather(*(run_one(read) for read in pending_reads)))
+
+    return {"responses": responses}
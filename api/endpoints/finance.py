@@ -10,7 +10,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
-from database import get_db
+from executors import run_in_executor
+from idempotency import idempotent
+from archive import with_archive
+from sharding import get_shard_db
 
 router = APIRouter()
 
@@ -24,45 +27,49 @@ def get_finances(
     transaction_type: Optional[str] = None,
     due_date_start: Optional[date] = None,
     due_date_end: Optional[date] = None,
-    db: Session = Depends(get_db)
+    include_archived: bool = False,
+    db: Session = Depends(get_shard_db)
 ):
     """
     Get all financial transactions with optional filters.
     """
-    query = db.query(models.ResidentFinance)
+    finance_model = with_archive(models.ResidentFinance, include_archived)
+    query = db.query(finance_model)
     
     if resident_id:
-        query = query.filter(models.ResidentFinance.resident_id == resident_id)
+        query = query.filter(finance_model.resident_id == resident_id)
     
     if payment_status:
-        query = query.filter(models.ResidentFinance.payment_status == payment_status)
+        query = query.filter(finance_model.payment_status == payment_status)
     
     if transaction_type:
-        query = query.filter(models.ResidentFinance.transaction_type == transaction_type)
+        query = query.filter(finance_model.transaction_type == transaction_type)
     
     if due_date_start:
-        query = query.filter(models.ResidentFinance.due_date >= due_date_start)
+        query = query.filter(finance_model.due_date >= due_date_start)
     
     if due_date_end:
-        query = query.filter(models.ResidentFinance.due_date <= due_date_end)
+        query = query.filter(finance_model.due_date <= due_date_end)
     
     finances = query.offset(skip).limit(limit).all()
     return finances
 
 
 @router.get("/finances/{finance_id}", response_model=schemas.ResidentFinance)
-def get_finance(finance_id: UUID, db: Session = Depends(get_db)):
+def get_finance(finance_id: UUID, include_archived: bool = False, db: Session = Depends(get_shard_db)):
     """
     Get a specific financial transaction by ID.
     """
-    finance = db.query(models.ResidentFinance).filter(models.ResidentFinance.id == finance_id).first()
+    finance_model = with_archive(models.ResidentFinance, include_archived)
+    finance = db.query(finance_model).filter(finance_model.id == finance_id).first()
     if finance is None:
         raise HTTPException(status_code=404, detail="Finance transaction not found")
     return finance
 
 
 @router.post("/finances/", response_model=schemas.ResidentFinance, status_code=201)
-def create_finance(finance: schemas.ResidentFinanceCreate, db: Session = Depends(get_db)):
+@idempotent
+def create_finance(finance: schemas.ResidentFinanceCreate, db: Session = Depends(get_shard_db)):
     """
     Create a new financial transaction.
     """
@@ -82,7 +89,7 @@ def create_finance(finance: schemas.ResidentFinanceCreate, db: Session = Depends
 def update_finance(
     finance_id: UUID, 
     finance_update: schemas.ResidentFinanceUpdate, 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
     Update a financial transaction.
@@ -101,7 +108,7 @@ def update_finance(
 
 
 @router.delete("/finances/{finance_id}", status_code=204)
-def delete_finance(finance_id: UUID, db: Session = Depends(get_db)):
+def delete_finance(finance_id: UUID, db: Session = Depends(get_shard_db)):
     """
     Delete a financial transaction.
     """
@@ -122,33 +129,40 @@ def get_resident_finances(
     skip: int = 0,
     limit: int = 100,
     payment_status: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include_archived: bool = False,
+    db: Session = Depends(get_shard_db)
 ):
     """
     Get all financial transactions for a specific resident.
     """
+    finance_model = with_archive(models.ResidentFinance, include_archived)
+
     # First check if resident exists
     resident = db.query(models.Resident).filter(models.Resident.id == resident_id).first()
     if not resident:
         raise HTTPException(status_code=404, detail="Resident not found")
     
-    query = db.query(models.ResidentFinance).filter(models.ResidentFinance.resident_id == resident_id)
+    query = db.query(finance_model).filter(finance_model.resident_id == resident_id)
     
     if payment_status:
-        query = query.filter(models.ResidentFinance.payment_status == payment_status)
+        query = query.filter(finance_model.payment_status == payment_status)
     
     finances = query.offset(skip).limit(limit).all()
     return finances
 
 
 @router.get("/societies/{society_id}/finances/summary")
+@run_in_executor("reports")
 def get_society_finance_summary(
     society_id: UUID,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
-    Get financial summary for a society.
+    Get financial summary for a society. Archived records count towards the
+    totals.
     """
+    finance_model = with_archive(models.ResidentFinance, True)
+
     # First check if society exists
     society = db.query(models.Society).filter(models.Society.id == society_id).first()
     if not society:
@@ -167,14 +181,14 @@ def get_society_finance_summary(
     
     # Get summary information
     # For demonstration, we'll compute some basic stats
-    total_due_query = db.query(models.ResidentFinance).filter(
-        models.ResidentFinance.resident_id.in_(resident_ids),
-        models.ResidentFinance.payment_status == "pending"
+    total_due_query = db.query(finance_model).filter(
+        finance_model.resident_id.in_(resident_ids),
+        finance_model.payment_status == "pending"
     )
     
-    total_paid_query = db.query(models.ResidentFinance).filter(
-        models.ResidentFinance.resident_id.in_(resident_ids),
-        models.ResidentFinance.payment_status == "paid"
+    total_paid_query = db.query(finance_model).filter(
+        finance_model.resident_id.in_(resident_ids),
+        finance_model.payment_status == "paid"
     )
     
     # Use Decimal for precise financial calculations and handle None values
@@ -0,0 +1,158 @@
+import time
+import asyncio
+from typing import Optional
+
+import anyio.to_thread
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import engine, async_engine, POOL_SIZE, MAX_OVERFLOW
+from compression import CompressionMiddleware
+from admission import AdmissionControlMiddleware
+from ratelimit import RateLimitMiddleware
+from executors import executor_stats
+from events import broadcaster
+from outbox import outbox_tail
+from warmup import warmup_state
+
+router = APIRouter()
+
+# Configuration
+# Probe results are reused for this long, so frequent probes add no DB load
+READINESS_CACHE_SECONDS = float(os.getenv("READINESS_CACHE_SECONDS", "2"))
+READINESS_DB_TIMEOUT_SECONDS = float(os.getenv("READINESS_DB_TIMEOUT_SECONDS", "1"))
+READINESS_MAX_DB_LATENCY_MS = float(os.getenv("READINESS_MAX_DB_LATENCY_MS", "500"))
+READINESS_MAX_POOL_SATURATION = float(os.getenv("READINESS_MAX_POOL_SATURATION", "0.9"))
+READINESS_MAX_THREAD_SATURATION = float(os.getenv("READINESS_MAX_THREAD_SATURATION", "0.9"))
+
+STARTED_AT = time.time()
+
+
+def _pool_stats(pool) -> dict:
+    capacity = POOL_SIZE + MAX_OVERFLOW
+    checked_out = pool.checkedout()
+    saturation = round(checked_out / capacity, 3) if capacity else 0.0
+    return {
+        "checked_out": checked_out,
+        "idle": pool.checkedin(),
+        "capacity": capacity,
+        "saturation": saturation,
+        "ok": saturation < READINESS_MAX_POOL_SATURATION,
+    }
+
+
+def _thread_pool_stats() -> dict:
+    # Sync endpoints run in anyio's default thread pool
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    saturation = round(limiter.borrowed_tokens / limiter.total_tokens, 3) if limiter.total_tokens else 0.0
+    return {
+        "busy": limiter.borrowed_tokens,
+        "capacity": limiter.total_tokens,
+        "saturation": saturation,
+        "ok": saturation < READINESS_MAX_THREAD_SATURATION,
+    }
+
+
+async def _database_probe() -> dict:
+    async def select_one():
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(select_one(), READINESS_DB_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return {"ok": False, "latency_ms": None, "error": f"SELECT 1 timed out after {READINESS_DB_TIMEOUT_SECONDS}s"}
+    except Exception as e:
+        return {"ok": False, "latency_ms": None, "error": f"{type(e).__name__}: {e}"}
+    latency_ms = round((time.perf_counter() - start) * 1000, 2)
+    return {"ok": latency_ms <= READINESS_MAX_DB_LATENCY_MS, "latency_ms": latency_ms, "error": None}
+
+
+def _find_middleware(app, middleware_class):
+    """Walk the middleware chain built by Starlette to find an instance of middleware_class."""
+    node = getattr(app, "middleware_stack", None)
+    while node is not None:
+        if isinstance(node, middleware_class):
+            return node
+        node = getattr(node, "app", None)
+    return None
+
+
+def _cache_stats(app) -> dict:
+    caches = {}
+    compression = _find_middleware(app, CompressionMiddleware)
+    if compression is not None and compression.cache is not None:
+        caches["compression"] = compression.cache.stats()
+    return caches
+
+
+class ReadinessProbe:
+    """Runs the readiness checks at most once per READINESS_CACHE_SECONDS."""
+
+    def __init__(self, cache_seconds: float = READINESS_CACHE_SECONDS):
+        self.cache_seconds = cache_seconds
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def check(self, app) -> dict:
+        if self._result is not None and time.monotonic() - self._checked_at < self.cache_seconds:
+            return self._result
+        async with self._lock:
+            # Concurrent probes wait for the one already running instead of probing again
+            if self._result is None or time.monotonic() - self._checked_at >= self.cache_seconds:
+                self._result = await self._run(app)
+                self._checked_at = time.monotonic()
+        return self._result
+
+    async def _run(self, app) -> dict:
+        checks = {"warmup": warmup_state.as_dict()}
+        if warmup_state.ready:
+            checks["database"] = await _database_probe()
+            checks["pools"] = {"sync": _pool_stats(engine.pool), "async": _pool_stats(async_engine.pool)}
+            checks["threads"] = _thread_pool_stats()
+            checks["executors"] = executor_stats()
+            checks["events"] = broadcaster.stats()
+            checks["outbox"] = outbox_tail.stats()
+            checks["caches"] = _cache_stats(app)
+            admission = _find_middleware(app, AdmissionControlMiddleware)
+            if admission is not None:
+                checks["admission"] = admission.stats()
+            rate_limit = _find_middleware(app, RateLimitMiddleware)
+            if rate_limit is not None:
+                checks["rate_limit"] = rate_limit.stats()
+        ready = (
+            warmup_state.ready
+            and checks["database"]["ok"]
+            and all(pool["ok"] for pool in checks["pools"].values())
+            and checks["threads"]["ok"]
+        )
+        return {"status": "ready" if ready else "not_ready", "checked_at": time.time(), "checks": checks}
+
+
+readiness_probe = ReadinessProbe()
+
+
+@router.get("/healthz")
+async def liveness():
+    """
+    Liveness probe. Never touches the database; answering at all shows the
+    process and its event loop are responsive.
+    """
+    return {"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - STARTED_AT, 1)}
+
+
+@router.get("/readyz")
+async def readiness(request: Request):
+    """
+    Readiness probe. Returns 503 until this worker has finished warming up,
+    and afterwards whenever SELECT 1 is slow or failing or the connection or
+    thread pools are saturated, so the load balancer routes around it.
+    """
+    result = await readiness_probe.check(request.app)
+    return JSONResponse(status_code=200 if result["status"] == "ready" else 503, content=result)
@@ -0,0 +1,117 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from uuid import UUID
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+import schemas
+import jobs
+from database import get_db
+from idempotency import idempotent
+
+router = APIRouter()
+
+
+def _get_job_or_404(db: Session, job_id: UUID) -> models.Job:
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail={
+            "code": "NOT_FOUND",
+            "message": f"Job with ID {job_id} not found"
+        })
+    return job
+
+
+# Job Endpoints
+@router.post("/jobs/", response_model=schemas.Job, status_code=202)
+@idempotent
+def create_job(job: schemas.JobCreate, db: Session = Depends(get_db)):
+    """
+    Enqueue a background job. Returns at once with the queued job; poll
+    GET /jobs/{job_id} for its status, progress and result. Send an
+    Idempotency-Key header so a retried request does not queue the job twice.
+    """
+    if job.society_id is not None:
+        society = db.query(models.Society).filter(models.Society.id == job.society_id).first()
+        if not society:
+            raise HTTPException(status_code=404, detail="Society not found")
+    try:
+        db_job = jobs.enqueue(
+            db,
+            job.kind,
+            job.payload,
+            society_id=job.society_id,
+            run_at=job.run_at,
+            max_attempts=job.max_attempts or jobs.JOB_MAX_ATTEMPTS,
+        )
+    except jobs.UnknownJobKind as e:
+        raise HTTPException(status_code=400, detail={
+            "code": "INVALID_JOB_KIND",
+            "message": str(e),
+            "field": "kind"
+        })
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+@router.get("/jobs/", response_model=List[schemas.Job])
+def get_jobs(
+    skip: int = 0,
+    limit: int = Query(100, le=500),
+    kind: Optional[str] = None,
+    status: Optional[str] = None,
+    society_id: Optional[UUID] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get jobs, newest first, with optional filtering.
+    """
+    query = db.query(models.Job)
+    if kind:
+        query = query.filter(models.Job.kind == kind)
+    if status:
+        query = query.filter(models.Job.status == status)
+    if society_id:
+        query = query.filter(models.Job.society_id == society_id)
+    return query.order_by(models.Job.created_at.desc(), models.Job.id).offset(skip).limit(limit).all()
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.Job)
+def get_job(job_id: UUID, db: Session = Depends(get_db)):
+    """
+    Get a job's status, progress and result.
+    """
+    return _get_job_or_404(db, job_id)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=schemas.Job)
+def cancel_job(job_id: UUID, db: Session = Depends(get_db)):
+    """
+    Cancel a job. A queued job is cancelled at once; a running job stops at
+    its next progress report, keeping the chunks it has already committed.
+    """
+    job = _get_job_or_404(db, job_id)
+    if job.status in jobs.FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail={
+            "code": "JOB_FINISHED",
+            "message": f"Job is already {job.status}"
+        })
+    return jobs.cancel(db, job)
+
+
+@router.post("/jobs/{job_id}/retry", response_model=schemas.Job)
+def retry_job(job_id: UUID, db: Session = Depends(get_db)):
+    """
+    Queue a failed or cancelled job again.
+    """
+    job = _get_job_or_404(db, job_id)
+    if job.status not in (jobs.FAILED, jobs.CANCELLED):
+        raise HTTPException(status_code=409, detail={
+            "code": "JOB_NOT_RETRYABLE",
+            "message": f"Only failed or cancelled jobs can be retried; job is {job.status}"
+        })
+    return jobs.retry(db, job)
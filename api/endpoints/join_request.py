@@ -0,0 +1,151 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from uuid import UUID
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+import schemas
+import join_requests
+from database import get_db
+from sharding import DEFAULT_SHARD, get_shard_db
+
+router = APIRouter()
+
+
+def _require_society(db: Session, society_id: UUID):
+    if db.query(models.Society.id).filter(models.Society.id == society_id).first() is None:
+        raise HTTPException(status_code=404, detail="Society not found")
+
+
+# Join Request Endpoints
+@router.post("/join-requests/", response_model=schemas.SocietyJoinRequest, status_code=201)
+def create_join_request(join_request: schemas.SocietyJoinRequestCreate, db: Session = Depends(get_db)):
+    """
+    Ask to join a society, or invite a user to one.
+    """
+    user = db.query(models.User).filter(models.User.id == join_request.user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    _require_society(db, join_request.society_id)
+
+    pending_error = HTTPException(status_code=409, detail={
+        "code": "JOIN_REQUEST_PENDING",
+        "message": "User already has a pending request for this society",
+        "field": "society_id"
+    })
+    existing = db.query(models.SocietyJoinRequest.id).filter(
+        models.SocietyJoinRequest.user_id == join_request.user_id,
+        models.SocietyJoinRequest.society_id == join_request.society_id,
+        models.SocietyJoinRequest.status == join_requests.PENDING
+    ).first()
+    if existing:
+        raise pending_error
+
+    db_join_request = models.SocietyJoinRequest(**join_request.dict())
+    try:
+        db.add(db_join_request)
+        db.commit()
+    except IntegrityError:
+        # A concurrent request won the race for the one pending slot
+        db.rollback()
+        raise pending_error
+    db.refresh(db_join_request)
+    return db_join_request
+
+
+@router.get("/join-requests/{join_request_id}", response_model=schemas.SocietyJoinRequest)
+def get_join_request(join_request_id: UUID, db: Session = Depends(get_db)):
+    """
+    Get a join request by ID.
+    """
+    join_request = db.query(models.SocietyJoinRequest).filter(models.SocietyJoinRequest.id == join_request_id).first()
+    if join_request is None:
+        raise HTTPException(status_code=404, detail={
+            "code": "NOT_FOUND",
+            "message": f"Join request with ID {join_request_id} not found"
+        })
+    return join_request
+
+
+@router.get("/societies/{society_id}/join-requests/pending", response_model=schemas.PendingJoinRequestPage)
+def get_pending_join_requests(
+    society_id: UUID,
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=join_requests.MAX_PENDING_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """
+    Get a society's pending join requests, oldest first, with the requesting
+    user's details. Follow next_cursor for further pages.
+    """
+    try:
+        rows, next_cursor = join_requests.pending_page(db, society_id, after, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={
+            "code": "INVALID_CURSOR",
+            "message": "after must be a next_cursor returned by this endpoint",
+            "field": "after"
+        })
+    items = [
+        schemas.PendingJoinRequest(
+            **schemas.SocietyJoinRequest.model_validate(join_request).model_dump(),
+            username=username,
+            email=email,
+            user_full_name=full_name,
+        )
+        for join_request, username, email, full_name in rows
+    ]
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _review(
+    db: Session,
+    society_id: UUID,
+    review: schemas.JoinRequestReview,
+    approve: bool,
+    residents_db: Optional[Session] = None
+) -> dict:
+    _require_society(db, society_id)
+    if review.reviewed_by is not None:
+        if db.query(models.User.id).filter(models.User.id == review.reviewed_by).first() is None:
+            raise HTTPException(status_code=404, detail={
+                "code": "NOT_FOUND",
+                "message": f"User with ID {review.reviewed_by} not found",
+                "field": "reviewed_by"
+            })
+    reviewed, skipped = join_requests.review(
+        db, society_id, review.request_ids, approve,
+        reviewed_by=review.reviewed_by, review_message=review.review_message, residents_db=residents_db
+    )
+    return {"reviewed": reviewed, "skipped": skipped}
+
+
+@router.post("/societies/{society_id}/join-requests/approve", response_model=schemas.JoinRequestReviewResult)
+def approve_join_requests(
+    society_id: UUID,
+    review: schemas.JoinRequestReview,
+    db: Session = Depends(get_db),
+    residents_db: Session = Depends(get_shard_db)
+):
+    """
+    Approve pending join requests in one transaction. Each approval creates
+    the resident for the requested unit and links the user to it; requests
+    that cannot be approved are listed in `skipped`.
+    """
+    # Residents of a society on another shard are created there
+    if residents_db.info["shard"] == DEFAULT_SHARD:
+        residents_db = None
+    return _review(db, society_id, review, approve=True, residents_db=residents_db)
+
+
+@router.post("/societies/{society_id}/join-requests/reject", response_model=schemas.JoinRequestReviewResult)
+def reject_join_requests(society_id: UUID, review: schemas.JoinRequestReview, db: Session = Depends(get_db)):
+    """
+    Reject pending join requests in one transaction; requests that are no
+    longer pending are listed in `skipped`.
+    """
+    return _review(db, society_id, review, approve=False)
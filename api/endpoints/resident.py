@@ -1,5 +1,7 @@
+import json
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
 from uuid import UUID
 
@@ -9,6 +11,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from database import get_db
+from executors import run_in_executor
+from includes import apply_includes, RESIDENT_INCLUDES
+from tenancy import SocietyScope, get_society_scope
+from sharding import fan_out, get_shard_db, nulls_last, read_page, require_same_shard, shards_of, update_users
+from purge import delete_dependents
+from resident_import import import_residents, iter_upload_rows, ImportFormatError
 
 router = APIRouter()
 
@@ -20,39 +28,46 @@ def get_residents(
     society_id: Optional[UUID] = None,
     name: Optional[str] = None,
     unit_number: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include: Optional[str] = Query("society", description="Relations to embed: society (pass an empty value to omit)"),
+    scope: SocietyScope = Depends(get_society_scope),
+    db: Session = Depends(get_shard_db)
 ):
     """
-    Get all residents with optional filters.
+    Get all residents with optional filters, limited to the caller's societies.
     """
-    query = db.query(models.Resident)
-    
-    if society_id:
-        query = query.filter(models.Resident.society_id == society_id)
-    
-    if name:
-        query = query.filter(
-            (models.Resident.first_name.ilike(f"%{name}%")) | 
-            (models.Resident.last_name.ilike(f"%{name}%"))
+    def build_query(session: Session):
+        query = apply_includes(session.query(models.Resident), models.Resident, RESIDENT_INCLUDES, include)
+        query = scope.filter(query, models.Resident.society_id)
+        
+        if society_id:
+            query = query.filter(models.Resident.society_id == society_id)
+        
+        if name:
+            query = query.filter(
+                (models.Resident.first_name.ilike(f"%{name}%")) | 
+                (models.Resident.last_name.ilike(f"%{name}%"))
+            )
+        
+        if unit_number:
+            query = query.filter(models.Resident.unit_number == unit_number)
+        
+        # Order by unit_number alphabetically, then by last_name, then by first_name
+        # Handle cases where unit_number might be None by putting them at the end
+        return query.order_by(
+            models.Resident.unit_number.asc().nulls_last(),
+            models.Resident.last_name.asc(),
+            models.Resident.first_name.asc()
         )
     
-    if unit_number:
-        query = query.filter(models.Resident.unit_number == unit_number)
-    
-    # Order by unit_number alphabetically, then by last_name, then by first_name
-    # Handle cases where unit_number might be None by putting them at the end
-    query = query.order_by(
-        models.Resident.unit_number.asc().nulls_last(),
-        models.Resident.last_name.asc(),
-        models.Resident.first_name.asc()
+    societies = [society_id] if society_id else scope.society_ids
+    return read_page(
+        db, societies, build_query, skip, limit,
+        key=lambda resident: (nulls_last(resident.unit_number), resident.last_name, resident.first_name)
     )
-    
-    residents = query.offset(skip).limit(limit).all()
-    return residents
 
 
 @router.get("/residents/{resident_id}", response_model=schemas.Resident)
-def get_resident(resident_id: UUID, db: Session = Depends(get_db)):
+def get_resident(resident_id: UUID, db: Session = Depends(get_shard_db)):
     """
     Get a specific resident by ID with society information.
     """
@@ -75,7 +90,11 @@ def get_resident_by_user_id(user_id: UUID, db: Session = Depends(get_db)):
     if user.resident_id is None:
         raise HTTPException(status_code=404, detail="User is not associated with a resident")
     
-    resident = db.query(models.Resident).options(joinedload(models.Resident.society)).filter(models.Resident.id == user.resident_id).first()
+    # The resident may live on any shard; look on all of them at once
+    found = fan_out(shards_of(None), lambda session: session.query(models.Resident).options(
+        joinedload(models.Resident.society)
+    ).filter(models.Resident.id == user.resident_id).first())
+    resident = next((resident for resident in found.values() if resident is not None), None)
     if resident is None:
         raise HTTPException(status_code=404, detail="Resident not found")
     
@@ -83,7 +102,7 @@ def get_resident_by_user_id(user_id: UUID, db: Session = Depends(get_db)):
 
 
 @router.post("/residents/", response_model=schemas.Resident, status_code=201)
-def create_resident(resident: schemas.ResidentCreate, db: Session = Depends(get_db)):
+def create_resident(resident: schemas.ResidentCreate, db: Session = Depends(get_shard_db)):
     """
     Create a new resident.
     """
@@ -110,11 +129,51 @@ def create_resident(resident: schemas.ResidentCreate, db: Session = Depends(get_
     return db_resident
 
 
+@router.post("/societies/{society_id}/residents/import", response_model=schemas.ResidentImportReport)
+@run_in_executor("bulk")
+def import_society_residents(
+    society_id: UUID,
+    file: UploadFile = File(..., description="CSV or XLSX file with a header row"),
+    stream_progress: bool = Query(False, description="Stream one JSON progress report per line as chunks are loaded"),
+    db: Session = Depends(get_shard_db)
+):
+    """
+    Bulk import residents into a society from a CSV or XLSX file.
+
+    Required columns are first_name, last_name and unit_number. Rows are
+    validated and inserted in chunks; residents already present in the same
+    unit with the same name are skipped.
+    """
+    society = db.query(models.Society).filter(models.Society.id == society_id).first()
+    if not society:
+        raise HTTPException(status_code=404, detail="Society not found")
+
+    try:
+        rows = iter_upload_rows(file.filename or "", file.file)
+        reports = import_residents(db, society_id, rows)
+        first_report = next(reports)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if stream_progress:
+        def progress_lines():
+            yield json.dumps(first_report) + "\n"
+            for report in reports:
+                yield json.dumps(report) + "\n"
+
+        return StreamingResponse(progress_lines(), media_type="application/x-ndjson")
+
+    report = first_report
+    for report in reports:
+        pass
+    return report
+
+
 @router.put("/residents/{resident_id}", response_model=schemas.Resident)
 def update_resident(
     resident_id: UUID, 
     resident_update: schemas.ResidentUpdate, 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
     Update a resident.
@@ -125,6 +184,7 @@ def update_resident(
     
     # Check if society exists if society_id is being updated
     if resident_update.society_id:
+        require_same_shard(db, resident_update.society_id)
         society = db.query(models.Society).filter(models.Society.id == resident_update.society_id).first()
         if not society:
             raise HTTPException(status_code=404, detail="Society not found")
@@ -142,6 +202,9 @@ def update_resident(
             print(f"Warning: Unit {resident_update.unit_number} already has residents in society {society_id}")
     
     update_data = resident_update.dict(exclude_unset=True)
+    if update_data.get("society_id") not in (None, db_resident.society_id):
+        # The linked user's membership moves with the resident
+        update_users(db, models.User.resident_id == resident_id, resident_society_id=update_data["society_id"])
     for key, value in update_data.items():
         setattr(db_resident, key, value)
     
@@ -151,14 +214,16 @@ def update_resident(
 
 
 @router.delete("/residents/{resident_id}", status_code=204)
-def delete_resident(resident_id: UUID, db: Session = Depends(get_db)):
+def delete_resident(resident_id: UUID, db: Session = Depends(get_shard_db)):
     """
-    Delete a resident.
+    Delete a resident. Their finances are deleted with them and recorded in
+    the change outbox.
     """
     db_resident = db.query(models.Resident).filter(models.Resident.id == resident_id).first()
     if db_resident is None:
         raise HTTPException(status_code=404, detail="Resident not found")
     
+    delete_dependents(db, db_resident.society_id, resident_id=resident_id)
     db.delete(db_resident)
     db.commit()
     return None
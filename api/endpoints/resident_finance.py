@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File
 from sqlalchemy.orm import Session
 from uuid import UUID
 from sqlalchemy.exc import IntegrityError
@@ -10,13 +10,19 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
-from database import get_db
+from executors import run_in_executor
+from includes import apply_includes, RESIDENT_FINANCE_INCLUDES
+from idempotency import idempotent
+from tenancy import SocietyScope, get_society_scope
+from archive import with_archive
+from sharding import get_shard_db, read_page
+from reconciliation import load_open_dues, iter_statement_rows, match_statement, mark_paid, StatementFormatError
 # from rbac_utils import has_permission  # Import currently not used
 
 router = APIRouter()
 
 
-@router.get("/resident_finances/", response_model=List[schemas.ResidentFinance])
+@router.get("/resident_finances/", response_model=List[schemas.ResidentFinanceWithRelations])
 def get_all_resident_finances(
     skip: int = 0, 
     limit: int = 100,
@@ -26,41 +32,53 @@ def get_all_resident_finances(
     end_date: Optional[date] = None,
     payment_status: Optional[str] = None,
     is_active: Optional[bool] = True,
-    db: Session = Depends(get_db)
+    include: Optional[str] = Query(None, description="Relations to embed: resident, resident.society"),
+    scope: SocietyScope = Depends(get_society_scope),
+    include_archived: bool = False,
+    db: Session = Depends(get_shard_db)
 ):
     """
-    Get all resident finances with optional filters.
+    Get all resident finances with optional filters, limited to the caller's societies.
     """
-    query = db.query(models.ResidentFinance)
+    finance_model = with_archive(models.ResidentFinance, include_archived)
+
+    def build_query(session: Session):
+        query = apply_includes(session.query(finance_model), finance_model, RESIDENT_FINANCE_INCLUDES, include)
+        query = scope.filter_residents(query, finance_model.resident_id)
     
-    if resident_id:
-        query = query.filter(models.ResidentFinance.resident_id == resident_id)
+        if resident_id:
+            query = query.filter(finance_model.resident_id == resident_id)
     
-    if transaction_type:
-        query = query.filter(models.ResidentFinance.transaction_type == transaction_type)
+        if transaction_type:
+            query = query.filter(finance_model.transaction_type == transaction_type)
     
-    if start_date:
-        query = query.filter(models.ResidentFinance.due_date >= start_date)
+        if start_date:
+            query = query.filter(finance_model.due_date >= start_date)
     
-    if end_date:
-        query = query.filter(models.ResidentFinance.due_date <= end_date)
+        if end_date:
+            query = query.filter(finance_model.due_date <= end_date)
     
-    if payment_status:
-        query = query.filter(models.ResidentFinance.payment_status == payment_status)
+        if payment_status:
+            query = query.filter(finance_model.payment_status == payment_status)
     
-    if is_active is not None:
-        query = query.filter(models.ResidentFinance.is_active == is_active)
+        if is_active is not None:
+            query = query.filter(finance_model.is_active == is_active)
     
-    finances = query.order_by(models.ResidentFinance.created_at.desc()).offset(skip).limit(limit).all()
-    return finances
+        return query.order_by(finance_model.created_at.desc())
+    
+    return read_page(
+        db, scope.society_ids, build_query, skip, limit,
+        key=lambda finance: finance.created_at, reverse=True
+    )
 
 
 @router.get("/resident_finances/{finance_id}", response_model=schemas.ResidentFinance)
-def get_resident_finance(finance_id: UUID, db: Session = Depends(get_db)):
+def get_resident_finance(finance_id: UUID, include_archived: bool = False, db: Session = Depends(get_shard_db)):
     """
     Get a specific resident finance record by ID.
     """
-    finance = db.query(models.ResidentFinance).filter(models.ResidentFinance.id == finance_id).first()
+    finance_model = with_archive(models.ResidentFinance, include_archived)
+    finance = db.query(finance_model).filter(finance_model.id == finance_id).first()
     if finance is None:
         error_detail = {
             "code": "NOT_FOUND",
@@ -70,7 +88,7 @@ def get_resident_finance(finance_id: UUID, db: Session = Depends(get_db)):
     return finance
 
 
-@router.get("/residents/{resident_id}/finances", response_model=List[schemas.ResidentFinance])
+@router.get("/residents/{resident_id}/finances", response_model=List[schemas.ResidentFinanceWithRelations])
 def get_resident_finances(
     resident_id: UUID,
     skip: int = 0, 
@@ -80,11 +98,15 @@ def get_resident_finances(
     end_date: Optional[date] = None,
     payment_status: Optional[str] = None,
     is_active: Optional[bool] = True,
-    db: Session = Depends(get_db)
+    include: Optional[str] = Query(None, description="Relations to embed: resident, resident.society"),
+    include_archived: bool = False,
+    db: Session = Depends(get_shard_db)
 ):
     """
     Get all finances for a specific resident.
     """
+    finance_model = with_archive(models.ResidentFinance, include_archived)
+
     # Check if resident exists
     resident = db.query(models.Resident).filter(models.Resident.id == resident_id).first()
     if not resident:
@@ -94,29 +116,31 @@ def get_resident_finances(
         }
         raise HTTPException(status_code=404, detail=error_detail)
     
-    query = db.query(models.ResidentFinance).filter(models.ResidentFinance.resident_id == resident_id)
+    query = apply_includes(db.query(finance_model), finance_model, RESIDENT_FINANCE_INCLUDES, include)
+    query = query.filter(finance_model.resident_id == resident_id)
     
     if transaction_type:
-        query = query.filter(models.ResidentFinance.transaction_type == transaction_type)
+        query = query.filter(finance_model.transaction_type == transaction_type)
     
     if start_date:
-        query = query.filter(models.ResidentFinance.due_date >= start_date)
+        query = query.filter(finance_model.due_date >= start_date)
     
     if end_date:
-        query = query.filter(models.ResidentFinance.due_date <= end_date)
+        query = query.filter(finance_model.due_date <= end_date)
     
     if payment_status:
-        query = query.filter(models.ResidentFinance.payment_status == payment_status)
+        query = query.filter(finance_model.payment_status == payment_status)
     
     if is_active is not None:
-        query = query.filter(models.ResidentFinance.is_active == is_active)
+        query = query.filter(finance_model.is_active == is_active)
     
-    finances = query.order_by(models.ResidentFinance.created_at.desc()).offset(skip).limit(limit).all()
+    finances = query.order_by(finance_model.created_at.desc()).offset(skip).limit(limit).all()
     return finances
 
 
 @router.post("/resident_finances/", response_model=schemas.ResidentFinance, status_code=201)
-def create_resident_finance(finance: schemas.ResidentFinanceCreate, db: Session = Depends(get_db)):
+@idempotent
+def create_resident_finance(finance: schemas.ResidentFinanceCreate, db: Session = Depends(get_shard_db)):
     """
     Create a new resident finance record.
     """
@@ -172,7 +196,7 @@ def create_resident_finance(finance: schemas.ResidentFinanceCreate, db: Session
 def update_resident_finance(
     finance_id: UUID,
     finance_update: schemas.ResidentFinanceUpdate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
     Update a resident finance record.
@@ -211,6 +235,9 @@ def update_resident_finance(
     update_data = finance_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_finance, key, value)
+    if "due_date" in update_data:
+        # A due date given by a user is no longer an estimate
+        db_finance.due_date_estimated = False
     
     try:
         db.commit()
@@ -227,7 +254,7 @@ def update_resident_finance(
 
 
 @router.delete("/resident_finances/{finance_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_resident_finance(finance_id: UUID, db: Session = Depends(get_db)):
+def delete_resident_finance(finance_id: UUID, db: Session = Depends(get_shard_db)):
     """
     Soft delete a resident finance record.
     """
@@ -245,16 +272,66 @@ def delete_resident_finance(finance_id: UUID, db: Session = Depends(get_db)):
     return None
 
 
+@router.post("/societies/{society_id}/resident_finances/reconcile", response_model=schemas.ReconciliationReport)
+@run_in_executor("bulk")
+def reconcile_bank_statement(
+    society_id: UUID,
+    file: UploadFile = File(..., description="CSV bank statement with a header row"),
+    dry_run: bool = Query(False, description="Report matches without marking dues as paid"),
+    db: Session = Depends(get_shard_db)
+):
+    """
+    Match bank statement credits to open resident dues of a society and mark
+    the matched dues as paid.
+    """
+    # Check if society exists
+    society = db.query(models.Society).filter(models.Society.id == society_id).first()
+    if not society:
+        error_detail = {
+            "code": "NOT_FOUND",
+            "message": f"Society with ID {society_id} not found"
+        }
+        raise HTTPException(status_code=404, detail=error_detail)
+
+    index = load_open_dues(db, society_id)
+
+    try:
+        matched, unmatched = match_statement(index, iter_statement_rows(file.file))
+    except StatementFormatError as e:
+        error_detail = {
+            "code": "INVALID_STATEMENT",
+            "message": str(e),
+            "field": "file"
+        }
+        raise HTTPException(status_code=400, detail=error_detail)
+
+    updated = 0 if dry_run else mark_paid(db, matched)
+
+    return {
+        "open_dues": index.count,
+        "matched_count": len(matched),
+        "updated_count": updated,
+        "unmatched_count": len(unmatched),
+        "dry_run": dry_run,
+        "matched": matched,
+        "unmatched": unmatched
+    }
+
+
 @router.get("/residents/{resident_id}/finance-summary", response_model=dict)
+@run_in_executor("reports")
 def get_resident_finance_summary(
     resident_id: UUID,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
     Get a summary of resident finances including dues, payments, and balance.
+    Archived records count towards the totals.
     """
+    finance_model = with_archive(models.ResidentFinance, True)
+
     # Check if resident exists
     resident = db.query(models.Resident).filter(models.Resident.id == resident_id).first()
     if not resident:
@@ -268,31 +345,31 @@ def get_resident_finance_summary(
     from sqlalchemy import func, case, literal
     
     # Filter conditions for date range
-    conditions = [models.ResidentFinance.resident_id == resident_id, 
-                  models.ResidentFinance.is_active == True]
+    conditions = [finance_model.resident_id == resident_id, 
+                  finance_model.is_active == True]
     
     if start_date:
-        conditions.append(models.ResidentFinance.due_date >= start_date)
+        conditions.append(finance_model.due_date >= start_date)
     
     if end_date:
-        conditions.append(models.ResidentFinance.due_date <= end_date)
+        conditions.append(finance_model.due_date <= end_date)
     
     # Calculate total dues (maintenance, penalty, special_charge)
-    dues_query = db.query(func.sum(models.ResidentFinance.amount).label("total_dues")).filter(
+    dues_query = db.query(func.sum(finance_model.amount).label("total_dues")).filter(
         *conditions,
-        models.ResidentFinance.transaction_type.in_(["maintenance", "penalty", "special_charge"])
+        finance_model.transaction_type.in_(["maintenance", "penalty", "special_charge"])
     )
     
     # Calculate total payments (payment, refund)
-    payments_query = db.query(func.sum(models.ResidentFinance.amount).label("total_payments")).filter(
+    payments_query = db.query(func.sum(finance_model.amount).label("total_payments")).filter(
         *conditions,
-        models.ResidentFinance.transaction_type.in_(["payment", "refund"])
+        finance_model.transaction_type.in_(["payment", "refund"])
     )
     
     # Get recent transactions
-    recent_transactions_query = db.query(models.ResidentFinance).filter(
+    recent_transactions_query = db.query(finance_model).filter(
         *conditions
-    ).order_by(models.ResidentFinance.created_at.desc()).limit(5)
+    ).order_by(finance_model.created_at.desc()).limit(5)
     
     # Execute queries
     dues_result = dues_query.scalar() or 0
@@ -1,5 +1,7 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from uuid import UUID
 
@@ -9,6 +11,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from database import get_db
+from includes import apply_includes, RESIDENT_INCLUDES
+from purge import delete_dependents, exceeds_purge_threshold, queue_society_purge
+from sharding import DEFAULT_SHARD, SHARD_NEW_SOCIETIES, copy_society, get_shard_db, shard_map
 
 router = APIRouter()
 
@@ -23,7 +28,8 @@ def get_societies(
     db: Session = Depends(get_db)
 ):
     """
-    Get all societies or filter by name, with optional sorting.
+    Get all societies or filter by name, with optional sorting. Read from
+    the main database, which has a copy of every society on any shard.
     """
     query = db.query(models.Society)
     
@@ -55,7 +61,7 @@ def get_societies(
 
 
 @router.get("/societies/{society_id}", response_model=schemas.Society)
-def get_society(society_id: UUID, db: Session = Depends(get_db)):
+def get_society(society_id: UUID, db: Session = Depends(get_shard_db)):
     """
     Get a specific society by ID.
     """
@@ -68,12 +74,17 @@ def get_society(society_id: UUID, db: Session = Depends(get_db)):
 @router.post("/societies/", response_model=schemas.Society, status_code=201)
 def create_society(society: schemas.SocietyCreate, db: Session = Depends(get_db)):
     """
-    Create a new society.
+    Create a new society, on the shard set by SHARD_NEW_SOCIETIES.
     """
     db_society = models.Society(**society.dict())
     db.add(db_society)
+    if SHARD_NEW_SOCIETIES != DEFAULT_SHARD:
+        db.flush()
+        shard_map.assign(db, db_society.id, SHARD_NEW_SOCIETIES)
     db.commit()
     db.refresh(db_society)
+    if SHARD_NEW_SOCIETIES != DEFAULT_SHARD:
+        copy_society(db_society, SHARD_NEW_SOCIETIES)
     return db_society
 
 
@@ -81,7 +92,7 @@ def create_society(society: schemas.SocietyCreate, db: Session = Depends(get_db)
 def update_society(
     society_id: UUID, 
     society_update: schemas.SocietyUpdate, 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
     Update a society.
@@ -96,18 +107,41 @@ def update_society(
     
     db.commit()
     db.refresh(db_society)
+    if db.info["shard"] != DEFAULT_SHARD:
+        copy_society(db_society, DEFAULT_SHARD)
     return db_society
 
 
-@router.delete("/societies/{society_id}", status_code=204)
-def delete_society(society_id: UUID, db: Session = Depends(get_db)):
+@router.delete(
+    "/societies/{society_id}",
+    status_code=204,
+    responses={202: {"model": schemas.Job, "description": "Large society; deleted by the returned society_purge job"}},
+)
+def delete_society(society_id: UUID, db: Session = Depends(get_shard_db)):
     """
-    Delete a society.
+    Delete a society. Its residents, finances and admins are deleted with it
+    and recorded in the change outbox. A society with more than SOCIETY_PURGE_THRESHOLD
+    dependent rows is marked inactive instead, and 202 returns the
+    society_purge job that deletes it in batches.
     """
     db_society = db.query(models.Society).filter(models.Society.id == society_id).first()
     if db_society is None:
         raise HTTPException(status_code=404, detail="Society not found")
     
+    if exceeds_purge_threshold(db, society_id):
+        if db_society.is_active:
+            db_society.is_active = False
+            db.commit()
+            db.refresh(db_society)
+            if db.info["shard"] != DEFAULT_SHARD:
+                copy_society(db_society, DEFAULT_SHARD)
+        job = queue_society_purge(society_id)
+        return JSONResponse(status_code=202, content=jsonable_encoder(schemas.Job.model_validate(job)))
+
+    if db.info["shard"] != DEFAULT_SHARD:
+        # Directory first: it holds the rows that may still reference the society
+        copy_society(db_society, DEFAULT_SHARD, deleted=True)
+    delete_dependents(db, society_id)
     db.delete(db_society)
     db.commit()
     return None
@@ -118,7 +152,8 @@ def get_society_residents(
     society_id: UUID, 
     skip: int = 0, 
     limit: int = 100,
-    db: Session = Depends(get_db)
+    include: Optional[str] = Query("society", description="Relations to embed: society (pass an empty value to omit)"),
+    db: Session = Depends(get_shard_db)
 ):
     """
     Get all residents belonging to a specific society.
@@ -129,7 +164,8 @@ def get_society_residents(
         raise HTTPException(status_code=404, detail="Society not found")
     
     # Get residents for the society, ordered by unit_number alphabetically
-    residents = db.query(models.Resident).filter(
+    query = apply_includes(db.query(models.Resident), models.Resident, RESIDENT_INCLUDES, include)
+    residents = query.filter(
         models.Resident.society_id == society_id
     ).order_by(
         models.Resident.unit_number.asc().nulls_last(),
@@ -145,7 +181,7 @@ def get_society_committee_members(
     society_id: UUID, 
     skip: int = 0, 
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
     Get all committee members belonging to a specific society.
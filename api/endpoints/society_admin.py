@@ -10,23 +10,28 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from database import get_db
+from includes import apply_includes, SOCIETY_ADMIN_INCLUDES
+from tenancy import SocietyScope, get_society_scope
 
 router = APIRouter()
 
 # SocietyAdmin Management Endpoints
-@router.get("/society-admins/", response_model=List[schemas.SocietyAdmin])
+@router.get("/society-admins/", response_model=List[schemas.SocietyAdminWithRelations])
 def get_society_admins(
     skip: int = 0, 
     limit: int = 100,
     user_id: Optional[UUID] = None,
     society_id: Optional[UUID] = None,
     is_primary_admin: Optional[bool] = None,
+    include: Optional[str] = Query(None, description="Relations to embed: user, society"),
+    scope: SocietyScope = Depends(get_society_scope),
     db: Session = Depends(get_db)
 ):
     """
-    Get all society admins with optional filtering.
+    Get all society admins with optional filtering, limited to the caller's societies.
     """
-    query = db.query(models.SocietyAdmin)
+    query = apply_includes(db.query(models.SocietyAdmin), models.SocietyAdmin, SOCIETY_ADMIN_INCLUDES, include)
+    query = scope.filter(query, models.SocietyAdmin.society_id)
     
     if user_id:
         query = query.filter(models.SocietyAdmin.user_id == user_id)
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from uuid import UUID
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+from database import get_db
+from events import event_stream
+
+router = APIRouter()
+
+
+@router.get("/societies/{society_id}/events")
+def stream_society_events(society_id: UUID, db: Session = Depends(get_db)):
+    """
+    Server-Sent Events stream of changes to a society's residents, finances
+    and administrators, so clients can refresh when something changes instead
+    of polling. Each event names the changed entity and its id, e.g.
+    `event: resident_finance.updated`; a `resync` event means events were
+    missed and the client should refetch.
+    """
+    society = db.query(models.Society.id).filter(models.Society.id == society_id).first()
+    if not society:
+        raise HTTPException(status_code=404, detail="Society not found")
+    # Return the pooled connection now rather than holding it for the life of the stream
+    db.close()
+    return StreamingResponse(
+        event_stream(str(society_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
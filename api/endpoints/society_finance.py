@@ -10,13 +10,18 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
-from database import get_db
+from executors import run_in_executor
+from includes import apply_includes, SOCIETY_FINANCE_INCLUDES
+from idempotency import idempotent
+from tenancy import SocietyScope, get_society_scope
+from archive import with_archive
+from sharding import get_shard_db, read_page
 # from rbac_utils import has_permission  # Import currently not used
 
 router = APIRouter()
 
 
-@router.get("/society_finances/", response_model=List[schemas.SocietyFinance])
+@router.get("/society_finances/", response_model=List[schemas.SocietyFinanceWithRelations])
 def get_all_society_finances(
     skip: int = 0, 
     limit: int = 100,
@@ -27,44 +32,57 @@ def get_all_society_finances(
     end_date: Optional[date] = None,
     payment_status: Optional[str] = None,
     is_active: Optional[bool] = True,
-    db: Session = Depends(get_db)
+    include: Optional[str] = Query(None, description="Relations to embed: society"),
+    scope: SocietyScope = Depends(get_society_scope),
+    include_archived: bool = False,
+    db: Session = Depends(get_shard_db)
 ):
     """
-    Get all society finances with optional filters.
+    Get all society finances with optional filters, limited to the caller's societies.
     """
-    query = db.query(models.SocietyFinance)
+    finance_model = with_archive(models.SocietyFinance, include_archived)
+
+    def build_query(session: Session):
+        query = apply_includes(session.query(finance_model), finance_model, SOCIETY_FINANCE_INCLUDES, include)
+        query = scope.filter(query, finance_model.society_id)
     
-    if society_id:
-        query = query.filter(models.SocietyFinance.society_id == society_id)
+        if society_id:
+            query = query.filter(finance_model.society_id == society_id)
     
-    if expense_type:
-        query = query.filter(models.SocietyFinance.expense_type == expense_type)
+        if expense_type:
+            query = query.filter(finance_model.expense_type == expense_type)
     
-    if category:
-        query = query.filter(models.SocietyFinance.category == category)
+        if category:
+            query = query.filter(finance_model.category == category)
     
-    if start_date:
-        query = query.filter(models.SocietyFinance.expense_date >= start_date)
+        if start_date:
+            query = query.filter(finance_model.expense_date >= start_date)
     
-    if end_date:
-        query = query.filter(models.SocietyFinance.expense_date <= end_date)
+        if end_date:
+            query = query.filter(finance_model.expense_date <= end_date)
     
-    if payment_status:
-        query = query.filter(models.SocietyFinance.payment_status == payment_status)
+        if payment_status:
+            query = query.filter(finance_model.payment_status == payment_status)
     
-    if is_active is not None:
-        query = query.filter(models.SocietyFinance.is_active == is_active)
+        if is_active is not None:
+            query = query.filter(finance_model.is_active == is_active)
     
-    finances = query.order_by(models.SocietyFinance.expense_date.desc()).offset(skip).limit(limit).all()
-    return finances
+        return query.order_by(finance_model.expense_date.desc())
+    
+    societies = [society_id] if society_id else scope.society_ids
+    return read_page(
+        db, societies, build_query, skip, limit,
+        key=lambda finance: finance.expense_date, reverse=True
+    )
 
 
 @router.get("/society_finances/{finance_id}", response_model=schemas.SocietyFinance)
-def get_society_finance(finance_id: UUID, db: Session = Depends(get_db)):
+def get_society_finance(finance_id: UUID, include_archived: bool = False, db: Session = Depends(get_shard_db)):
     """
     Get a specific society finance record by ID.
     """
-    finance = db.query(models.SocietyFinance).filter(models.SocietyFinance.id == finance_id).first()
+    finance_model = with_archive(models.SocietyFinance, include_archived)
+    finance = db.query(finance_model).filter(finance_model.id == finance_id).first()
     if finance is None:
         error_detail = {
             "code": "NOT_FOUND",
@@ -74,7 +92,7 @@ def get_society_finance(finance_id: UUID, db: Session = Depends(get_db)):
     return finance
 
 
-@router.get("/societies/{society_id}/finances", response_model=List[schemas.SocietyFinance])
+@router.get("/societies/{society_id}/finances", response_model=List[schemas.SocietyFinanceWithRelations])
 def get_society_finances(
     society_id: UUID,
     skip: int = 0, 
@@ -85,11 +103,15 @@ def get_society_finances(
     end_date: Optional[date] = None,
     payment_status: Optional[str] = None,
     is_active: Optional[bool] = True,
-    db: Session = Depends(get_db)
+    include: Optional[str] = Query(None, description="Relations to embed: society"),
+    include_archived: bool = False,
+    db: Session = Depends(get_shard_db)
 ):
     """
     Get all finances for a specific society.
     """
+    finance_model = with_archive(models.SocietyFinance, include_archived)
+
     # Check if society exists
     society = db.query(models.Society).filter(models.Society.id == society_id).first()
     if not society:
@@ -99,32 +121,34 @@ def get_society_finances(
         }
         raise HTTPException(status_code=404, detail=error_detail)
     
-    query = db.query(models.SocietyFinance).filter(models.SocietyFinance.society_id == society_id)
+    query = apply_includes(db.query(finance_model), finance_model, SOCIETY_FINANCE_INCLUDES, include)
+    query = query.filter(finance_model.society_id == society_id)
     
     if expense_type:
-        query = query.filter(models.SocietyFinance.expense_type == expense_type)
+        query = query.filter(finance_model.expense_type == expense_type)
     
     if category:
-        query = query.filter(models.SocietyFinance.category == category)
+        query = query.filter(finance_model.category == category)
     
     if start_date:
-        query = query.filter(models.SocietyFinance.expense_date >= start_date)
+        query = query.filter(finance_model.expense_date >= start_date)
     
     if end_date:
-        query = query.filter(models.SocietyFinance.expense_date <= end_date)
+        query = query.filter(finance_model.expense_date <= end_date)
     
     if payment_status:
-        query = query.filter(models.SocietyFinance.payment_status == payment_status)
+        query = query.filter(finance_model.payment_status == payment_status)
     
     if is_active is not None:
-        query = query.filter(models.SocietyFinance.is_active == is_active)
+        query = query.filter(finance_model.is_active == is_active)
     
-    finances = query.order_by(models.SocietyFinance.expense_date.desc()).offset(skip).limit(limit).all()
+    finances = query.order_by(finance_model.expense_date.desc()).offset(skip).limit(limit).all()
     return finances
 
 
 @router.post("/society_finances/", response_model=schemas.SocietyFinance, status_code=201)
-def create_society_finance(finance: schemas.SocietyFinanceCreate, db: Session = Depends(get_db)):
+@idempotent
+def create_society_finance(finance: schemas.SocietyFinanceCreate, db: Session = Depends(get_shard_db)):
     """
     Create a new society finance record.
     """
@@ -200,7 +224,7 @@ def create_society_finance(finance: schemas.SocietyFinanceCreate, db: Session =
 def update_society_finance(
     finance_id: UUID,
     finance_update: schemas.SocietyFinanceUpdate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
     Update a society finance record.
@@ -289,7 +313,7 @@ def update_society_finance(
 
 
 @router.delete("/society_finances/{finance_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_society_finance(finance_id: UUID, db: Session = Depends(get_db)):
+def delete_society_finance(finance_id: UUID, db: Session = Depends(get_shard_db)):
     """
     Soft delete a society finance record.
     """
@@ -308,7 +332,7 @@ def delete_society_finance(finance_id: UUID, db: Session = Depends(get_db)):
 
 
 @router.get("/societies/{society_id}/finance-categories", response_model=List[str])
-def get_society_finance_categories(society_id: UUID, db: Session = Depends(get_db)):
+def get_society_finance_categories(society_id: UUID, db: Session = Depends(get_shard_db)):
     """
     Get all unique finance categories for a society.
     """
@@ -331,16 +355,20 @@ def get_society_finance_categories(society_id: UUID, db: Session = Depends(get_d
 
 
 @router.get("/societies/{society_id}/finance-summary", response_model=dict)
+@run_in_executor("reports")
 def get_society_finance_summary(
     society_id: UUID,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     expense_type: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_shard_db)
 ):
     """
-    Get a summary of society finances grouped by category.
+    Get a summary of society finances grouped by category. Archived records
+    count towards the totals.
     """
+    finance_model = with_archive(models.SocietyFinance, True)
+
     # Check if society exists
     society = db.query(models.Society).filter(models.Society.id == society_id).first()
     if not society:
@@ -353,25 +381,25 @@ def get_society_finance_summary(
     # Base query
     from sqlalchemy import func, distinct
     query = db.query(
-        models.SocietyFinance.category,
-        func.sum(models.SocietyFinance.amount).label("total_amount"),
-        func.count(distinct(models.SocietyFinance.id)).label("count")
+        finance_model.category,
+        func.sum(finance_model.amount).label("total_amount"),
+        func.count(distinct(finance_model.id)).label("count")
     ).filter(
-        models.SocietyFinance.society_id == society_id,
-        models.SocietyFinance.is_active == True
+        finance_model.society_id == society_id,
+        finance_model.is_active == True
     )
     
     if start_date:
-        query = query.filter(models.SocietyFinance.expense_date >= start_date)
+        query = query.filter(finance_model.expense_date >= start_date)
     
     if end_date:
-        query = query.filter(models.SocietyFinance.expense_date <= end_date)
+        query = query.filter(finance_model.expense_date <= end_date)
     
     if expense_type:
-        query = query.filter(models.SocietyFinance.expense_type == expense_type)
+        query = query.filter(finance_model.expense_type == expense_type)
     
     # Group by category
-    results = query.group_by(models.SocietyFinance.category).all()
+    results = query.group_by(finance_model.category).all()
     
     # Compile summary
     summary = {
@@ -0,0 +1,226 @@
+from typing import FrozenSet, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session, noload
+from uuid import UUID
+from datetime import datetime
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+import schemas
+from sharding import get_shard_db, sharding_enabled
+from tenancy import SocietyScope, get_society_scope
+from executors import run_in_executor
+from outbox import OUTBOX_ENABLED, entity_changes, feed_head, retains
+
+router = APIRouter()
+
+# Entity types that can be synced, mapped to their model, response schema
+# and outbox entity name
+SYNC_ENTITIES = {
+    "residents": (models.Resident, schemas.Resident, "resident"),
+    "resident_finances": (models.ResidentFinance, schemas.ResidentFinance, "resident_finance"),
+    "society_finances": (models.SocietyFinance, schemas.SocietyFinance, "society_finance"),
+}
+
+MAX_SYNC_LIMIT = 5000
+
+SNAPSHOT_PREFIX = "snapshot:"
+
+
+def encode_watermark(position: Tuple[int, int], after_id: Optional[UUID] = None) -> str:
+    """
+    Encode a change outbox position as an opaque watermark string. During
+    the initial sync the watermark also carries the last row id returned.
+    """
+    if after_id is not None:
+        return f"{SNAPSHOT_PREFIX}{position[0]}.{position[1]}.{after_id}"
+    return f"{position[0]}.{position[1]}"
+
+
+def _watermark_error(entity: str, code: str, message: str, status_code: int = 400):
+    error_detail = {"code": code, "message": message, "field": f"{entity}_since"}
+    return HTTPException(status_code=status_code, detail=error_detail)
+
+
+def parse_watermark(entity: str, value: str) -> Tuple[Tuple[int, int], Optional[UUID]]:
+    """Parse a watermark previously returned by /sync into (outbox position, snapshot row id)."""
+    snapshot = value.startswith(SNAPSHOT_PREFIX)
+    parts = value[len(SNAPSHOT_PREFIX):].split(".") if snapshot else value.split(".")
+    try:
+        if snapshot and len(parts) == 3:
+            return (int(parts[0]), int(parts[1])), UUID(parts[2])
+        if not snapshot and len(parts) == 2:
+            return (int(parts[0]), int(parts[1])), None
+    except ValueError:
+        pass
+    if "T" in value or "|" in value:
+        # Timestamp watermarks from before /sync read the change outbox
+        raise _watermark_error(
+            entity, "WATERMARK_EXPIRED", f"Watermark for {entity} has expired; sync {entity} again from the start", 410
+        )
+    raise _watermark_error(entity, "INVALID_WATERMARK", f"Watermark for {entity} must be a value returned by /sync")
+
+
+def _synced_societies(society_id: Optional[UUID], scope: SocietyScope) -> Optional[FrozenSet[UUID]]:
+    """Societies whose rows are synced: the requested one, else the caller's (None for all)."""
+    return frozenset([society_id]) if society_id else scope.society_ids
+
+
+def _scope_to_societies(query, entity: str, society_ids: FrozenSet[UUID]):
+    if entity == "residents":
+        return query.filter(models.Resident.society_id.in_(society_ids))
+    if entity == "resident_finances":
+        return query.join(
+            models.Resident, models.ResidentFinance.resident_id == models.Resident.id
+        ).filter(models.Resident.society_id.in_(society_ids))
+    return query.filter(models.SocietyFinance.society_id.in_(society_ids))
+
+
+def _rows_query(db: Session, entity: str, society_ids: Optional[FrozenSet[UUID]]):
+    model = SYNC_ENTITIES[entity][0]
+    query = db.query(model)
+    if entity == "residents":
+        # Society details are synced separately; avoid a lazy load per row
+        query = query.options(noload(models.Resident.society))
+    if society_ids is not None:
+        query = _scope_to_societies(query, entity, society_ids)
+    return query
+
+
+def get_entity_changes(
+    db: Session,
+    entity: str,
+    since: Optional[str],
+    society_ids: Optional[FrozenSet[UUID]],
+    limit: int,
+    head: Tuple[int, int]
+) -> dict:
+    """
+    Return rows of one entity type changed after the watermark, in the given
+    societies (None for every society).
+
+    Changes are read from the change outbox in (txid, id) order, up to head,
+    the newest event no running transaction can still precede. A write that
+    commits late is therefore never skipped, and hard deletes are reported
+    like soft deletes: rows that are gone or have is_active=False are
+    returned as tombstones in `deleted`.
+
+    Without a watermark the current rows are paged by id; the outbox
+    position taken on the first page is where incremental sync resumes, so
+    changes made while paging are not missed.
+    """
+    model, schema, outbox_entity = SYNC_ENTITIES[entity]
+
+    position, after_id = (head, None) if since is None else parse_watermark(entity, since)
+    if since is None or after_id is not None:
+        # Initial sync - clients have nothing to delete yet
+        query = _rows_query(db, entity, society_ids).filter(model.is_active == True)
+        if after_id is not None:
+            query = query.filter(model.id > after_id)
+        rows = query.order_by(model.id.asc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "changed": [schema.model_validate(row) for row in rows],
+            "deleted": [],
+            "watermark": encode_watermark(position, rows[-1].id if has_more else None),
+            "has_more": has_more
+        }
+
+    if not retains(db, position):
+        raise _watermark_error(
+            entity, "WATERMARK_EXPIRED", f"Watermark for {entity} has expired; sync {entity} again from the start", 410
+        )
+    events = entity_changes(db, outbox_entity, position, head, limit + 1, society_ids)
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    # Several changes to one row come back as its current state, once; rows
+    # that have since left the societies come back as deleted
+    ids = list(dict.fromkeys(event.entity_id for event in events))
+    current = {row.id: row for row in _rows_query(db, entity, society_ids).filter(model.id.in_(ids)).all()} if ids else {}
+    changed, deleted = [], []
+    for row_id in ids:
+        row = current.get(row_id)
+        if row is not None and row.is_active:
+            changed.append(schema.model_validate(row))
+        else:
+            deleted.append(row_id)
+
+    watermark = (events[-1].txid, events[-1].id) if has_more else max(position, head)
+    return {
+        "changed": changed,
+        "deleted": deleted,
+        "watermark": encode_watermark(watermark),
+        "has_more": has_more
+    }
+
+
+@router.get("/sync", response_model=schemas.SyncResponse)
+@run_in_executor("reports")
+def sync_changes(
+    entities: List[str] = Query(list(SYNC_ENTITIES.keys()), description="Entity types to sync"),
+    society_id: Optional[UUID] = None,
+    residents_since: Optional[str] = Query(None, description="Watermark returned by the previous sync"),
+    resident_finances_since: Optional[str] = Query(None, description="Watermark returned by the previous sync"),
+    society_finances_since: Optional[str] = Query(None, description="Watermark returned by the previous sync"),
+    limit: int = Query(500, ge=1, le=MAX_SYNC_LIMIT, description="Maximum rows per entity type"),
+    scope: SocietyScope = Depends(get_society_scope),
+    db: Session = Depends(get_shard_db)
+):
+    """
+    Get rows changed since the given per-entity watermarks, limited to the
+    caller's societies.
+
+    Omit a watermark to perform a full initial sync of that entity type.
+    Keep calling with the returned watermarks while `has_more` is true. A
+    watermark older than the outbox retention returns 410; sync that entity
+    type again from the start.
+    """
+    unknown = [entity for entity in entities if entity not in SYNC_ENTITIES]
+    if unknown:
+        error_detail = {
+            "code": "INVALID_ENTITY",
+            "message": f"Entities must be one of: {', '.join(SYNC_ENTITIES.keys())}",
+            "field": "entities"
+        }
+        raise HTTPException(status_code=400, detail=error_detail)
+
+    if not OUTBOX_ENABLED:
+        raise HTTPException(status_code=503, detail={
+            "code": "SYNC_UNAVAILABLE",
+            "message": "Delta sync reads the change outbox, which is disabled (OUTBOX_ENABLED=false)"
+        })
+
+    if society_id is None and sharding_enabled():
+        # Watermarks are positions in one shard's outbox, so a sync reads one
+        # shard: the one of the society it names
+        raise HTTPException(status_code=400, detail={
+            "code": "SOCIETY_REQUIRED",
+            "message": "society_id is required when societies are placed on several databases",
+            "field": "society_id"
+        })
+    if society_id and not scope.allows(society_id):
+        raise HTTPException(status_code=403, detail={
+            "code": "SOCIETY_FORBIDDEN",
+            "message": f"No access to society {society_id}",
+            "field": "society_id"
+        })
+    society_ids = _synced_societies(society_id, scope)
+
+    watermarks = {
+        "residents": residents_since,
+        "resident_finances": resident_finances_since,
+        "society_finances": society_finances_since,
+    }
+
+    server_time = datetime.utcnow()
+    response = {"server_time": server_time}
+    # One feed position for every entity, so they are synced to the same point
+    head = feed_head(db)
+    for entity in entities:
+        response[entity] = get_entity_changes(db, entity, watermarks[entity], society_ids, limit, head)
+
+    return response
@@ -12,12 +12,28 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from database import get_db
+from sharding import resident_society
 
 router = APIRouter()
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+
+def _resident_society_or_400(resident_id: Optional[UUID]) -> Optional[UUID]:
+    """The society of the resident a user is being linked to, which may be on any shard."""
+    if resident_id is None:
+        return None
+    society_id = resident_society(resident_id)
+    if society_id is None:
+        raise HTTPException(status_code=400, detail={
+            "code": "INVALID_RESIDENT",
+            "message": f"Resident with ID {resident_id} not found",
+            "field": "resident_id"
+        })
+    return society_id
+
+
 # User Management Endpoints
 @router.get("/users/", response_model=List[schemas.User])
 def get_users(
@@ -129,6 +145,8 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
             detail=error_detail
         )
     
+    resident_society_id = _resident_society_or_400(user.resident_id)
+    
     # Hash the password
     hashed_password = pwd_context.hash(user.password)
     
@@ -140,6 +158,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         full_name=user.full_name,
         role_id=user.role_id,
         resident_id=user.resident_id,
+        resident_society_id=resident_society_id,
         is_active=True
     )
     
@@ -198,6 +217,8 @@ def update_user(
     
     # Update fields
     update_data = user_update.dict(exclude_unset=True)
+    if "resident_id" in update_data:
+        update_data["resident_society_id"] = _resident_society_or_400(update_data["resident_id"])
     for key, value in update_data.items():
         setattr(db_user, key, value)
     
@@ -0,0 +1,279 @@
+import os
+import json
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from database import async_engine
+from outbox import Change, on_changes, outbox_subscriber
+
+# Configuration
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")  # memory, postgres or outbox
+# Postgres NOTIFY channel used to fan events out to every worker process
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "nivra_events")
+# Events buffered per connected client; a client that falls further behind is told to resync
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# More changes than this to one entity of one society in a transaction are sent as one bulk event
+EVENTS_MAX_PER_TRANSACTION = int(os.getenv("EVENTS_MAX_PER_TRANSACTION", "50"))
+EVENTS_RECONNECT_SECONDS = float(os.getenv("EVENTS_RECONNECT_SECONDS", "5"))
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_PAYLOAD = 7500
+
+logger = logging.getLogger(__name__)
+
+# Outbox entities whose changes are pushed to clients
+PUSHED_ENTITIES = {"society", "resident", "resident_finance", "society_finance", "society_admin", "society_join_request"}
+
+
+class Subscription:
+    """One connected client's queue of events for a society."""
+
+    def __init__(self, society_id: str, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.society_id = society_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def put(self, event: dict) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # The client missed events; replace its backlog with a resync notice
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "society_id": self.society_id, "reason": "lagged"})
+            return False
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class Broadcaster:
+    """
+    Fans change events out to the clients subscribed to each society in
+    this worker process. Events are published from the event loop; writes
+    committed in threadpool endpoints hand theirs over with
+    publish_threadsafe().
+    """
+
+    def __init__(self):
+        self.subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.dropped = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    @asynccontextmanager
+    async def subscribe(self, society_id: str):
+        subscription = Subscription(society_id)
+        self.subscriptions[society_id].add(subscription)
+        try:
+            yield subscription
+        finally:
+            subscribers = self.subscriptions.get(society_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscriptions[society_id]
+
+    def publish(self, events: List[dict]):
+        for event in events:
+            self.published += 1
+            for subscription in list(self.subscriptions.get(event["society_id"], ())):
+                if not subscription.put(event):
+                    self.dropped += 1
+
+    def publish_threadsafe(self, events: List[dict]):
+        # No loop means no subscribers in this process (e.g. a job worker)
+        if self.loop is None or self.loop.is_closed() or not events:
+            return
+        self.loop.call_soon_threadsafe(self.publish, events)
+
+    def resync_all(self, reason: str):
+        self.publish([
+            {"type": "resync", "society_id": society_id, "reason": reason}
+            for society_id in list(self.subscriptions)
+        ])
+
+    def stats(self) -> dict:
+        return {
+            "backend": EVENTS_BACKEND,
+            "societies": len(self.subscriptions),
+            "subscribers": sum(len(subscribers) for subscribers in self.subscriptions.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+broadcaster = Broadcaster()
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+async def event_stream(society_id: str, heartbeat_seconds: float = EVENTS_HEARTBEAT_SECONDS):
+    """
+    Server-Sent Events for one society. Starlette cancels the generator when
+    the client disconnects, which removes the subscription.
+    """
+    async with broadcaster.subscribe(society_id) as subscription:
+        yield "retry: 3000\n: connected\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), heartbeat_seconds)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+
+
+# Change capture. Changes recorded by outbox.record_changes() are published
+# once the transaction commits, so clients never hear about rolled-back writes.
+
+def _push_event(op: str, entity: str, entity_id, society_id, at: str) -> dict:
+    return {
+        "type": f"{entity}.{op}",
+        "entity": entity,
+        "id": str(entity_id),
+        "society_id": str(society_id),
+        "at": at,
+    }
+
+
+def _coalesce(events: List[dict]) -> List[dict]:
+    """Replace large runs of changes to one entity of one society with a single bulk event."""
+    groups: Dict[tuple, List[dict]] = defaultdict(list)
+    for event in events:
+        groups[(event["society_id"], event["entity"])].append(event)
+    coalesced = []
+    for (society_id, entity), group in groups.items():
+        if len(group) > EVENTS_MAX_PER_TRANSACTION:
+            coalesced.append({
+                "type": f"{entity}.bulk_changed",
+                "entity": entity,
+                "society_id": society_id,
+                "count": len(group),
+                "at": group[-1]["at"],
+            })
+        else:
+            coalesced.extend(group)
+    return coalesced
+
+
+def _notify_payloads(events: List[dict]) -> List[str]:
+    """Pack events into JSON arrays that fit in a NOTIFY payload."""
+    payloads, batch = [], []
+    for event in events:
+        candidate = json.dumps(batch + [event], separators=(",", ":"))
+        if batch and len(candidate) > NOTIFY_MAX_PAYLOAD:
+            payloads.append(json.dumps(batch, separators=(",", ":")))
+            batch = [event]
+        else:
+            batch.append(event)
+    if batch:
+        payloads.append(json.dumps(batch, separators=(",", ":")))
+    return payloads
+
+
+@on_changes
+def _collect_changes(session, changes: List[Change]):
+    if EVENTS_BACKEND == "outbox":
+        # Delivered by the outbox subscriber below instead
+        return
+    now = datetime.utcnow().isoformat() + "Z"
+    events = [
+        _push_event(change.op, change.entity, change.entity_id, change.society_id, now)
+        for change in changes
+        if change.entity in PUSHED_ENTITIES and change.society_id is not None
+    ]
+    if not events:
+        return
+    if EVENTS_BACKEND == "postgres":
+        # NOTIFY is transactional: Postgres delivers it only if this transaction
+        # commits, to every listening worker including this one
+        for payload in _notify_payloads(_coalesce(events)):
+            session.connection().execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": EVENTS_CHANNEL, "payload": payload})
+    else:
+        session.info.setdefault("pending_events", []).extend(events)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_on_commit(session):
+    events = session.info.pop("pending_events", None)
+    if events:
+        broadcaster.publish_threadsafe(_coalesce(events))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("pending_events", None)
+
+
+if EVENTS_BACKEND == "outbox":
+    @outbox_subscriber("events")
+    def _publish_from_outbox(outbox_events: List[dict]):
+        broadcaster.publish(_coalesce([
+            _push_event(event["op"], event["entity"], event["entity_id"], event["society_id"], event["at"])
+            for event in outbox_events
+            if event["entity"] in PUSHED_ENTITIES and event["society_id"] is not None
+        ]))
+
+
+class PostgresListener:
+    """LISTENs on EVENTS_CHANNEL and publishes what arrives to this worker's subscribers."""
+
+    def __init__(self, channel: str = EVENTS_CHANNEL):
+        self.channel = channel
+        self.connected = False
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            broadcaster.publish(json.loads(payload))
+        except ValueError:
+            logger.warning("Ignoring malformed event payload on %s", channel)
+
+    async def run(self):
+        import asyncpg
+        args, kwargs = async_engine.dialect.create_connect_args(async_engine.url)
+        # Options consumed by SQLAlchemy's asyncpg adapter, not asyncpg itself
+        for option in ("prepared_statement_cache_size", "prepared_statement_name_func", "async_creator_fn"):
+            kwargs.pop(option, None)
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(*args, **kwargs)
+                await connection.add_listener(self.channel, self._on_notify)
+                if not self.connected:
+                    self.connected = True
+                    # Anything committed while we were not listening was missed
+                    broadcaster.resync_all("reconnected")
+                while not connection.is_closed():
+                    await asyncio.sleep(EVENTS_RECONNECT_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Event listener connection failed: %s", e)
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(EVENTS_RECONNECT_SECONDS)
+
+
+def start_events() -> Optional[asyncio.Task]:
+    """Bind the broadcaster to the running loop and start the Postgres listener if enabled."""
+    broadcaster.bind(asyncio.get_running_loop())
+    if EVENTS_BACKEND == "postgres":
+        return asyncio.create_task(PostgresListener().run())
+    return None
@@ -0,0 +1,192 @@
+import os
+import time
+import asyncio
+import threading
+import functools
+from typing import Callable, Dict
+
+import anyio.to_thread
+from anyio import CapacityLimiter
+from anyio.lowlevel import RunVar
+from fastapi.routing import APIRoute
+
+# Configuration
+# Starlette's shared thread pool, used by every sync endpoint not assigned elsewhere
+EXECUTOR_DEFAULT_THREADS = int(os.getenv("EXECUTOR_DEFAULT_THREADS", "40"))
+EXECUTOR_REPORTS_THREADS = int(os.getenv("EXECUTOR_REPORTS_THREADS", "4"))
+EXECUTOR_BULK_THREADS = int(os.getenv("EXECUTOR_BULK_THREADS", "2"))
+# Extra pools as comma-separated name:threads pairs, e.g. "exports:2,analytics:3"
+EXECUTOR_POOLS = os.getenv("EXECUTOR_POOLS", "")
+
+DEFAULT_EXECUTOR = "default"
+
+
+class BoundedExecutor:
+    """
+    A named thread pool with its own size limit. Sync endpoints assigned to
+    it queue for its threads instead of Starlette's shared pool, so slow
+    report requests cannot starve interactive ones.
+    """
+
+    def __init__(self, name: str, threads: int):
+        self.name = name
+        self.threads = threads
+        # One limiter per event loop, like anyio's own default limiter
+        self._limiter_var: RunVar = RunVar(f"nivra_executor_{name}")
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    @property
+    def limiter(self) -> CapacityLimiter:
+        try:
+            return self._limiter_var.get()
+        except LookupError:
+            limiter = CapacityLimiter(self.threads)
+            self._limiter_var.set(limiter)
+            return limiter
+
+    def _record_start(self, submitted_at: float):
+        wait_ms = (time.perf_counter() - submitted_at) * 1000
+        with self._stats_lock:
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def _record_finish(self, failed: bool):
+        with self._stats_lock:
+            self.completed += 1
+            if failed:
+                self.failed += 1
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run func in one of this pool's threads, waiting for a free thread if all are busy."""
+        submitted_at = time.perf_counter()
+        self.submitted += 1
+
+        def call():
+            self._record_start(submitted_at)
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self._record_finish(failed)
+
+        return await anyio.to_thread.run_sync(call, limiter=self.limiter)
+
+    def stats(self) -> dict:
+        limiter_stats = self.limiter.statistics()
+        completed = self.completed
+        return {
+            "threads": self.threads,
+            "busy": limiter_stats.borrowed_tokens,
+            "queued": limiter_stats.tasks_waiting,
+            "submitted": self.submitted,
+            "completed": completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait_ms / completed, 2) if completed else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+class DefaultExecutor(BoundedExecutor):
+    """Starlette's shared thread pool, resized to EXECUTOR_DEFAULT_THREADS."""
+
+    @property
+    def limiter(self) -> CapacityLimiter:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        if limiter.total_tokens != self.threads:
+            limiter.total_tokens = self.threads
+        return limiter
+
+
+def _parse_pools(value: str) -> Dict[str, int]:
+    pools = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, threads = item.partition(":")
+        pools[name.strip()] = int(threads)
+    return pools
+
+
+def _build_executors() -> Dict[str, BoundedExecutor]:
+    sizes = {"reports": EXECUTOR_REPORTS_THREADS, "bulk": EXECUTOR_BULK_THREADS}
+    sizes.update(_parse_pools(EXECUTOR_POOLS))
+    executors: Dict[str, BoundedExecutor] = {DEFAULT_EXECUTOR: DefaultExecutor(DEFAULT_EXECUTOR, EXECUTOR_DEFAULT_THREADS)}
+    for name, threads in sizes.items():
+        executors[name] = BoundedExecutor(name, threads)
+    return executors
+
+
+executors = _build_executors()
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    try:
+        return executors[name]
+    except KeyError:
+        raise ValueError(f"Unknown executor '{name}'; configured executors are {', '.join(executors)}")
+
+
+def configure_executors():
+    """Size this event loop's thread pools; call once the loop is running."""
+    for executor in executors.values():
+        executor.limiter
+
+
+def executor_stats() -> Dict[str, dict]:
+    return {name: executor.stats() for name, executor in executors.items()}
+
+
+def run_in_executor(name: str) -> Callable:
+    """
+    Run a sync endpoint in the named executor instead of Starlette's shared
+    thread pool. Apply below the router decorator:
+
+        @router.get("/societies/{society_id}/finance-summary", ...)
+        @run_in_executor("reports")
+        def get_society_finance_summary(...):
+
+    Sync dependencies such as get_db still run in the shared pool; they only
+    hold a thread briefly.
+    """
+    executor = get_executor(name)
+
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            raise TypeError(f"{func.__name__} is async; only sync endpoints run in an executor")
+
+        # functools.wraps keeps the signature FastAPI reads dependencies from
+        # and attributes set by other decorators such as @idempotent
+        @functools.wraps(func)
+        async def endpoint(*args, **kwargs):
+            return await executor.run(func, *args, **kwargs)
+
+        endpoint.__executor__ = name
+        return endpoint
+
+    return decorator
+
+
+def executor_route(name: str) -> type:
+    """
+    Route class that runs every sync endpoint of a router in the named
+    executor:
+
+        router = APIRouter(route_class=executor_route("reports"))
+    """
+    get_executor(name)
+
+    class ExecutorRoute(APIRoute):
+        def __init__(self, path: str, endpoint: Callable, **kwargs):
+            if not asyncio.iscoroutinefunction(endpoint) and not hasattr(endpoint, "__executor__"):
+                endpoint = run_in_executor(name)(endpoint)
+            super().__init__(path, endpoint, **kwargs)
+
+    ExecutorRoute.__name__ = f"ExecutorRoute[{name}]"
+    return ExecutorRoute
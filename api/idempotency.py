@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Configuration
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")  # memory or database
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+IDEMPOTENT_METHODS = {"POST", "PUT", "PATCH"}
+
+# Response headers worth replaying; everything else is regenerated by the stack
+REPLAYED_HEADERS = {"content-type", "location"}
+
+
+def idempotent(func: Callable) -> Callable:
+    """
+    Mark an endpoint as supporting the Idempotency-Key header.
+    Apply below the router decorator:
+
+        @router.post("/resident_finances/", ...)
+        @idempotent
+        def create_resident_finance(...):
+    """
+    func.__idempotent__ = True
+    return func
+
+
+def _principal(scope: Scope, headers: Headers) -> str:
+    """
+    The caller keys are scoped to: the token's subject rather than the token
+    itself, so a retry with a refreshed token still finds its key.
+    """
+    principal = scope.get("batch_principal")
+    if principal is not None:
+        return f"user:{principal.username}"
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        from endpoints.auth import SECRET_KEY, ALGORITHM
+        try:
+            subject = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            subject = None
+        if subject:
+            return f"user:{subject}"
+        # Rejected by the endpoint; kept apart from anonymous callers
+        return "invalid"
+    return "anonymous"
+
+
+@dataclass
+class IdempotencyRecord:
+    fingerprint: str
+    expires_at: float
+    status_code: Optional[int] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def completed(self) -> bool:
+        return self.status_code is not None
+
+
+class MemoryIdempotencyStore:
+    """
+    Per-process key store. Entries share one TTL, so insertion order is also
+    expiry order and eviction only ever pops from the front.
+    """
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._records: "OrderedDict[str, IdempotencyRecord]" = OrderedDict()
+
+    def _evict(self):
+        now = time.time()
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record.expires_at > now and len(self._records) <= self.max_entries:
+                break
+            self._records.popitem(last=False)
+
+    def get(self, key: str) -> Optional[IdempotencyRecord]:
+        self._evict()
+        return self._records.get(key)
+
+    def reserve(self, key: str, fingerprint: str) -> bool:
+        self._evict()
+        if key in self._records:
+            return False
+        self._records[key] = IdempotencyRecord(fingerprint=fingerprint, expires_at=time.time() + self.ttl_seconds)
+        return True
+
+    def complete(self, key: str, status_code: int, headers: Dict[str, str], body: bytes):
+        record = self._records.get(key)
+        if record is not None:
+            record.status_code = status_code
+            record.headers = headers
+            record.body = body
+
+    def release(self, key: str):
+        self._records.pop(key, None)
+
+
+class DatabaseIdempotencyStore:
+    """Key store shared by all workers, backed by the idempotency_keys table."""
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, purge_every: int = 500):
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+        self._reservations = 0
+
+    def _session(self):
+        from database import SessionLocal
+        return SessionLocal()
+
+    def get(self, key: str) -> Optional[IdempotencyRecord]:
+        import models
+        db = self._session()
+        try:
+            row = db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.expires_at > datetime.utcnow()
+            ).first()
+            if row is None:
+                return None
+            return IdempotencyRecord(
+                fingerprint=row.fingerprint,
+                expires_at=row.expires_at.timestamp(),
+                status_code=row.status_code,
+                headers=json.loads(row.response_headers) if row.response_headers else {},
+                body=row.response_body or b"",
+            )
+        finally:
+            db.close()
+
+    def reserve(self, key: str, fingerprint: str) -> bool:
+        from sqlalchemy.dialects.postgresql import insert
+        import models
+        db = self._session()
+        try:
+            self._reservations += 1
+            if self._reservations % self.purge_every == 0:
+                self.purge_expired(db)
+            now = datetime.utcnow()
+            # An expired row with the same key may still exist; it must not block the new request
+            db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.expires_at <= now
+            ).delete(synchronize_session=False)
+            result = db.execute(
+                insert(models.IdempotencyKey).values(
+                    key=key,
+                    fingerprint=fingerprint,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                ).on_conflict_do_nothing(index_elements=["key"])
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    def complete(self, key: str, status_code: int, headers: Dict[str, str], body: bytes):
+        import models
+        db = self._session()
+        try:
+            db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).update({
+                "status_code": status_code,
+                "response_headers": json.dumps(headers),
+                "response_body": body,
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key: str):
+        import models
+        db = self._session()
+        try:
+            db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def purge_expired(self, db=None) -> int:
+        """Delete expired keys. Returns the number of rows removed."""
+        import models
+        own_session = db is None
+        db = db or self._session()
+        try:
+            removed = db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            if own_session:
+                db.close()
+
+
+def create_store():
+    if IDEMPOTENCY_BACKEND == "database":
+        return DatabaseIdempotencyStore()
+    return MemoryIdempotencyStore()
+
+
+def _json_response(status_code: int, detail: dict, headers: Optional[Dict[str, str]] = None):
+    body = json.dumps({"detail": detail}).encode()
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+    return status_code, raw_headers, body
+
+
+class IdempotencyMiddleware:
+    """
+    Replays the stored response for a repeated Idempotency-Key instead of
+    running the endpoint again. Only endpoints marked with @idempotent take part.
+
+    Keys are scoped to the caller and the request path. The caller is the
+    verified token's subject, or the principal of a /batch sub-request (see
+    _principal), so a retry with a refreshed token still finds its key;
+    anonymous callers all share one key scope, and tokens that do not verify
+    share another. A key reused with a different body is rejected. Responses
+    with a 5xx status are not stored, so the client can retry with the same
+    key.
+    """
+
+    def __init__(self, app: ASGIApp, store=None):
+        self.app = app
+        self.store = store if store is not None else create_store()
+
+    def _is_idempotent_route(self, scope: Scope) -> bool:
+        app = scope.get("app")
+        for route in getattr(app, "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(getattr(route, "endpoint", None), "__idempotent__", False)
+        return False
+
+    async def _call_store(self, method, *args):
+        if isinstance(self.store, MemoryIdempotencyStore):
+            return method(*args)
+        return await run_in_threadpool(method, *args)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key or not self._is_idempotent_route(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer the request body so it can be fingerprinted and then replayed to the app
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        key = hashlib.sha256("|".join([
+            _principal(scope, headers), scope["method"], scope["path"], idempotency_key
+        ]).encode()).hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        record = await self._call_store(self.store.get, key)
+        if record is None and await self._call_store(self.store.reserve, key, fingerprint):
+            await self._run_and_store(scope, body, send, key)
+            return
+        if record is None:
+            record = await self._call_store(self.store.get, key)
+
+        if record is None or not record.completed:
+            response = _json_response(409, {
+                "code": "IDEMPOTENCY_KEY_IN_PROGRESS",
+                "message": "A request with this Idempotency-Key is still being processed"
+            }, {"Retry-After": "1"})
+        elif record.fingerprint != fingerprint:
+            response = _json_response(422, {
+                "code": "IDEMPOTENCY_KEY_REUSED",
+                "message": "This Idempotency-Key was already used with a different request body",
+                "field": "Idempotency-Key"
+            })
+        else:
+            raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record.headers.items()]
+            raw_headers.append((b"content-length", str(len(record.body)).encode()))
+            raw_headers.append((b"idempotent-replayed", b"true"))
+            response = (record.status_code, raw_headers, record.body)
+
+        status_code, raw_headers, response_body = response
+        await send({"type": "http.response.start", "status": status_code, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": response_body})
+
+    async def _run_and_store(self, scope: Scope, body: bytes, send: Send, key: str):
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        captured = {"status": None, "headers": {}, "chunks": []}
+
+        async def capture_send(message: Message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = {
+                    name.decode("latin-1").lower(): value.decode("latin-1")
+                    for name, value in message.get("headers", [])
+                    if name.decode("latin-1").lower() in REPLAYED_HEADERS
+                }
+            elif message["type"] == "http.response.body":
+                captured["chunks"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await self._call_store(self.store.release, key)
+            raise
+
+        if captured["status"] is None or captured["status"] >= 500:
+            await self._call_store(self.store.release, key)
+        else:
+            await self._call_store(
+                self.store.complete, key, captured["status"], captured["headers"], b"".join(captured["chunks"])
+            )
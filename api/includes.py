@@ -0,0 +1,77 @@
+from typing import Dict, List, Optional, Set
+from fastapi import HTTPException
+from sqlalchemy.orm import joinedload, selectinload, noload
+
+# Relations that may be embedded in list responses, as nested trees of
+# relationship names per model. e.g. {"resident": {"society": {}}} allows
+# include=resident and include=resident.society.
+RESIDENT_FINANCE_INCLUDES = {"resident": {"society": {}}}
+SOCIETY_FINANCE_INCLUDES = {"society": {}}
+RESIDENT_INCLUDES = {"society": {}}
+SOCIETY_ADMIN_INCLUDES = {"user": {}, "society": {}}
+
+
+def _allowed_paths(tree: Dict[str, dict], prefix: str = "") -> List[str]:
+    paths = []
+    for name, children in tree.items():
+        path = f"{prefix}{name}"
+        paths.append(path)
+        paths.extend(_allowed_paths(children, path + "."))
+    return paths
+
+
+def parse_include(include: Optional[str], tree: Dict[str, dict]) -> Set[str]:
+    """
+    Parse a comma-separated include parameter into a set of relation paths.
+    Nested paths imply their parents, so "resident.society" also includes "resident".
+    """
+    if not include:
+        return set()
+
+    allowed = _allowed_paths(tree)
+    paths = set()
+    for raw_path in include.split(","):
+        path = raw_path.strip()
+        if not path:
+            continue
+        if path not in allowed:
+            error_detail = {
+                "code": "INVALID_INCLUDE",
+                "message": f"Include must be one of: {', '.join(allowed)}",
+                "field": "include"
+            }
+            raise HTTPException(status_code=400, detail=error_detail)
+        parts = path.split(".")
+        for depth in range(1, len(parts) + 1):
+            paths.add(".".join(parts[:depth]))
+    return paths
+
+
+def build_load_options(model, tree: Dict[str, dict], include: Set[str], prefix: str = "", parent=None) -> list:
+    """
+    Build loader options for a query so that included relations are fetched
+    eagerly and excluded ones are never lazy loaded during serialization.
+
+    Many-to-one relations use joinedload (same query), collections use
+    selectinload (one extra query per relation), so the number of queries
+    is bounded regardless of page size.
+    """
+    options = []
+    for name, children in tree.items():
+        path = f"{prefix}{name}"
+        attr = getattr(model, name)
+        if path in include:
+            eager = joinedload if not attr.property.uselist else selectinload
+            loader = getattr(parent, eager.__name__)(attr) if parent is not None else eager(attr)
+            options.append(loader)
+            target = attr.property.mapper.class_
+            options.extend(build_load_options(target, children, include, path + ".", loader))
+        else:
+            options.append(parent.noload(attr) if parent is not None else noload(attr))
+    return options
+
+
+def apply_includes(query, model, tree: Dict[str, dict], include: Optional[str]):
+    """Apply the loader options for an include parameter to a query."""
+    paths = parse_include(include, tree)
+    return query.options(*build_load_options(model, tree, paths))
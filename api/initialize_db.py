@@ -12,6 +12,7 @@ from passlib.context import CryptContext
 # Add parent directory to path to import models
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import models
+import migrate
 from database import engine, Base, get_db
 
 # Load environment variables
@@ -21,10 +22,10 @@ load_dotenv()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def create_tables():
-    """Create database tables."""
-    print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
-    print("Tables created successfully.")
+    """Create database tables by applying pending migrations."""
+    print("Applying database migrations...")
+    applied = migrate.upgrade(engine)
+    print(f"Applied {len(applied)} migration(s); tables are up to date.")
 
 def insert_roles():
     """Insert roles into the database."""
@@ -0,0 +1,367 @@
+"""
+Built-in job handlers for long-running finance operations. Each handler
+works in chunks, committing and reporting progress after each one, and is
+safe to run again for the same job after a failure.
+"""
+
+import os
+import calendar
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import func, select, update
+
+import models
+from archive import archivable, archive_batch, archive_cutoff
+from outbox import Change, record_changes
+from purge import PURGE_ORDER, delete_dependents, purge_batch, society_rows
+from jobs import job_handler, JobContext, PermanentJobError
+from sharding import DEFAULT_SHARD, shard_map, shard_session, shards_of
+
+# Configuration
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "500"))
+
+FREQUENCY_MONTHS = {"monthly": 1, "quarterly": 3, "annually": 12}
+
+
+def _chunks(items: List, size: int = JOB_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _payload_date(ctx: JobContext, field: str, default: Optional[date] = None) -> date:
+    value = ctx.payload.get(field)
+    if value is None:
+        if default is None:
+            raise PermanentJobError(f"Payload field '{field}' is required")
+        return default
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise PermanentJobError(f"Payload field '{field}' must be a date (YYYY-MM-DD)")
+
+
+def _payload_society_id(ctx: JobContext, required: bool = False) -> Optional[UUID]:
+    value = ctx.society_id or ctx.payload.get("society_id")
+    if value is None:
+        if required:
+            raise PermanentJobError("Payload field 'society_id' is required")
+        return None
+    try:
+        return value if isinstance(value, UUID) else UUID(value)
+    except (TypeError, ValueError):
+        raise PermanentJobError("Payload field 'society_id' must be a UUID")
+
+
+@contextmanager
+def _ledger_db(ctx: JobContext, shard: str):
+    """A session on the shard holding a ledger; the job's own session for the main database."""
+    if shard == DEFAULT_SHARD:
+        yield ctx.db
+    else:
+        with shard_session(shard) as db:
+            yield db
+
+
+def _ledger_shards(society_id: Optional[UUID]) -> List[str]:
+    """Shards to process: the society's, or every shard when no society is given."""
+    return sorted(shards_of(None if society_id is None else [society_id]))
+
+
+def add_months(value: date, months: int, day: Optional[int] = None) -> date:
+    """
+    Add months to a date, clamping the day to the end of shorter months.
+    Pass the original day so a schedule anchored on the 31st returns to the
+    31st after passing through a 30-day month.
+    """
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day or value.day, calendar.monthrange(year, month)[1]))
+
+
+@job_handler("billing_run")
+def billing_run(ctx: JobContext) -> dict:
+    """
+    Raise one due for every active resident of a society.
+
+    Payload: society_id, amount, due_date, and optionally transaction_type
+    (default maintenance), currency (default INR) and description. Residents
+    who already have a due of that type on that date are skipped.
+    """
+    society_id = _payload_society_id(ctx, required=True)
+    due_date = _payload_date(ctx, "due_date")
+    transaction_type = ctx.payload.get("transaction_type", "maintenance")
+    try:
+        amount = Decimal(str(ctx.payload["amount"]))
+    except (KeyError, InvalidOperation):
+        raise PermanentJobError("Payload field 'amount' is required and must be a number")
+
+    with _ledger_db(ctx, shard_map.shard_for(society_id)) as db:
+        resident_ids = [
+            row.id for row in db.query(models.Resident.id)
+            .filter(models.Resident.society_id == society_id, models.Resident.is_active == True)
+            .order_by(models.Resident.id)
+            .all()
+        ]
+        ctx.progress(0, len(resident_ids))
+
+        created = skipped = done = 0
+        for chunk in _chunks(resident_ids):
+            # Lock the society so two billing runs for it cannot both see a
+            # resident as unbilled and bill them twice
+            if db.query(models.Society.id).filter(models.Society.id == society_id).with_for_update().first() is None:
+                raise PermanentJobError(f"Society {society_id} not found")
+            already_billed = {
+                row.resident_id for row in db.query(models.ResidentFinance.resident_id).filter(
+                    models.ResidentFinance.resident_id.in_(chunk),
+                    models.ResidentFinance.transaction_type == transaction_type,
+                    models.ResidentFinance.due_date == due_date,
+                )
+            }
+            for resident_id in chunk:
+                if resident_id in already_billed:
+                    skipped += 1
+                    continue
+                db.add(models.ResidentFinance(
+                    resident_id=resident_id,
+                    transaction_type=transaction_type,
+                    amount=amount,
+                    currency=ctx.payload.get("currency", "INR"),
+                    due_date=due_date,
+                    payment_status="pending",
+                    description=ctx.payload.get("description"),
+                ))
+                created += 1
+            db.commit()
+            done += len(chunk)
+            ctx.progress(done)
+
+    return {"residents": len(resident_ids), "created": created, "skipped": skipped, "due_date": due_date.isoformat()}
+
+
+@job_handler("overdue_sweep")
+def overdue_sweep(ctx: JobContext) -> dict:
+    """
+    Mark pending resident dues whose due date has passed as overdue.
+
+    Payload: optionally society_id (default all societies) and as_of
+    (default today); dues due before as_of are marked, except those whose
+    due date migration 0012 estimated.
+    """
+    society_id = _payload_society_id(ctx)
+    as_of = _payload_date(ctx, "as_of", date.today())
+
+    # Scan every shard first so progress has a total
+    finances_by_shard = {}
+    for shard in _ledger_shards(society_id):
+        with _ledger_db(ctx, shard) as db:
+            query = db.query(models.ResidentFinance.id, models.Resident.society_id).join(models.Resident).filter(
+                models.ResidentFinance.payment_status == "pending",
+                models.ResidentFinance.due_date < as_of,
+                # Estimated due dates (migration 0012) are not grounds for overdue
+                models.ResidentFinance.due_date_estimated == False,
+            )
+            if society_id is not None:
+                query = query.filter(models.Resident.society_id == society_id)
+            finances_by_shard[shard] = {row.id: row.society_id for row in query.order_by(models.ResidentFinance.id).all()}
+    ctx.progress(0, sum(len(finances) for finances in finances_by_shard.values()))
+
+    marked = done = 0
+    for shard, finances in finances_by_shard.items():
+        with _ledger_db(ctx, shard) as db:
+            for chunk in _chunks(list(finances)):
+                # Re-check the status so dues paid since the scan are left alone
+                marked_ids = db.execute(
+                    update(models.ResidentFinance)
+                    .where(models.ResidentFinance.id.in_(chunk), models.ResidentFinance.payment_status == "pending")
+                    .values(payment_status="overdue")
+                    .returning(models.ResidentFinance.id)
+                    .execution_options(synchronize_session=False)
+                ).scalars().all()
+                record_changes(db, [
+                    Change("updated", "resident_finance", finance_id, finances[finance_id], ["payment_status"])
+                    for finance_id in marked_ids
+                ])
+                marked += len(marked_ids)
+                db.commit()
+                done += len(chunk)
+                ctx.progress(done)
+
+    return {"marked_overdue": marked, "as_of": as_of.isoformat()}
+
+
+@job_handler("recurring_expenses")
+def recurring_expenses(ctx: JobContext) -> dict:
+    """
+    Generate the society finance entries of recurring templates that have
+    come due, and advance each template's next_due_date.
+
+    Payload: optionally society_id (default all societies) and as_of
+    (default today). A template that is several periods behind gets one
+    entry per missed period. Each template's entries and its new
+    next_due_date are committed together, so a retry never duplicates them.
+    """
+    society_id = _payload_society_id(ctx)
+    as_of = _payload_date(ctx, "as_of", date.today())
+
+    # Scan every shard first so progress has a total
+    templates_by_shard = {}
+    for shard in _ledger_shards(society_id):
+        with _ledger_db(ctx, shard) as db:
+            query = db.query(models.SocietyFinance.id).filter(
+                models.SocietyFinance.recurring == True,
+                models.SocietyFinance.is_active == True,
+                models.SocietyFinance.next_due_date <= as_of,
+            )
+            if society_id is not None:
+                query = query.filter(models.SocietyFinance.society_id == society_id)
+            templates_by_shard[shard] = [row.id for row in query.order_by(models.SocietyFinance.id).all()]
+    template_count = sum(len(template_ids) for template_ids in templates_by_shard.values())
+    ctx.progress(0, template_count)
+
+    created = skipped = done = 0
+    for shard, template_ids in templates_by_shard.items():
+        with _ledger_db(ctx, shard) as db:
+            for chunk in _chunks(template_ids):
+                templates = (
+                    db.query(models.SocietyFinance)
+                    .filter(models.SocietyFinance.id.in_(chunk))
+                    .with_for_update(skip_locked=True)
+                    .all()
+                )
+                for template in templates:
+                    months = FREQUENCY_MONTHS.get((template.recurring_frequency or "").lower())
+                    if months is None:
+                        skipped += 1
+                        continue
+                    while template.next_due_date is not None and template.next_due_date <= as_of:
+                        db.add(models.SocietyFinance(
+                            society_id=template.society_id,
+                            expense_type=template.expense_type,
+                            category=template.category,
+                            vendor_name=template.vendor_name,
+                            expense_date=template.next_due_date,
+                            amount=template.amount,
+                            currency=template.currency,
+                            payment_status="pending",
+                            description=template.description,
+                            transaction_category=template.transaction_category,
+                        ))
+                        created += 1
+                        template.next_due_date = add_months(template.next_due_date, months, day=template.expense_date.day)
+                db.commit()
+                done += len(chunk)
+                ctx.progress(done)
+
+    return {"templates": template_count, "created": created, "skipped": skipped, "as_of": as_of.isoformat()}
+
+
+@job_handler("finance_archive")
+def finance_archive(ctx: JobContext) -> dict:
+    """
+    Move soft-deleted finance records, and settled records dated before
+    closed_before, from the hot tables into the archive tables.
+
+    Payload: optionally society_id (default all societies) and
+    closed_before (default the start of the oldest financial year kept, see
+    archive.py). Records are moved in committed batches of JOB_CHUNK_SIZE,
+    so a retry continues where a failed run stopped.
+    """
+    society_id = _payload_society_id(ctx)
+    closed_before = _payload_date(ctx, "closed_before", archive_cutoff())
+
+    def condition(model):
+        if society_id is None:
+            return archivable(model, closed_before)
+        if model is models.ResidentFinance:
+            in_society = model.resident_id.in_(
+                select(models.Resident.id).where(models.Resident.society_id == society_id)
+            )
+        else:
+            in_society = model.society_id == society_id
+        return archivable(model, closed_before) & in_society
+
+    # Count on every shard first so progress has a total
+    counts = {}
+    for shard in _ledger_shards(society_id):
+        with _ledger_db(ctx, shard) as db:
+            for model in (models.ResidentFinance, models.SocietyFinance):
+                counts[(shard, model)] = db.query(func.count()).select_from(model).filter(condition(model)).scalar()
+    ctx.progress(0, sum(counts.values()))
+
+    archived = {models.ResidentFinance: 0, models.SocietyFinance: 0}
+    done = 0
+    for shard in _ledger_shards(society_id):
+        with _ledger_db(ctx, shard) as db:
+            for model in archived:
+                if not counts[(shard, model)]:
+                    continue
+                while True:
+                    moved = archive_batch(db, model, condition(model), JOB_CHUNK_SIZE)
+                    db.commit()
+                    archived[model] += moved
+                    done += moved
+                    ctx.progress(done)
+                    if moved < JOB_CHUNK_SIZE:
+                        break
+
+    return {
+        "resident_finances": archived[models.ResidentFinance],
+        "society_finances": archived[models.SocietyFinance],
+        "closed_before": closed_before.isoformat(),
+    }
+
+
+@job_handler("society_purge")
+def society_purge(ctx: JobContext) -> dict:
+    """
+    Delete a society too large to delete in one request (see purge.py).
+
+    Payload: society_id. Its ledgers, archives and residents are deleted in
+    committed batches of JOB_CHUNK_SIZE, children first, so a retry
+    continues where a failed run stopped. The society goes last, on its
+    shard and then in the directory, with whatever rows are left. Every
+    deleted row is recorded in the change outbox.
+    """
+    society_id = _payload_society_id(ctx, required=True)
+    shard = shard_map.shard_for(society_id)
+    deleted = {model: 0 for model in PURGE_ORDER}
+    with _ledger_db(ctx, shard) as db:
+        counts = {
+            model: db.query(func.count()).select_from(model).filter(society_rows(model, society_id)).scalar()
+            for model in PURGE_ORDER
+        }
+        ctx.progress(0, sum(counts.values()))
+
+        done = 0
+        for model in PURGE_ORDER:
+            if not counts[model]:
+                continue
+            while True:
+                purged = purge_batch(db, model, society_id, JOB_CHUNK_SIZE)
+                db.commit()
+                deleted[model] += purged
+                done += purged
+                ctx.progress(done)
+                if purged < JOB_CHUNK_SIZE:
+                    break
+
+        society = db.get(models.Society, society_id)
+        if society is not None:
+            delete_dependents(db, society_id)
+            db.delete(society)
+            db.commit()
+    # The directory copy, once the shard no longer needs the placement it records
+    if shard != DEFAULT_SHARD:
+        directory_society = ctx.db.get(models.Society, society_id)
+        if directory_society is not None:
+            delete_dependents(ctx.db, society_id)
+            ctx.db.delete(directory_society)
+            ctx.db.commit()
+
+    result = {model.__tablename__: count for model, count in deleted.items()}
+    result["society_deleted"] = society is not None
+    return result
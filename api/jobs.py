@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Persistent background jobs backed by the jobs table.
+
+Request handlers enqueue work (billing runs, overdue sweeps, recurring
+expenses) and return immediately; job workers claim queued rows with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of worker processes can
+run side by side without claiming the same job twice. Failed jobs are
+retried with exponential backoff. Workers refresh the locks of the jobs
+they are running, and jobs whose worker died are requeued once their lock
+goes stale.
+
+Usage:
+    python jobs.py worker [--concurrency N]          # process jobs until SIGTERM
+    python jobs.py enqueue billing_run '{"society_id": "...", "amount": "2500"}'
+    python jobs.py status                              # job counts by kind and status
+"""
+
+import os
+import sys
+import signal
+import socket
+import logging
+import threading
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+from uuid import UUID
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+import models
+import events  # noqa: F401  publishes change events for job writes (EVENTS_BACKEND=postgres)
+from database import SessionLocal
+from outbox import Dispatcher
+from partitions import ensure_partitions, FINANCE_PARTITION_CHECK_HOURS
+from sharding import shard_engines
+
+# Configuration
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A running job whose lock is not refreshed for this long is assumed dead and requeued
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv("JOB_LOCK_TIMEOUT_SECONDS", "300"))
+# How often a worker refreshes the locks of the jobs it is running
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LOCK_TIMEOUT_SECONDS / 3)))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (RUNNING, CANCELLING)
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+logger = logging.getLogger(__name__)
+
+HANDLERS: Dict[str, Callable] = {}
+
+
+def job_handler(kind: str) -> Callable:
+    """
+    Register a function as the handler for a job kind:
+
+        @job_handler("billing_run")
+        def billing_run(ctx: JobContext) -> dict:
+
+    The handler commits its own work, reports progress with ctx.progress()
+    and returns a JSON-serializable result. It may run more than once for
+    the same job (retries, requeued stale locks), so it must be idempotent.
+    """
+    def decorator(func: Callable) -> Callable:
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def _load_handlers():
+    # Registers the built-in handlers
+    import job_handlers  # noqa: F401
+
+
+class UnknownJobKind(ValueError):
+    pass
+
+
+class PermanentJobError(Exception):
+    """Raise from a handler to fail the job without retrying, e.g. for an invalid payload."""
+
+
+class JobCancelled(Exception):
+    """Raised from JobContext.progress() when the job has been cancelled."""
+
+
+class JobContext:
+    """What a handler gets: the job's payload, a session and progress reporting."""
+
+    def __init__(self, job: models.Job, db: Session):
+        self.job_id = job.id
+        self.kind = job.kind
+        self.society_id = job.society_id
+        self.payload = dict(job.payload or {})
+        self.attempt = job.attempts
+        self.db = db
+
+    def progress(self, done: int, total: Optional[int] = None):
+        """
+        Record progress. Uses its own short transaction so progress is visible while the handler's work is still
+        uncommitted. Raises JobCancelled if the job was cancelled meanwhile.
+        """
+        values = {"progress_done": done, "locked_at": func.now()}
+        if total is not None:
+            values["progress_total"] = total
+        with SessionLocal() as db:
+            status = db.execute(
+                update(models.Job).where(models.Job.id == self.job_id).values(**values).returning(models.Job.status)
+            ).scalar()
+            db.commit()
+        if status == CANCELLING:
+            raise JobCancelled()
+
+
+class _Heartbeat:
+    """
+    Refreshes a running job's lock from a background thread, so a handler
+    that spends longer than JOB_LOCK_TIMEOUT_SECONDS between progress
+    reports is not taken for dead and run a second time. The thread dies
+    with its worker, which lets the lock go stale as before.
+    """
+
+    def __init__(self, job_id: UUID, worker_id: str, interval: float = JOB_HEARTBEAT_SECONDS):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with SessionLocal() as db:
+                    db.query(models.Job).filter(
+                        models.Job.id == self.job_id, models.Job.locked_by == self.worker_id
+                    ).update({"locked_at": func.now()}, synchronize_session=False)
+                    db.commit()
+            except Exception:
+                logger.exception("Refreshing the lock of job %s failed", self.job_id)
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[dict] = None,
+    society_id: Optional[UUID] = None,
+    run_at=None,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+) -> models.Job:
+    """
+    Add a job to the queue. The caller commits, so a job can be enqueued in
+    the same transaction as the change that triggered it.
+    """
+    _load_handlers()
+    if kind not in HANDLERS:
+        raise UnknownJobKind(f"Unknown job kind '{kind}'; available kinds are {', '.join(sorted(HANDLERS))}")
+    job = models.Job(
+        kind=kind,
+        payload=payload or {},
+        society_id=society_id,
+        run_at=run_at if run_at is not None else func.now(),
+        max_attempts=max_attempts,
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def claim_next(db: Session, worker_id: str) -> Optional[models.Job]:
+    """
+    Claim the oldest due job. SKIP LOCKED makes concurrent workers pass over
+    rows another worker is claiming instead of waiting for them.
+    """
+    job = (
+        db.query(models.Job)
+        .filter(models.Job.status == QUEUED, models.Job.run_at <= func.now())
+        .order_by(models.Job.run_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.rollback()
+        return None
+    job.status = RUNNING
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.locked_at = func.now()
+    job.started_at = job.started_at or func.now()
+    job.error = None
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+def _finish(job_id: UUID, worker_id: str, **values):
+    # Only the worker holding the lock may finish the job; a requeued job
+    # may already belong to another worker
+    with SessionLocal() as db:
+        db.query(models.Job).filter(
+            models.Job.id == job_id, models.Job.locked_by == worker_id
+        ).update(dict(values, locked_by=None, locked_at=None), synchronize_session=False)
+        db.commit()
+
+
+def run_job(job: models.Job, worker_id: str):
+    """Run a claimed job's handler and record the outcome."""
+    _load_handlers()
+    handler = HANDLERS.get(job.kind)
+    with SessionLocal() as db:
+        try:
+            if handler is None:
+                raise UnknownJobKind(f"No handler registered for job kind '{job.kind}'")
+            with _Heartbeat(job.id, worker_id):
+                result = handler(JobContext(job, db))
+        except JobCancelled:
+            db.rollback()
+            _finish(job.id, worker_id, status=CANCELLED, finished_at=func.now())
+            logger.info("Job %s (%s) cancelled", job.id, job.kind)
+            return
+        except Exception as e:
+            db.rollback()
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts < job.max_attempts and not isinstance(e, (UnknownJobKind, PermanentJobError)):
+                delay = _retry_delay(job.attempts)
+                _finish(job.id, worker_id, status=QUEUED, error=error, run_at=func.now() + delay)
+                logger.warning("Job %s (%s) attempt %d failed, retrying in %ss: %s", job.id, job.kind, job.attempts, delay.total_seconds(), error)
+            else:
+                _finish(job.id, worker_id, status=FAILED, error=error, finished_at=func.now())
+                logger.error("Job %s (%s) failed after %d attempt(s): %s", job.id, job.kind, job.attempts, error)
+            return
+    _finish(job.id, worker_id, status=SUCCEEDED, result=result, finished_at=func.now())
+    logger.info("Job %s (%s) succeeded", job.id, job.kind)
+
+
+def requeue_stale(db: Session, lock_timeout: int = JOB_LOCK_TIMEOUT_SECONDS) -> int:
+    """Requeue running jobs whose worker stopped refreshing the lock (crashed or was killed)."""
+    stale = (
+        db.query(models.Job)
+        .filter(
+            models.Job.status.in_(ACTIVE_STATUSES),
+            models.Job.locked_at < func.now() - timedelta(seconds=lock_timeout),
+        )
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in stale:
+        if job.status == CANCELLING:
+            job.status = CANCELLED
+            job.finished_at = func.now()
+        elif job.attempts >= job.max_attempts:
+            job.status = FAILED
+            job.error = f"Worker {job.locked_by} stopped responding"
+            job.finished_at = func.now()
+        else:
+            job.status = QUEUED
+            job.run_at = func.now()
+        job.locked_by = None
+        job.locked_at = None
+    db.commit()
+    return len(stale)
+
+
+def cancel(db: Session, job: models.Job) -> models.Job:
+    """Cancel a queued job at once; a running job stops at its next progress report."""
+    if job.status == QUEUED:
+        job.status = CANCELLED
+        job.finished_at = func.now()
+    elif job.status == RUNNING:
+        job.status = CANCELLING
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def retry(db: Session, job: models.Job) -> models.Job:
+    """Queue a failed or cancelled job again with a fresh set of attempts."""
+    job.status = QUEUED
+    job.attempts = 0
+    job.error = None
+    job.result = None
+    job.progress_done = 0
+    job.run_at = func.now()
+    job.finished_at = None
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+class Worker:
+    """
+    Runs jobs in `concurrency` threads, each claiming one job at a time.
+    Start several worker processes, on one machine or many, to process
+    jobs in parallel.
+    """
+
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY, poll_seconds: float = JOB_POLL_SECONDS):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        # Shared outbox subscribers, outbox purging and finance partition
+        # upkeep run alongside the jobs
+        self.dispatcher = Dispatcher()
+
+    def _loop(self, slot: int):
+        worker_id = f"{self.worker_id}:{slot}"
+        while not self.stopping.is_set():
+            try:
+                with SessionLocal() as db:
+                    job = claim_next(db, worker_id)
+            except Exception:
+                logger.exception("Claiming a job failed")
+                job = None
+            if job is None:
+                self.stopping.wait(self.poll_seconds)
+                continue
+            run_job(job, worker_id)
+
+    def _reaper(self):
+        while not self.stopping.wait(max(JOB_LOCK_TIMEOUT_SECONDS / 4, self.poll_seconds)):
+            try:
+                with SessionLocal() as db:
+                    requeued = requeue_stale(db)
+                if requeued:
+                    logger.warning("Requeued %d job(s) with stale locks", requeued)
+            except Exception:
+                logger.exception("Requeueing stale jobs failed")
+
+    def _partitions(self):
+        # Finance partitions for the coming periods, on every shard
+        while True:
+            for shard, engine in shard_engines.items():
+                try:
+                    ensure_partitions(engine)
+                except Exception:
+                    logger.exception("Creating finance partitions on shard %s failed", shard)
+            if self.stopping.wait(FINANCE_PARTITION_CHECK_HOURS * 3600):
+                return
+
+    def stop(self, *args):
+        logger.info("Stopping after the jobs in progress finish")
+        self.stopping.set()
+        self.dispatcher.stop()
+
+    def run(self):
+        _load_handlers()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        threads = [threading.Thread(target=self._loop, args=(slot,), name=f"job-worker-{slot}") for slot in range(self.concurrency)]
+        threads.append(threading.Thread(target=self._reaper, name="job-reaper", daemon=True))
+        threads.append(threading.Thread(target=self._partitions, name="finance-partitions", daemon=True))
+        threads.append(threading.Thread(target=self.dispatcher.run, name="outbox-dispatcher"))
+        for thread in threads:
+            thread.start()
+        logger.info("Job worker %s started with %d thread(s) for: %s", self.worker_id, self.concurrency, ", ".join(sorted(HANDLERS)))
+        # Wake up periodically so signals are handled promptly
+        while not self.stopping.wait(1):
+            pass
+        for thread in threads:
+            if not thread.daemon:
+                thread.join()
+
+
+def main(argv=None):
+    import json
+    import argparse
+    parser = argparse.ArgumentParser(description="Nivra background jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Process jobs until stopped")
+    worker_parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    enqueue_parser = subparsers.add_parser("enqueue", help="Add a job to the queue")
+    enqueue_parser.add_argument("kind")
+    enqueue_parser.add_argument("payload", nargs="?", default="{}", help="JSON object")
+    subparsers.add_parser("status", help="Show job counts by kind and status")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "worker":
+        Worker(args.concurrency).run()
+        return 0
+
+    if args.command == "enqueue":
+        payload = json.loads(args.payload)
+        with SessionLocal() as db:
+            society_id = UUID(payload["society_id"]) if payload.get("society_id") else None
+            job = enqueue(db, args.kind, payload, society_id=society_id)
+            db.commit()
+            print(f"Enqueued job {job.id}")
+        return 0
+
+    if args.command == "status":
+        with SessionLocal() as db:
+            rows = (
+                db.query(models.Job.kind, models.Job.status, func.count())
+                .group_by(models.Job.kind, models.Job.status)
+                .order_by(models.Job.kind, models.Job.status)
+                .all()
+            )
+        for kind, status, count in rows:
+            print(f"{kind}: {status} {count}")
+        if not rows:
+            print("No jobs.")
+        return 0
+
+
+if __name__ == "__main__":
+    # Run the imported module rather than __main__, so handlers registered by
+    # job_handlers (which imports jobs) land in the same HANDLERS registry
+    import jobs
+    sys.exit(jobs.main())
@@ -0,0 +1,184 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+import models
+
+PENDING = "pending"
+APPROVED = "approved"
+REJECTED = "rejected"
+CANCELLED = "cancelled"
+
+MAX_PENDING_PAGE_SIZE = 200
+
+
+def encode_cursor(request: models.SocietyJoinRequest) -> str:
+    """Encode a request's (created_at, id) position as an opaque cursor."""
+    return f"{request.created_at.isoformat()}|{request.id}"
+
+
+def parse_cursor(value: str) -> Tuple[datetime, UUID]:
+    """Parse a cursor returned by pending_page(); raises ValueError if malformed."""
+    created_at, _, request_id = value.partition("|")
+    return datetime.fromisoformat(created_at), UUID(request_id)
+
+
+def pending_page(db: Session, society_id: UUID, after: Optional[str], limit: int) -> Tuple[List[tuple], Optional[str]]:
+    """
+    One page of a society's pending requests, oldest first, with the
+    requesting user's name and email. Pages are keyed on (created_at, id),
+    so each page is a range scan of idx_society_join_requests_pending
+    however deep the queue is, and requests approved between pages do not
+    shift later ones.
+    """
+    query = (
+        db.query(models.SocietyJoinRequest, models.User.username, models.User.email, models.User.full_name)
+        .join(models.User, models.User.id == models.SocietyJoinRequest.user_id)
+        .filter(
+            models.SocietyJoinRequest.society_id == society_id,
+            models.SocietyJoinRequest.status == PENDING,
+        )
+    )
+    if after:
+        query = query.filter(
+            tuple_(models.SocietyJoinRequest.created_at, models.SocietyJoinRequest.id) > tuple_(*parse_cursor(after))
+        )
+    # One extra row tells whether there is a next page
+    rows = query.order_by(models.SocietyJoinRequest.created_at, models.SocietyJoinRequest.id).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][0])
+
+
+def _split_name(full_name: str) -> Tuple[str, str]:
+    first_name, _, last_name = full_name.strip().partition(" ")
+    return first_name, last_name.strip()
+
+
+def _undo_approvals(db: Session, approved: List[Tuple[UUID, UUID, Optional[str]]]):
+    """Return approved requests to pending and unlink their users, after their residents failed to commit."""
+    if not approved:
+        return
+    requests = db.query(models.SocietyJoinRequest).filter(
+        models.SocietyJoinRequest.id.in_([request_id for request_id, _, _ in approved])
+    ).all()
+    for request in requests:
+        request.status = PENDING
+        request.reviewed_by = None
+        request.reviewed_at = None
+        request.review_message = None
+    users = {user.id: user for user in db.query(models.User).filter(models.User.id.in_([user_id for _, user_id, _ in approved]))}
+    for _, user_id, user_status in approved:
+        user = users[user_id]
+        user.resident_id = None
+        user.resident_society_id = None
+        user.user_status = user_status
+    db.commit()
+
+
+def review(
+    db: Session,
+    society_id: UUID,
+    request_ids: List[UUID],
+    approve: bool,
+    reviewed_by: Optional[UUID] = None,
+    review_message: Optional[str] = None,
+    residents_db: Optional[Session] = None
+) -> Tuple[List[models.SocietyJoinRequest], List[dict]]:
+    """
+    Approve or reject pending requests of a society in one transaction.
+
+    Approving a request creates the resident for the requested unit and
+    links the user to it. Requests that cannot be reviewed (unknown, no
+    longer pending, or a user who is already a resident) are skipped and
+    reported; the rest are committed together. The requests and their users
+    are locked, so concurrent reviews of the same request cannot both
+    succeed.
+
+    For a society on another shard, pass a session on that shard as
+    residents_db. The reviews and user links are committed in the main
+    database first, then the residents on the shard; if the shard commit
+    fails, the approvals are undone in the main database and the error is
+    raised, so no user is left linked to a resident that was never created.
+    """
+    residents_db = residents_db if residents_db is not None else db
+    requests = {
+        request.id: request for request in
+        db.query(models.SocietyJoinRequest)
+        .filter(models.SocietyJoinRequest.id.in_(request_ids), models.SocietyJoinRequest.society_id == society_id)
+        .order_by(models.SocietyJoinRequest.id)
+        .with_for_update()
+        .all()
+    }
+    users = {}
+    if approve:
+        user_ids = [request.user_id for request in requests.values() if request.status == PENDING]
+        users = {
+            user.id: user for user in
+            db.query(models.User).filter(models.User.id.in_(user_ids)).order_by(models.User.id).with_for_update().all()
+        }
+
+    now = datetime.utcnow()
+    reviewed, skipped = [], []
+    # (request, user, user_status before approval) for undoing shard approvals
+    approved = []
+    for request_id in dict.fromkeys(request_ids):
+        request = requests.get(request_id)
+        if request is None:
+            skipped.append({"id": request_id, "code": "NOT_FOUND", "message": "Join request not found in this society"})
+            continue
+        if request.status != PENDING:
+            skipped.append({"id": request_id, "code": "NOT_PENDING", "message": f"Join request is already {request.status}"})
+            continue
+
+        if approve:
+            user = users[request.user_id]
+            if user.resident_id is not None:
+                skipped.append({"id": request_id, "code": "ALREADY_RESIDENT", "message": "User is already linked to a resident"})
+                continue
+            if not request.requested_unit_number:
+                skipped.append({"id": request_id, "code": "UNIT_REQUIRED", "message": "Join request has no unit number"})
+                continue
+            first_name, last_name = _split_name(user.full_name)
+            resident = models.Resident(
+                society_id=society_id,
+                first_name=first_name,
+                last_name=last_name,
+                email=user.email,
+                unit_number=request.requested_unit_number,
+                is_owner=bool(request.is_owner),
+            )
+            if residents_db is db:
+                user.resident = resident
+            else:
+                residents_db.add(resident)
+                residents_db.flush()
+                user.resident_id = resident.id
+                approved.append((request.id, user.id, user.user_status))
+            user.resident_society_id = society_id
+            user.user_status = "active"
+
+        request.status = APPROVED if approve else REJECTED
+        request.reviewed_by = reviewed_by
+        request.reviewed_at = now
+        request.review_message = review_message
+        reviewed.append(request)
+
+    db.commit()
+    if residents_db is not db:
+        try:
+            residents_db.commit()
+        except Exception:
+            residents_db.rollback()
+            _undo_approvals(db, approved)
+            raise
+    if reviewed:
+        # Reload the expired requests with one query rather than one each
+        db.query(models.SocietyJoinRequest).filter(
+            models.SocietyJoinRequest.id.in_([request.id for request in reviewed])
+        ).all()
+    return reviewed, skipped
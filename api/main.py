@@ -1,19 +1,81 @@
+if __name__ == "__main__":
+    # Production launcher; pass --reload for a single auto-reloading development
+    # process. It runs before the imports below: database.py sizes its pools
+    # from the worker count when first imported, and serve.py settles that
+    # count first
+    import sys
+    import serve
+    try:
+        serve.main()
+    except Exception as e:
+        print(f"Error starting server: {e}")
+    sys.exit()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from endpoints import society, resident, finance, user, role, permission, society_admin, auth, society_finance, resident_finance
-from database import engine
-import models
+from endpoints import society, resident, finance, user, role, permission, society_admin, auth, society_finance, resident_finance, sync, batch, health, job, society_events, join_request
+from database import async_engine
+from compression import CompressionMiddleware
+from idempotency import IdempotencyMiddleware
+from admission import AdmissionControlMiddleware
+from ratelimit import RateLimitMiddleware
+from executors import configure_executors
+from events import start_events
+from outbox import start_outbox
+from tenancy import row_level_security_error_handler
+from sqlalchemy.exc import ProgrammingError
+from migrate import verify_schema
+from sharding import shard_engines
+from warmup import run_warmup
+
+# Check that the database is at the latest migration (one query); tables are
+# created and changed by migrations (python migrate.py upgrade), not at import.
+# Every shard database is checked, the main one first
+for shard_engine in shard_engines.values():
+    verify_schema(shard_engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_executors()
+    events_task = start_events()
+    outbox_task = start_outbox()
+    # Warm pools, caches and compiled queries in the background; /readyz reports when done
+    warmup_task = asyncio.create_task(run_warmup(app))
+    yield
+    warmup_task.cancel()
+    if events_task is not None:
+        events_task.cancel()
+    if outbox_task is not None:
+        outbox_task.cancel()
+    await async_engine.dispose()
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Nivra API",
     description="Backend API for Nivra - Society Management System",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Writes rejected by a row-level security policy (TENANT_RLS=true) return 403
+app.add_exception_handler(ProgrammingError, row_level_security_error_handler)
+
+# Replay stored responses for retried finance POSTs carrying an Idempotency-Key
+app.add_middleware(IdempotencyMiddleware)
+
+# Shed load with 503 + Retry-After when the worker or its DB pool is saturated,
+# shedding heavy report requests before writes and writes before auth/reads
+app.add_middleware(AdmissionControlMiddleware)
+
+# Token-bucket limits per caller and per society, with stricter budgets for
+# reports, exports and imports; over-budget requests get 429 before they are
+# admitted or reach the database
+app.add_middleware(RateLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +85,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (gzip/brotli); thresholds are configured via environment
+app.add_middleware(CompressionMiddleware)
+
 # Include routers for existing resources
 app.include_router(society.router, prefix="/api/v1", tags=["Societies"])
 app.include_router(resident.router, prefix="/api/v1", tags=["Residents"])
@@ -33,10 +98,20 @@ app.include_router(user.router, prefix="/api/v1", tags=["Users"])
 app.include_router(role.router, prefix="/api/v1", tags=["Roles"])
 app.include_router(permission.router, prefix="/api/v1", tags=["Permissions"])
 app.include_router(society_admin.router, prefix="/api/v1", tags=["Society Admins"])
+app.include_router(join_request.router, prefix="/api/v1", tags=["Join Requests"])
 app.include_router(auth.router, prefix="/api/v1", tags=["Authentication"])
 app.include_router(society_finance.router, prefix="/api/v1", tags=["Society Finances"])
 app.include_router(resident_finance.router, prefix="/api/v1", tags=["Resident Finances"])
 
+# Include routers for mobile and offline clients
+app.include_router(sync.router, prefix="/api/v1", tags=["Sync"])
+app.include_router(batch.router, prefix="/api/v1", tags=["Batch"])
+app.include_router(job.router, prefix="/api/v1", tags=["Jobs"])
+app.include_router(society_events.router, prefix="/api/v1", tags=["Events"])
+
+# Include probes for load balancers and orchestrators (no prefix)
+app.include_router(health.router, tags=["Health"])
+
 
 @app.get("/", tags=["Root"])
 def read_root():
@@ -45,11 +120,3 @@ def read_root():
         "documentation": "/docs",
     }
 
-
-if __name__ == "__main__":
-    import uvicorn
-    print("Starting FastAPI server on http://localhost:8000")
-    try:
-        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
-    except Exception as e:
-        print(f"Error starting server: {e}")
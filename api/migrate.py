@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for the Nivra database.
+
+Migrations are plain SQL files in migrations/, named NNNN_description.sql and
+applied in order. Each applied version is recorded in schema_migrations with
+a checksum of the file and the schema hash of models.py at the time, so the
+API can verify at startup, with a single query, that the database is at the
+latest version and was migrated for the models it is running.
+
+Usage:
+    python migrate.py status              # applied and pending migrations
+    python migrate.py upgrade             # apply pending migrations
+    python migrate.py check               # compare the live schema with models.py
+    python migrate.py new add_some_table  # create the next migration file
+"""
+
+import os
+import re
+import sys
+import hashlib
+import logging
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import UniqueConstraint, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+# Configuration
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "warn")  # strict, warn or off
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "false").lower() == "true"
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+# Arbitrary constant so concurrent migrators (several deploys at once) queue up
+MIGRATION_LOCK_ID = 4_817_263
+
+logger = logging.getLogger(__name__)
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum VARCHAR(64) NOT NULL,
+    schema_hash VARCHAR(64) NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+class SchemaError(RuntimeError):
+    """Raised at startup when SCHEMA_CHECK=strict and the database is not at the expected schema."""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+    @property
+    def sql(self) -> str:
+        with open(self.path, encoding="utf-8") as f:
+            return f.read()
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise SchemaError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _metadata():
+    import models
+    return models.Base.metadata
+
+
+def schema_fingerprint(metadata=None) -> str:
+    """
+    SHA-256 over a canonical description of the tables, columns, indexes and
+    constraints declared in models.py. Computed in-process, without the database.
+    """
+    metadata = metadata if metadata is not None else _metadata()
+    dialect = postgresql.dialect()
+    lines = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        lines.append(f"table {table.name}")
+        for column in table.columns:
+            lines.append(
+                f"column {column.name} {column.type.compile(dialect=dialect)} "
+                f"nullable={column.nullable} primary_key={column.primary_key}"
+            )
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            where = index.dialect_options["postgresql"].get("where")
+            where_sql = str(where.compile(dialect=dialect, compile_kwargs={"literal_binds": True})) if where is not None else ""
+            lines.append(f"index {index.name} ({', '.join(c.name for c in index.columns)}) unique={index.unique} where={where_sql}")
+        for columns in sorted(_unique_constraints(table)):
+            lines.append(f"unique ({', '.join(columns)})")
+        for foreign_key in sorted(table.foreign_keys, key=lambda fk: fk.parent.name):
+            lines.append(f"foreign_key {foreign_key.parent.name} -> {foreign_key.target_fullname} ondelete={foreign_key.ondelete}")
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def _unique_constraints(table) -> set:
+    return {
+        tuple(sorted(column.name for column in constraint.columns))
+        for constraint in table.constraints
+        if isinstance(constraint, UniqueConstraint)
+    }
+
+
+def applied_migrations(connection) -> dict:
+    connection.execute(text(CREATE_MIGRATIONS_TABLE))
+    rows = connection.execute(text("SELECT version, name, checksum FROM schema_migrations ORDER BY version")).all()
+    return {row.version: row for row in rows}
+
+
+def upgrade(engine, migrations: Optional[List[Migration]] = None) -> List[Migration]:
+    """
+    Apply pending migrations, each in its own transaction. Returns the
+    migrations that were applied.
+    """
+    migrations = migrations if migrations is not None else load_migrations()
+    schema_hash = schema_fingerprint()
+    applied = []
+    with engine.connect() as connection:
+        with connection.begin():
+            connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+            done = applied_migrations(connection)
+        for migration in migrations:
+            if migration.version in done:
+                continue
+            with connection.begin():
+                connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+                # Another process may have applied it while this one waited for the lock
+                already = connection.execute(
+                    text("SELECT 1 FROM schema_migrations WHERE version = :version"), {"version": migration.version}
+                ).first()
+                if already:
+                    continue
+                connection.exec_driver_sql(migration.sql)
+                connection.execute(
+                    text(
+                        "INSERT INTO schema_migrations (version, name, checksum, schema_hash) "
+                        "VALUES (:version, :name, :checksum, :schema_hash)"
+                    ),
+                    {"version": migration.version, "name": migration.name, "checksum": migration.checksum, "schema_hash": schema_hash},
+                )
+            applied.append(migration)
+    return applied
+
+
+def schema_status(engine) -> List[str]:
+    """
+    Fast startup check: one query comparing the newest applied migration and
+    its recorded schema hash against the migration files and models.py.
+    Returns a list of problems, empty when the schema is current.
+    """
+    migrations = load_migrations()
+    if not migrations:
+        return []
+    latest = migrations[-1]
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(
+                text("SELECT version, schema_hash FROM schema_migrations ORDER BY version DESC LIMIT 1")
+            ).first()
+    except ProgrammingError:
+        row = None
+
+    if row is None:
+        return ["No migrations have been applied; run: python migrate.py upgrade"]
+    problems = []
+    if row.version < latest.version:
+        problems.append(f"Database is at migration {row.version:04d}, latest is {latest.version:04d}; run: python migrate.py upgrade")
+    elif row.version > latest.version:
+        problems.append(f"Database is at migration {row.version:04d}, newer than this code ({latest.version:04d})")
+    elif row.schema_hash != schema_fingerprint():
+        problems.append("models.py has changed since the last migration was applied; add a migration for the change")
+    return problems
+
+
+def verify_schema(engine, mode: str = SCHEMA_CHECK, auto_migrate: bool = SCHEMA_AUTO_MIGRATE) -> bool:
+    """
+    Startup hook replacing create_all. With SCHEMA_AUTO_MIGRATE=true pending
+    migrations are applied first (development). With SCHEMA_CHECK=strict any
+    problem, including an unreachable database, stops the app from starting.
+    """
+    if mode == "off" and not auto_migrate:
+        return True
+    try:
+        if auto_migrate:
+            for migration in upgrade(engine):
+                logger.warning("Applied migration %04d_%s", migration.version, migration.name)
+        if mode == "off":
+            return True
+        problems = schema_status(engine)
+    except OperationalError as e:
+        if mode == "strict":
+            raise
+        logger.warning("Schema check skipped, database unavailable: %s", str(e.orig).strip())
+        return False
+
+    for problem in problems:
+        logger.warning("Schema check: %s", problem)
+    if problems and mode == "strict":
+        raise SchemaError("; ".join(problems))
+    return not problems
+
+
+def find_drift(engine, metadata=None) -> List[str]:
+    """
+    Compare the live database catalog with models.py: missing tables, columns,
+    indexes and unique constraints on either side, and nullability
+    differences. Tables without a model (views, schema_migrations) are ignored.
+    """
+    metadata = metadata if metadata is not None else _metadata()
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    problems = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        if table.name not in existing_tables:
+            problems.append(f"table {table.name}: missing from the database")
+            continue
+
+        db_columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            db_column = db_columns.get(column.name)
+            if db_column is None:
+                problems.append(f"table {table.name}: column {column.name} missing from the database")
+            elif db_column["nullable"] != column.nullable:
+                problems.append(
+                    f"table {table.name}: column {column.name} is "
+                    f"{'NULL' if db_column['nullable'] else 'NOT NULL'} in the database, "
+                    f"{'NULL' if column.nullable else 'NOT NULL'} in models.py"
+                )
+        for name in sorted(set(db_columns) - set(table.columns.keys())):
+            problems.append(f"table {table.name}: column {name} exists in the database but not in models.py")
+
+        db_indexes = {
+            index["name"]: index for index in inspector.get_indexes(table.name)
+            if not index.get("duplicates_constraint")
+        }
+        model_indexes = {index.name: index for index in table.indexes}
+        for name in sorted(set(model_indexes) - set(db_indexes)):
+            problems.append(f"table {table.name}: index {name} missing from the database")
+        for name in sorted(set(db_indexes) - set(model_indexes)):
+            problems.append(f"table {table.name}: index {name} exists in the database but not in models.py")
+        for name in sorted(set(db_indexes) & set(model_indexes)):
+            model_columns = [column.name for column in model_indexes[name].columns]
+            if db_indexes[name]["column_names"] != model_columns:
+                problems.append(
+                    f"table {table.name}: index {name} is on ({', '.join(db_indexes[name]['column_names'])}) "
+                    f"in the database, ({', '.join(model_columns)}) in models.py"
+                )
+
+        db_unique = {tuple(sorted(constraint["column_names"])) for constraint in inspector.get_unique_constraints(table.name)}
+        model_unique = _unique_constraints(table)
+        for columns in sorted(model_unique - db_unique):
+            problems.append(f"table {table.name}: unique constraint on ({', '.join(columns)}) missing from the database")
+        for columns in sorted(db_unique - model_unique):
+            problems.append(f"table {table.name}: unique constraint on ({', '.join(columns)}) exists in the database but not in models.py")
+    return problems
+
+
+def new_migration(name: str, directory: str = MIGRATIONS_DIR) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+    if not slug:
+        raise ValueError("Migration name must contain letters or digits")
+    migrations = load_migrations(directory)
+    version = migrations[-1].version + 1 if migrations else 1
+    path = os.path.join(directory, f"{version:04d}_{slug}.sql")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"-- Migration {version:04d}: {name}\n-- Keep models.py and db/complete_schema.sql in step with this file.\n\n")
+    return path
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Nivra database migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Show applied and pending migrations")
+    subparsers.add_parser("upgrade", help="Apply pending migrations")
+    subparsers.add_parser("check", help="Compare the live schema with models.py")
+    new_parser = subparsers.add_parser("new", help="Create the next migration file")
+    new_parser.add_argument("name")
+    args = parser.parse_args(argv)
+
+    if args.command == "new":
+        print(f"Created {new_migration(args.name)}")
+        return 0
+
+    # Every shard database has the full schema and is migrated the same way
+    from sharding import shard_engines
+
+    failed = False
+    for shard, engine in shard_engines.items():
+        if len(shard_engines) > 1:
+            print(f"[{shard}]")
+        failed = _run_command(args.command, engine) or failed
+    return 1 if failed else 0
+
+
+def _run_command(command: str, engine) -> int:
+    if command == "upgrade":
+        applied = upgrade(engine)
+        for migration in applied:
+            print(f"Applied {migration.version:04d}_{migration.name}")
+        print("Database is up to date." if not applied else f"Applied {len(applied)} migration(s).")
+        # Give rows left in the default partitions (e.g. by migration 0008) their own
+        from partitions import ensure_partitions
+        for name in ensure_partitions(engine):
+            print(f"Created partition {name}")
+        return 0
+
+    if command == "status":
+        with engine.begin() as connection:
+            done = applied_migrations(connection)
+        for migration in load_migrations():
+            row = done.get(migration.version)
+            if row is None:
+                state = "pending"
+            elif row.checksum != migration.checksum:
+                state = "applied, file modified since"
+            else:
+                state = "applied"
+            print(f"{migration.version:04d}_{migration.name}: {state}")
+        problems = schema_status(engine)
+        for problem in problems:
+            print(problem)
+        return 1 if problems else 0
+
+    problems = find_drift(engine)
+    for problem in problems:
+        print(problem)
+    print("Schema matches models.py." if not problems else f"{len(problems)} difference(s) found.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+-- Migration 0002: jobs
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Background jobs, claimed by job workers with SELECT ... FOR UPDATE SKIP LOCKED
+CREATE TABLE jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    kind VARCHAR(50) NOT NULL, -- handler name, e.g. billing_run
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'cancelling', 'succeeded', 'failed', 'cancelled'
+    society_id UUID REFERENCES societies(id) ON DELETE CASCADE,
+    payload JSONB NOT NULL DEFAULT '{}',
+    result JSONB,
+    error TEXT,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP, -- not claimed before this time
+    locked_by VARCHAR(255), -- worker id while running
+    locked_at TIMESTAMP WITH TIME ZONE, -- refreshed on progress; stale locks are requeued
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER update_jobs_updated_at
+    BEFORE UPDATE ON jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Workers claim the oldest due job; only queued rows are indexed
+CREATE INDEX idx_jobs_claim ON jobs(run_at) WHERE status = 'queued';
+CREATE INDEX idx_jobs_locked_at ON jobs(locked_at) WHERE status IN ('running', 'cancelling');
+CREATE INDEX idx_jobs_society_id ON jobs(society_id);
+CREATE INDEX idx_jobs_kind_status ON jobs(kind, status);
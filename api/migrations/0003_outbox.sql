@@ -0,0 +1,25 @@
+-- Migration 0003: outbox
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Change events written in the same transaction as the change itself
+CREATE TABLE outbox_events (
+    id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(), -- writing transaction; events are read in (txid, id) order
+    entity VARCHAR(50) NOT NULL, -- e.g. resident_finance
+    entity_id UUID NOT NULL,
+    op VARCHAR(10) NOT NULL, -- 'created', 'updated', 'deleted'
+    society_id UUID,
+    changed JSONB, -- names of the changed columns, for updates
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Read position of each shared outbox subscriber
+CREATE TABLE outbox_cursors (
+    subscriber VARCHAR(100) PRIMARY KEY,
+    last_txid BIGINT NOT NULL DEFAULT 0,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_outbox_events_txid_id ON outbox_events(txid, id);
+CREATE INDEX idx_outbox_events_created_at ON outbox_events(created_at);
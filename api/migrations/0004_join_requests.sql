@@ -0,0 +1,13 @@
+-- Migration 0004: join_requests
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- UNIQUE (user_id, society_id, status) also stopped a user from having two
+-- rejected requests for a society; only one pending request is meant to be
+-- prevented, which a partial unique index does
+ALTER TABLE society_join_requests DROP CONSTRAINT IF EXISTS society_join_requests_user_id_society_id_status_key;
+CREATE UNIQUE INDEX idx_society_join_requests_one_pending ON society_join_requests(user_id, society_id) WHERE status = 'pending';
+
+-- The approval queue of a society, oldest first; only pending rows are indexed.
+-- Replaces the index on status alone, which most rows (reviewed ones) filled
+CREATE INDEX idx_society_join_requests_pending ON society_join_requests(society_id, created_at, id) WHERE status = 'pending';
+DROP INDEX IF EXISTS idx_society_join_requests_status;
@@ -0,0 +1,58 @@
+-- Migration 0005: row_level_security
+-- Keep db/complete_schema.sql in step with this file. Policies are not
+-- modelled in models.py.
+
+-- Optional row-level security for TENANT_RLS=true. API requests of users
+-- restricted to some societies run as nivra_tenant with app.society_ids set
+-- for the transaction; the table owner (migrations, job workers, system
+-- admins) is not subject to the policies.
+
+-- Societies the current transaction may see, from app.society_ids ('{id,...}')
+CREATE OR REPLACE FUNCTION app_society_ids() RETURNS UUID[]
+LANGUAGE sql STABLE AS $$
+    SELECT coalesce(nullif(current_setting('app.society_ids', true), ''), '{}')::uuid[]
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'nivra_tenant') THEN
+        CREATE ROLE nivra_tenant NOLOGIN;
+    END IF;
+    -- Lets the API's login role switch to nivra_tenant with SET LOCAL ROLE
+    GRANT nivra_tenant TO CURRENT_USER;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'Could not create role nivra_tenant; TENANT_RLS needs a role with CREATEROLE to rerun this block';
+END
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'nivra_tenant') THEN
+        RETURN;
+    END IF;
+
+    GRANT USAGE ON SCHEMA public TO nivra_tenant;
+    GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA public TO nivra_tenant;
+    GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA public TO nivra_tenant;
+    ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO nivra_tenant;
+    ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT USAGE, SELECT ON SEQUENCES TO nivra_tenant;
+
+    -- The policies are plain society_id predicates, so the planner can use
+    -- the society_id indexes for them
+    ALTER TABLE residents ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON residents TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+
+    ALTER TABLE resident_finances ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON resident_finances TO nivra_tenant
+        USING (resident_id IN (SELECT id FROM residents WHERE society_id = ANY (app_society_ids())));
+
+    ALTER TABLE society_finances ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON society_finances TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+
+    ALTER TABLE society_admins ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON society_admins TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+END
+$$;
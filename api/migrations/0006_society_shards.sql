@@ -0,0 +1,20 @@
+-- Migration 0006: society_shards
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Shard of each society placed outside the main database (see sharding.py);
+-- societies without a row live on the default shard
+CREATE TABLE society_shards (
+    society_id UUID PRIMARY KEY REFERENCES societies(id) ON DELETE CASCADE,
+    shard VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER update_society_shards_updated_at
+    BEFORE UPDATE ON society_shards
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Users stay in the main database while residents of placed societies live
+-- on their shard, so the link cannot be a foreign key
+ALTER TABLE users DROP CONSTRAINT IF EXISTS users_resident_id_fkey;
@@ -0,0 +1,13 @@
+-- Migration 0007: rate_limit_buckets
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Token buckets shared by all workers (used when RATE_LIMIT_BACKEND=database).
+-- Unlogged: the table is rewritten on almost every request, and losing it in
+-- a crash only refills everyone's buckets
+CREATE UNLOGGED TABLE rate_limit_buckets (
+    key VARCHAR(200) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    capacity DOUBLE PRECISION NOT NULL,
+    rate DOUBLE PRECISION NOT NULL, -- tokens added per second
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
@@ -0,0 +1,147 @@
+-- Migration 0008: partition_finances
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- resident_finances and society_finances become range-partitioned by
+-- due_date and expense_date. This migration rebuilds both tables with only a
+-- DEFAULT partition, which receives every existing row; the yearly (or
+-- monthly) partitions are created by partitions.py, which migrate.py upgrade
+-- and job workers run, and which moves rows out of the DEFAULT partition
+-- into the partition created for them.
+
+-- ------------------------------------------------
+-- resident_finances
+-- ------------------------------------------------
+ALTER TABLE resident_finances RENAME TO resident_finances_unpartitioned;
+ALTER TABLE resident_finances_unpartitioned RENAME CONSTRAINT resident_finances_pkey TO resident_finances_unpartitioned_pkey;
+
+-- A primary key on a partitioned table must include the partition key, and
+-- due_date may be NULL, so id is indexed instead of being the primary key
+CREATE TABLE resident_finances (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    resident_id UUID NOT NULL REFERENCES residents(id),
+    transaction_type VARCHAR(50) NOT NULL, -- maintenance, penalty, special_charge, etc.
+    amount DECIMAL(10, 2) NOT NULL,
+    currency VARCHAR(3) DEFAULT 'INR',
+    due_date DATE,
+    payment_date DATE,
+    payment_method VARCHAR(50),
+    payment_status VARCHAR(20) DEFAULT 'pending', -- pending, paid, overdue, etc.
+    description TEXT,
+    invoice_number VARCHAR(100),
+    receipt_number VARCHAR(100),
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (due_date);
+
+-- Rows without a due date, and rows whose partition does not exist yet
+CREATE TABLE resident_finances_default PARTITION OF resident_finances DEFAULT;
+
+INSERT INTO resident_finances (
+    id, resident_id, transaction_type, amount, currency, due_date, payment_date, payment_method,
+    payment_status, description, invoice_number, receipt_number, is_active, created_at, updated_at
+)
+SELECT
+    id, resident_id, transaction_type, amount, currency, due_date, payment_date, payment_method,
+    payment_status, description, invoice_number, receipt_number, is_active, created_at, updated_at
+FROM resident_finances_unpartitioned;
+
+DROP TABLE resident_finances_unpartitioned;
+
+CREATE INDEX idx_resident_finances_id ON resident_finances(id);
+CREATE INDEX idx_resident_finances_resident_id ON resident_finances(resident_id);
+CREATE INDEX idx_resident_finances_payment_status ON resident_finances(payment_status);
+CREATE INDEX idx_resident_finances_due_date ON resident_finances(due_date);
+CREATE INDEX idx_resident_finances_updated_at ON resident_finances(updated_at, id);
+
+CREATE TRIGGER update_resident_finances_updated_at
+    BEFORE UPDATE ON resident_finances
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- ------------------------------------------------
+-- society_finances
+-- ------------------------------------------------
+ALTER TABLE society_finances RENAME TO society_finances_unpartitioned;
+ALTER TABLE society_finances_unpartitioned RENAME CONSTRAINT society_finances_pkey TO society_finances_unpartitioned_pkey;
+
+CREATE TABLE society_finances (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    society_id UUID NOT NULL REFERENCES societies(id),
+    expense_type VARCHAR(50) NOT NULL CHECK (expense_type IN ('income', 'expense', 'regular', 'adhoc', 'maintenance_fees', 'parking_fees', 'amenity_fees', 'late_fees', 'interest_income', 'rental_income', 'deposits', 'other_income')),
+    category VARCHAR(50) NOT NULL, -- security, housekeeping, gardener, electricity, water, event, maintenance, parking, etc.
+    vendor_name VARCHAR(255),
+    expense_date DATE NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    currency VARCHAR(3) DEFAULT 'INR',
+    payment_status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, paid, overdue, partially_paid
+    payment_date DATE,
+    payment_method VARCHAR(50),
+    invoice_number VARCHAR(100),
+    receipt_number VARCHAR(100),
+    description TEXT,
+    recurring BOOLEAN DEFAULT FALSE,
+    recurring_frequency VARCHAR(20), -- monthly, quarterly, annually, etc.
+    next_due_date DATE,
+    transaction_category VARCHAR(20) DEFAULT 'expense' CHECK (transaction_category IN ('income', 'expense')),
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT society_finances_pkey PRIMARY KEY (id, expense_date)
+) PARTITION BY RANGE (expense_date);
+
+-- Rows whose partition does not exist yet
+CREATE TABLE society_finances_default PARTITION OF society_finances DEFAULT;
+
+INSERT INTO society_finances (
+    id, society_id, expense_type, category, vendor_name, expense_date, amount, currency, payment_status,
+    payment_date, payment_method, invoice_number, receipt_number, description, recurring,
+    recurring_frequency, next_due_date, transaction_category, is_active, created_at, updated_at
+)
+SELECT
+    id, society_id, expense_type, category, vendor_name, expense_date, amount, currency, payment_status,
+    payment_date, payment_method, invoice_number, receipt_number, description, recurring,
+    recurring_frequency, next_due_date, transaction_category, is_active, created_at, updated_at
+FROM society_finances_unpartitioned;
+
+DROP TABLE society_finances_unpartitioned;
+
+CREATE INDEX idx_society_finances_society_id ON society_finances(society_id);
+CREATE INDEX idx_society_finances_category ON society_finances(category);
+CREATE INDEX idx_society_finances_expense_type ON society_finances(expense_type);
+CREATE INDEX idx_society_finances_expense_date ON society_finances(expense_date);
+CREATE INDEX idx_society_finances_payment_status ON society_finances(payment_status);
+CREATE INDEX idx_society_finances_transaction_category ON society_finances(transaction_category);
+CREATE INDEX idx_society_finances_updated_at ON society_finances(updated_at, id);
+
+CREATE TRIGGER update_society_finances_updated_at
+    BEFORE UPDATE ON society_finances
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+COMMENT ON COLUMN society_finances.transaction_category IS 'Categorizes whether this is an income or expense transaction';
+COMMENT ON COLUMN society_finances.expense_type IS 'For expenses: regular/adhoc. For income: type of income (maintenance_fees, parking_fees, etc.)';
+COMMENT ON COLUMN society_finances.category IS 'Detailed category - for expenses: security, housekeeping, etc. For income: maintenance, parking, amenities, etc.';
+
+-- ------------------------------------------------
+-- Row-level security (migration 0005) for the rebuilt tables
+-- ------------------------------------------------
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'nivra_tenant') THEN
+        RETURN;
+    END IF;
+
+    GRANT SELECT, INSERT, UPDATE, DELETE ON resident_finances, society_finances TO nivra_tenant;
+
+    -- Policies on the partitioned table apply to queries through it, which
+    -- is how the API reads and writes every partition
+    ALTER TABLE resident_finances ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON resident_finances TO nivra_tenant
+        USING (resident_id IN (SELECT id FROM residents WHERE society_id = ANY (app_society_ids())));
+
+    ALTER TABLE society_finances ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON society_finances TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+END
+$$;
@@ -0,0 +1,72 @@
+-- Migration 0009: finance_archive
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Soft-deleted finance records and settled records of closed financial
+-- years, moved out of the hot tables by the finance_archive job (see
+-- archive.py). Same columns as the hot tables, plus when each row moved.
+CREATE TABLE resident_finances_archive (
+    id UUID PRIMARY KEY,
+    resident_id UUID NOT NULL REFERENCES residents(id) ON DELETE CASCADE,
+    transaction_type VARCHAR(50) NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    currency VARCHAR(3),
+    due_date DATE,
+    payment_date DATE,
+    payment_method VARCHAR(50),
+    payment_status VARCHAR(20),
+    description TEXT,
+    invoice_number VARCHAR(100),
+    receipt_number VARCHAR(100),
+    is_active BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE society_finances_archive (
+    id UUID PRIMARY KEY,
+    society_id UUID NOT NULL REFERENCES societies(id) ON DELETE CASCADE,
+    expense_type VARCHAR(50) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    vendor_name VARCHAR(255),
+    expense_date DATE NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    currency VARCHAR(3),
+    payment_status VARCHAR(20) NOT NULL,
+    payment_date DATE,
+    payment_method VARCHAR(50),
+    invoice_number VARCHAR(100),
+    receipt_number VARCHAR(100),
+    description TEXT,
+    recurring BOOLEAN,
+    recurring_frequency VARCHAR(20),
+    next_due_date DATE,
+    transaction_category VARCHAR(20),
+    is_active BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_resident_finances_archive_resident_id ON resident_finances_archive(resident_id);
+CREATE INDEX idx_resident_finances_archive_due_date ON resident_finances_archive(due_date);
+CREATE INDEX idx_society_finances_archive_society_id ON society_finances_archive(society_id, expense_date);
+
+-- Row-level security (migration 0005), as on the hot tables
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'nivra_tenant') THEN
+        RETURN;
+    END IF;
+
+    GRANT SELECT, INSERT, UPDATE, DELETE ON resident_finances_archive, society_finances_archive TO nivra_tenant;
+
+    ALTER TABLE resident_finances_archive ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON resident_finances_archive TO nivra_tenant
+        USING (resident_id IN (SELECT id FROM residents WHERE society_id = ANY (app_society_ids())));
+
+    ALTER TABLE society_finances_archive ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON society_finances_archive TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+END
+$$;
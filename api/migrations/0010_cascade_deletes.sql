@@ -0,0 +1,38 @@
+-- Migration 0010: cascade_deletes
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Deleting a society or resident removes the rows that depend on it in the
+-- database, with ON DELETE CASCADE, instead of SQLAlchemy loading and
+-- deleting every child row (the relationships now use passive_deletes).
+-- Large societies are deleted by the society_purge job (purge.py).
+
+-- Migration 0008 created the partitioned tables while the tables they
+-- replaced still held the usual constraint names, so their foreign keys may
+-- be named *_fkey1; both names are dropped and the usual one is re-added
+ALTER TABLE resident_finances
+    DROP CONSTRAINT IF EXISTS resident_finances_resident_id_fkey,
+    DROP CONSTRAINT IF EXISTS resident_finances_resident_id_fkey1,
+    ADD CONSTRAINT resident_finances_resident_id_fkey
+        FOREIGN KEY (resident_id) REFERENCES residents(id) ON DELETE CASCADE;
+
+ALTER TABLE society_finances
+    DROP CONSTRAINT IF EXISTS society_finances_society_id_fkey,
+    DROP CONSTRAINT IF EXISTS society_finances_society_id_fkey1,
+    ADD CONSTRAINT society_finances_society_id_fkey
+        FOREIGN KEY (society_id) REFERENCES societies(id) ON DELETE CASCADE;
+
+ALTER TABLE residents
+    DROP CONSTRAINT IF EXISTS residents_society_id_fkey,
+    ADD CONSTRAINT residents_society_id_fkey
+        FOREIGN KEY (society_id) REFERENCES societies(id) ON DELETE CASCADE;
+
+ALTER TABLE society_admins
+    DROP CONSTRAINT IF EXISTS society_admins_society_id_fkey,
+    ADD CONSTRAINT society_admins_society_id_fkey
+        FOREIGN KEY (society_id) REFERENCES societies(id) ON DELETE CASCADE;
+
+ALTER TABLE society_join_requests
+    DROP CONSTRAINT IF EXISTS society_join_requests_society_id_fkey,
+    ADD CONSTRAINT society_join_requests_society_id_fkey
+        FOREIGN KEY (society_id) REFERENCES societies(id) ON DELETE CASCADE;
+
@@ -0,0 +1,5 @@
+-- Migration 0011: outbox_entity_index
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- /sync reads the changes of one entity type after a feed position
+CREATE INDEX idx_outbox_events_entity_txid_id ON outbox_events(entity, txid, id);
@@ -0,0 +1,35 @@
+-- Migration 0012: resident_finances_primary_key
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- resident_finances has had no primary key since it was partitioned by
+-- due_date (migration 0008): a primary key must include the partition key,
+-- and due_date could be NULL. due_date is now NOT NULL and (id, due_date) is
+-- the primary key, as (id, expense_date) is for society_finances.
+--
+-- Records without a due date are given the day they were created, and
+-- due_date_estimated marks the date as made up rather than agreed: the
+-- overdue sweep leaves such records alone, so this migration turns no
+-- record overdue. Setting a record's due date through the API clears the
+-- mark. Archived records get the same treatment, so every record has a
+-- due date.
+ALTER TABLE resident_finances
+    ADD COLUMN due_date_estimated BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE resident_finances_archive
+    ADD COLUMN due_date_estimated BOOLEAN NOT NULL DEFAULT false;
+
+UPDATE resident_finances
+SET due_date = COALESCE(created_at::date, CURRENT_DATE), due_date_estimated = true
+WHERE due_date IS NULL;
+UPDATE resident_finances_archive
+SET due_date = COALESCE(created_at::date, archived_at::date), due_date_estimated = true
+WHERE due_date IS NULL;
+
+ALTER TABLE resident_finances
+    ALTER COLUMN due_date SET DEFAULT CURRENT_DATE,
+    ALTER COLUMN due_date SET NOT NULL;
+
+ALTER TABLE resident_finances
+    ADD CONSTRAINT resident_finances_pkey PRIMARY KEY (id, due_date);
+
+-- The primary key's index serves lookups by id
+DROP INDEX IF EXISTS idx_resident_finances_id;
@@ -0,0 +1,16 @@
+-- Migration 0013: user_resident_society
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Society of the resident a user is linked to. Residents of placed
+-- societies live on their shard, so tenant scoping and society access
+-- checks read the user's society here, in the main database, instead of
+-- looking the resident up. Kept in step by the API; `python sharding.py
+-- memberships` fills it in for residents on other shards.
+ALTER TABLE users ADD COLUMN resident_society_id UUID;
+
+UPDATE users
+SET resident_society_id = residents.society_id
+FROM residents
+WHERE residents.id = users.resident_id;
+
+CREATE INDEX idx_users_resident_society_id ON users(resident_society_id);
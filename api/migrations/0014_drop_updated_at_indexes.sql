@@ -0,0 +1,10 @@
+-- Migration 0014: drop_updated_at_indexes
+-- Keep models.py and db/complete_schema.sql in step with this file.
+
+-- Delta sync reads the change outbox by (entity, txid, id) (migration 0011), so
+-- nothing reads these indexes any more; every write to the three tables
+-- still paid for maintaining them. Dropping the partitioned parents' indexes
+-- drops their partitions' indexes too.
+DROP INDEX IF EXISTS idx_residents_updated_at;
+DROP INDEX IF EXISTS idx_resident_finances_updated_at;
+DROP INDEX IF EXISTS idx_society_finances_updated_at;
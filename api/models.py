@@ -1,7 +1,7 @@
 import uuid
-from datetime import datetime
-from sqlalchemy import Column, String, Text, Integer, Boolean, Date, DateTime, Numeric, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from datetime import date, datetime
+from sqlalchemy import Column, String, Text, Integer, BigInteger, Boolean, Date, DateTime, Float, Numeric, ForeignKey, Index, LargeBinary, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -25,22 +25,27 @@ class Society(Base):
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Children are deleted by ON DELETE CASCADE in the database
+    # (passive_deletes), not loaded and deleted one by one
     # Define the relationship with residents
-    residents = relationship("Resident", back_populates="society", cascade="all, delete-orphan")
+    residents = relationship("Resident", back_populates="society", cascade="all, delete-orphan", passive_deletes=True)
     # Define relationship with society_admins
-    admins = relationship("SocietyAdmin", back_populates="society", cascade="all, delete-orphan")
+    admins = relationship("SocietyAdmin", back_populates="society", cascade="all, delete-orphan", passive_deletes=True)
     # Define relationship with society finances
-    finances = relationship("SocietyFinance", back_populates="society", cascade="all, delete-orphan")
+    finances = relationship("SocietyFinance", back_populates="society", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Resident(Base):
     __tablename__ = "residents"
+    __table_args__ = (
+        Index("idx_residents_society_id", "society_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id", ondelete="CASCADE"), nullable=False)
     first_name = Column(String(100), nullable=False)
     last_name = Column(String(100), nullable=False)
-    email = Column(String(255), unique=True)
+    email = Column(String(255))  # Not unique: family members may share an address
     phone = Column(String(20))
     unit_number = Column(String(50), nullable=False)
     is_owner = Column(Boolean, default=False)
@@ -52,22 +57,32 @@ class Resident(Base):
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    # Define the relationships
+    # Define the relationships; finances are deleted by ON DELETE CASCADE
     society = relationship("Society", back_populates="residents")
-    finances = relationship("ResidentFinance", back_populates="resident", cascade="all, delete-orphan")
+    finances = relationship("ResidentFinance", back_populates="resident", cascade="all, delete-orphan", passive_deletes=True)
     # Define relationship with User model
-    user = relationship("User", back_populates="resident", uselist=False)
+    user = relationship("User", back_populates="resident", uselist=False, primaryjoin="Resident.id == foreign(User.resident_id)")
 
 
 class ResidentFinance(Base):
     __tablename__ = "resident_finances"
+    # Range-partitioned by due_date (migration 0008, see partitions.py); the
+    # database's primary key is (id, due_date) (migration 0012)
+    __table_args__ = (
+        Index("idx_resident_finances_resident_id", "resident_id"),
+        Index("idx_resident_finances_payment_status", "payment_status"),
+        Index("idx_resident_finances_due_date", "due_date"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     resident_id = Column(UUID(as_uuid=True), ForeignKey("residents.id", ondelete="CASCADE"), nullable=False)
     transaction_type = Column(String(50), nullable=False)
     amount = Column(Numeric(10, 2), nullable=False)
     currency = Column(String(3), default="INR")
-    due_date = Column(Date)
+    due_date = Column(Date, nullable=False, default=date.today)
+    # The due date was filled in by migration 0012 rather than agreed; the
+    # overdue sweep leaves these records alone until a due date is set
+    due_date_estimated = Column(Boolean, nullable=False, default=False)
     payment_date = Column(Date)
     payment_method = Column(String(50))
     payment_status = Column(String(20), default="pending")
@@ -82,6 +97,33 @@ class ResidentFinance(Base):
     resident = relationship("Resident", back_populates="finances")
 
 
+
+class ArchivedResidentFinance(Base):
+    __tablename__ = "resident_finances_archive"
+    # Records moved out of resident_finances by the finance_archive job (archive.py)
+    __table_args__ = (
+        Index("idx_resident_finances_archive_resident_id", "resident_id"),
+        Index("idx_resident_finances_archive_due_date", "due_date"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    resident_id = Column(UUID(as_uuid=True), ForeignKey("residents.id", ondelete="CASCADE"), nullable=False)
+    transaction_type = Column(String(50), nullable=False)
+    amount = Column(Numeric(10, 2), nullable=False)
+    currency = Column(String(3))
+    due_date = Column(Date)
+    due_date_estimated = Column(Boolean, nullable=False, default=False)
+    payment_date = Column(Date)
+    payment_method = Column(String(50))
+    payment_status = Column(String(20))
+    description = Column(Text)
+    invoice_number = Column(String(100))
+    receipt_number = Column(String(100))
+    is_active = Column(Boolean)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
 # RBAC Models
 class Role(Base):
     __tablename__ = "roles"
@@ -99,6 +141,11 @@ class Role(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("idx_users_role_id", "role_id"),
+        Index("idx_users_resident_id", "resident_id"),
+        Index("idx_users_resident_society_id", "resident_society_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     username = Column(String(100), nullable=False, unique=True)
@@ -106,7 +153,11 @@ class User(Base):
     email = Column(String(255), nullable=False, unique=True)
     full_name = Column(String(255), nullable=False)
     role_id = Column(UUID(as_uuid=True), ForeignKey("roles.id"), nullable=False)
-    resident_id = Column(UUID(as_uuid=True), ForeignKey("residents.id"), nullable=True)
+    # No foreign key: the resident may live on another shard (see sharding.py)
+    resident_id = Column(UUID(as_uuid=True), nullable=True)
+    # The resident's society, so scoping never has to find the resident's shard
+    resident_society_id = Column(UUID(as_uuid=True), nullable=True)
+    user_status = Column(String(20), default="pending_society")  # pending_society, active, inactive
     is_active = Column(Boolean, default=True)
     last_login = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
@@ -114,7 +165,7 @@ class User(Base):
 
     # Define relationships
     role = relationship("Role", back_populates="users")
-    resident = relationship("Resident", back_populates="user")
+    resident = relationship("Resident", back_populates="user", primaryjoin="foreign(User.resident_id) == Resident.id")
     administered_societies = relationship("SocietyAdmin", back_populates="user", cascade="all, delete-orphan")
 
 
@@ -135,6 +186,11 @@ class Permission(Base):
 
 class RolePermission(Base):
     __tablename__ = "role_permissions"
+    __table_args__ = (
+        UniqueConstraint("role_id", "permission_id"),
+        Index("idx_role_permissions_role_id", "role_id"),
+        Index("idx_role_permissions_permission_id", "permission_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     role_id = Column(UUID(as_uuid=True), ForeignKey("roles.id"), nullable=False)
@@ -148,10 +204,15 @@ class RolePermission(Base):
 
 class SocietyAdmin(Base):
     __tablename__ = "society_admins"
+    __table_args__ = (
+        UniqueConstraint("user_id", "society_id"),
+        Index("idx_society_admins_user_id", "user_id"),
+        Index("idx_society_admins_society_id", "society_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id"), nullable=False)
+    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id", ondelete="CASCADE"), nullable=False)
     is_primary_admin = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -161,11 +222,52 @@ class SocietyAdmin(Base):
     society = relationship("Society", back_populates="admins")
 
 
+class SocietyJoinRequest(Base):
+    __tablename__ = "society_join_requests"
+    __table_args__ = (
+        # A user has at most one pending request per society
+        Index("idx_society_join_requests_one_pending", "user_id", "society_id", unique=True, postgresql_where=text("status = 'pending'")),
+        # The approval queue of a society, oldest first; only pending rows are indexed
+        Index("idx_society_join_requests_pending", "society_id", "created_at", "id", postgresql_where=text("status = 'pending'")),
+        Index("idx_society_join_requests_user_id", "user_id"),
+        Index("idx_society_join_requests_society_id", "society_id"),
+        Index("idx_society_join_requests_reviewed_by", "reviewed_by"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id", ondelete="CASCADE"), nullable=False)
+    request_type = Column(String(20), nullable=False, default="join")  # join, invite
+    requested_unit_number = Column(String(50))
+    is_owner = Column(Boolean, default=False)
+    request_message = Column(Text)
+    status = Column(String(20), nullable=False, default="pending")  # pending, approved, rejected, cancelled
+    reviewed_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    reviewed_at = Column(DateTime(timezone=True))
+    review_message = Column(Text)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Define relationships
+    user = relationship("User", foreign_keys=[user_id])
+    society = relationship("Society")
+
+
 class SocietyFinance(Base):
     __tablename__ = "society_finances"
+    # Range-partitioned by expense_date (migration 0008, see partitions.py);
+    # the database's primary key is (id, expense_date)
+    __table_args__ = (
+        Index("idx_society_finances_society_id", "society_id"),
+        Index("idx_society_finances_category", "category"),
+        Index("idx_society_finances_expense_type", "expense_type"),
+        Index("idx_society_finances_expense_date", "expense_date"),
+        Index("idx_society_finances_payment_status", "payment_status"),
+        Index("idx_society_finances_transaction_category", "transaction_category"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id"), nullable=False)
+    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id", ondelete="CASCADE"), nullable=False)
     expense_type = Column(String(50), nullable=False)  # regular, adhoc
     category = Column(String(50), nullable=False)  # security, housekeeping, etc.
     vendor_name = Column(String(255))
@@ -181,9 +283,138 @@ class SocietyFinance(Base):
     recurring = Column(Boolean, default=False)
     recurring_frequency = Column(String(20))  # monthly, quarterly, annually
     next_due_date = Column(Date)
+    transaction_category = Column(String(20), default="expense")  # income, expense
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Define relationships
     society = relationship("Society", back_populates="finances")
+
+
+
+class ArchivedSocietyFinance(Base):
+    __tablename__ = "society_finances_archive"
+    # Records moved out of society_finances by the finance_archive job (archive.py)
+    __table_args__ = (
+        Index("idx_society_finances_archive_society_id", "society_id", "expense_date"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id", ondelete="CASCADE"), nullable=False)
+    expense_type = Column(String(50), nullable=False)
+    category = Column(String(50), nullable=False)
+    vendor_name = Column(String(255))
+    expense_date = Column(Date, nullable=False)
+    amount = Column(Numeric(10, 2), nullable=False)
+    currency = Column(String(3))
+    payment_status = Column(String(20), nullable=False)
+    payment_date = Column(Date)
+    payment_method = Column(String(50))
+    invoice_number = Column(String(100))
+    receipt_number = Column(String(100))
+    description = Column(Text)
+    recurring = Column(Boolean)
+    recurring_frequency = Column(String(20))
+    next_due_date = Column(Date)
+    transaction_category = Column(String(20))
+    is_active = Column(Boolean)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+class SocietyShard(Base):
+    __tablename__ = "society_shards"
+
+    # Societies without a row live on the default shard
+    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(String(50), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    # Rewritten on almost every request; a crash only refills the buckets
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key = Column(String(200), primary_key=True)  # caller or society, and route class
+    tokens = Column(Float, nullable=False)
+    capacity = Column(Float, nullable=False)
+    rate = Column(Float, nullable=False)  # tokens added per second
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("idx_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    # SHA-256 of caller, method, path and the client's Idempotency-Key
+    key = Column(String(64), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the request body
+    status_code = Column(Integer)  # NULL while the original request is in progress
+    response_headers = Column(Text)
+    response_body = Column(LargeBinary)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers claim the oldest due job; only queued rows are indexed
+        Index("idx_jobs_claim", "run_at", postgresql_where=text("status = 'queued'")),
+        Index("idx_jobs_locked_at", "locked_at", postgresql_where=text("status IN ('running', 'cancelling')")),
+        Index("idx_jobs_society_id", "society_id"),
+        Index("idx_jobs_kind_status", "kind", "status"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String(50), nullable=False)  # handler name, e.g. billing_run
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, cancelling, succeeded, failed, cancelled
+    society_id = Column(UUID(as_uuid=True), ForeignKey("societies.id", ondelete="CASCADE"))
+    payload = Column(JSONB, nullable=False, default=dict)
+    result = Column(JSONB)
+    error = Column(Text)
+    progress_done = Column(Integer, nullable=False, default=0)
+    progress_total = Column(Integer)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    locked_by = Column(String(255))
+    locked_at = Column(DateTime(timezone=True))
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Events are read in (txid, id) order
+        Index("idx_outbox_events_txid_id", "txid", "id"),
+        Index("idx_outbox_events_created_at", "created_at"),
+        # Delta sync reads one entity type at a time
+        Index("idx_outbox_events_entity_txid_id", "entity", "txid", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    txid = Column(BigInteger, nullable=False, server_default=text("txid_current()"))  # writing transaction
+    entity = Column(String(50), nullable=False)  # e.g. resident_finance
+    entity_id = Column(UUID(as_uuid=True), nullable=False)
+    op = Column(String(10), nullable=False)  # created, updated, deleted
+    society_id = Column(UUID(as_uuid=True))
+    changed = Column(JSONB)  # names of the changed columns, for updates
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+class OutboxCursor(Base):
+    __tablename__ = "outbox_cursors"
+
+    subscriber = Column(String(100), primary_key=True)
+    last_txid = Column(BigInteger, nullable=False, default=0)
+    last_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
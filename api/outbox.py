@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Transactional outbox of row changes.
+
+Every flush that creates, updates or deletes a tracked row also inserts an
+outbox_events row in the same transaction, so the feed contains exactly the
+committed changes. Bulk INSERT/UPDATE statements, which bypass the ORM unit
+of work, record their changes with record_changes().
+
+Subscribers read the feed in order:
+
+- shared subscribers (outbox_subscriber(name, shared=True)) have a cursor in
+  outbox_cursors and are run by the dispatcher in the job worker or
+  `python outbox.py dispatch`. A batch and the cursor advance commit
+  together, so delivery is at least once, and exactly once for handlers
+  that only write to the database through the session they are given.
+- local subscribers run in every API worker process and start at the
+  current end of the feed; they keep per-process caches and connected
+  clients up to date with writes made by other processes.
+
+Events are read in (txid, id) order and only once no older transaction is
+still running, so an event committed late is never skipped.
+
+Each shard (sharding.py) has its own feed, written in the transactions of
+the changes on that shard. Subscribers read every shard's feed, with a
+cursor per shard; events of different shards are not ordered relative to
+each other, and event ids are only unique within a shard.
+
+Usage:
+    python outbox.py dispatch    # run shared subscribers until stopped
+    python outbox.py status      # subscriber positions and backlog
+    python outbox.py purge       # delete events older than OUTBOX_RETENTION_HOURS
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Collection, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import event, func, inspect, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+import models
+from sharding import shard_engines, shard_session, fan_out
+
+# Configuration
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Events older than this are purged once every shared subscriber has read them
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "72"))
+
+logger = logging.getLogger(__name__)
+
+# Models whose changes are recorded, by entity name
+TRACKED_MODELS = {
+    models.Society: "society",
+    models.Resident: "resident",
+    models.ResidentFinance: "resident_finance",
+    models.SocietyFinance: "society_finance",
+    models.SocietyAdmin: "society_admin",
+    models.SocietyJoinRequest: "society_join_request",
+    models.Role: "role",
+    models.Permission: "permission",
+    models.RolePermission: "role_permission",
+}
+# Columns whose change alone is not worth an event
+IGNORED_COLUMNS = {"updated_at"}
+
+
+class Change(NamedTuple):
+    op: str  # created, updated, deleted
+    entity: str
+    entity_id: UUID
+    society_id: Optional[UUID]
+    changed: Optional[List[str]] = None
+
+
+class Subscriber(NamedTuple):
+    name: str
+    handler: Callable
+    shared: bool
+
+
+SUBSCRIBERS: Dict[str, Subscriber] = {}
+_change_listeners: List[Callable] = []
+
+
+def outbox_subscriber(name: str, shared: bool = False) -> Callable:
+    """
+    Register an outbox subscriber. Handlers receive a batch of events as
+    dicts (id, entity, entity_id, op, society_id, changed, at):
+
+        @outbox_subscriber("events")
+        def publish(events): ...                 # local: runs on each API worker's event loop
+
+        @outbox_subscriber("balances", shared=True)
+        def update_balances(db, events): ...     # shared: runs once, commits with the cursor
+    """
+    def decorator(handler: Callable) -> Callable:
+        SUBSCRIBERS[name] = Subscriber(name, handler, shared)
+        return handler
+    return decorator
+
+
+def on_changes(listener: Callable) -> Callable:
+    """Register listener(session, changes) to be called with each flush's changes, before commit."""
+    _change_listeners.append(listener)
+    return listener
+
+
+def resident_society_ids(session: Session, resident_ids: Iterable[UUID]) -> Dict[UUID, UUID]:
+    resident_ids = set(resident_ids)
+    if not resident_ids:
+        return {}
+    rows = session.execute(
+        select(models.Resident.id, models.Resident.society_id).where(models.Resident.id.in_(resident_ids))
+    ).all()
+    return {resident_id: society_id for resident_id, society_id in rows}
+
+
+def record_changes(session: Session, changes: List[Change]):
+    """Record changes in the outbox in the session's transaction and tell the change listeners."""
+    if not changes:
+        return
+    if OUTBOX_ENABLED:
+        now = datetime.utcnow()
+        # Core insert: this may run inside a flush, where ORM statements are not allowed
+        session.connection().execute(models.OutboxEvent.__table__.insert(), [
+            {
+                "entity": change.entity,
+                "entity_id": change.entity_id,
+                "op": change.op,
+                "society_id": change.society_id,
+                "changed": change.changed,
+                "created_at": now,
+            }
+            for change in changes
+        ])
+    for listener in _change_listeners:
+        listener(session, changes)
+
+
+def _changed_columns(obj) -> List[str]:
+    state = inspect(obj)
+    return sorted(
+        attr.key for attr in state.mapper.column_attrs
+        if attr.key not in IGNORED_COLUMNS and state.attrs[attr.key].history.has_changes()
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_changes(session, flush_context):
+    # new/dirty/deleted and attribute history still show the flushed state here
+    flushed = []
+    for op, objects in (("created", session.new), ("updated", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            entity = TRACKED_MODELS.get(type(obj))
+            if entity is None:
+                continue
+            changed = _changed_columns(obj) if op == "updated" else None
+            if op == "updated" and not changed:
+                continue
+            flushed.append((op, entity, obj, changed))
+    if not flushed:
+        return
+
+    resident_societies = resident_society_ids(
+        session, (obj.resident_id for _, _, obj, _ in flushed if isinstance(obj, models.ResidentFinance))
+    )
+    changes = []
+    for op, entity, obj, changed in flushed:
+        if isinstance(obj, models.Society):
+            society_id = obj.id
+        elif isinstance(obj, models.ResidentFinance):
+            society_id = resident_societies.get(obj.resident_id)
+        else:
+            society_id = getattr(obj, "society_id", None)
+        changes.append(Change(op, entity, obj.id, society_id, changed))
+    record_changes(session, changes)
+
+
+# Reading the feed
+
+def _settled():
+    # Only rows from transactions older than every transaction still running;
+    # a running transaction may yet commit rows that sort before them
+    return models.OutboxEvent.txid < func.txid_snapshot_xmin(func.txid_current_snapshot())
+
+
+def _after(cursor: Tuple[int, int]):
+    return tuple_(models.OutboxEvent.txid, models.OutboxEvent.id) > tuple_(cursor[0], cursor[1])
+
+
+def _batch_query(cursor: Tuple[int, int], limit: int):
+    return (
+        select(models.OutboxEvent)
+        .where(_after(cursor), _settled())
+        .order_by(models.OutboxEvent.txid, models.OutboxEvent.id)
+        .limit(limit)
+    )
+
+
+def _head_query():
+    return (
+        select(models.OutboxEvent.txid, models.OutboxEvent.id)
+        .where(_settled())
+        .order_by(models.OutboxEvent.txid.desc(), models.OutboxEvent.id.desc())
+        .limit(1)
+    )
+
+
+def feed_head(db: Session) -> Tuple[int, int]:
+    """Position of the newest settled event, or (0, 0) for an empty feed."""
+    head = db.execute(_head_query()).first()
+    return (head.txid, head.id) if head else (0, 0)
+
+
+def retains(db: Session, position: Tuple[int, int]) -> bool:
+    """Whether the event at a feed position has not been purged yet."""
+    if position == (0, 0):
+        return True
+    return db.execute(
+        select(models.OutboxEvent.id).where(
+            models.OutboxEvent.txid == position[0], models.OutboxEvent.id == position[1]
+        )
+    ).first() is not None
+
+
+def entity_changes(
+    db: Session,
+    entity: str,
+    after: Tuple[int, int],
+    until: Tuple[int, int],
+    limit: int,
+    society_ids: Optional[Collection[UUID]] = None,
+) -> List[models.OutboxEvent]:
+    """
+    Settled events of one entity after a position and up to another, in feed
+    order, of the given societies (None for every society).
+    """
+    query = select(models.OutboxEvent).where(
+        models.OutboxEvent.entity == entity,
+        _after(after),
+        ~_after(until),
+    )
+    if society_ids is not None:
+        query = query.where(models.OutboxEvent.society_id.in_(society_ids))
+    return db.execute(
+        query.order_by(models.OutboxEvent.txid, models.OutboxEvent.id).limit(limit)
+    ).scalars().all()
+
+
+def as_event(row: models.OutboxEvent) -> dict:
+    return {
+        "id": row.id,
+        "entity": row.entity,
+        "entity_id": str(row.entity_id),
+        "op": row.op,
+        "society_id": str(row.society_id) if row.society_id else None,
+        "changed": row.changed,
+        "at": row.created_at.isoformat() if row.created_at else None,
+    }
+
+
+class OutboxTail:
+    """Feeds local subscribers in an API worker, starting at the end of each shard's feed."""
+
+    def __init__(self, poll_seconds: float = OUTBOX_POLL_SECONDS, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.cursors: Dict[str, Tuple[int, int]] = {}
+        self.delivered = 0
+
+    def _deliver(self, events: List[dict]):
+        for subscriber in SUBSCRIBERS.values():
+            if subscriber.shared:
+                continue
+            try:
+                subscriber.handler(events)
+            except Exception:
+                logger.exception("Outbox subscriber %s failed", subscriber.name)
+        self.delivered += len(events)
+
+    def _read(self, db: Session) -> List[dict]:
+        """The next batch of the feed of db's shard; advances the shard's cursor."""
+        shard = db.info["shard"]
+        if shard not in self.cursors:
+            self.cursors[shard] = feed_head(db)
+        rows = db.execute(_batch_query(self.cursors[shard], self.batch_size)).scalars().all()
+        if rows:
+            self.cursors[shard] = (rows[-1].txid, rows[-1].id)
+        return [as_event(row) for row in rows]
+
+    async def poll(self) -> int:
+        """Deliver the next batch of every shard's feed; returns the size of the largest."""
+        # The shards are read concurrently, off the event loop
+        batches = await asyncio.to_thread(fan_out, shard_engines, self._read)
+        for events in batches.values():
+            if events:
+                self._deliver(events)
+        return max(len(events) for events in batches.values())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": OUTBOX_ENABLED,
+            "cursors": {shard: list(cursor) for shard, cursor in self.cursors.items()},
+            "delivered": self.delivered,
+        }
+
+    async def run(self):
+        while True:
+            try:
+                # Keep reading without a pause while there is a backlog
+                if await self.poll() == self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Reading the outbox failed: %s", e)
+            await asyncio.sleep(self.poll_seconds)
+
+
+outbox_tail = OutboxTail()
+
+
+def start_outbox() -> Optional[asyncio.Task]:
+    """Start feeding local subscribers in this API worker."""
+    if not OUTBOX_ENABLED or not any(not subscriber.shared for subscriber in SUBSCRIBERS.values()):
+        return None
+    return asyncio.create_task(outbox_tail.run())
+
+
+def dispatch_batch(db: Session, subscriber: Subscriber, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Deliver the next batch of events of db's shard to a shared subscriber
+    and advance its cursor, kept on the same shard, in the same transaction.
+    The cursor row is locked with SKIP LOCKED, so concurrent dispatchers
+    never deliver the same batch twice.
+    """
+    cursor = (
+        db.query(models.OutboxCursor)
+        .filter(models.OutboxCursor.subscriber == subscriber.name)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if cursor is None:
+        # Either another dispatcher holds the cursor or this is a new
+        # subscriber; a new one starts at the oldest retained event
+        db.execute(pg_insert(models.OutboxCursor).values(subscriber=subscriber.name).on_conflict_do_nothing())
+        db.commit()
+        return 0
+    rows = db.execute(_batch_query((cursor.last_txid, cursor.last_id), batch_size)).scalars().all()
+    if not rows:
+        db.rollback()
+        return 0
+    try:
+        subscriber.handler(db, [as_event(row) for row in rows])
+    except Exception:
+        db.rollback()
+        raise
+    cursor.last_txid, cursor.last_id = rows[-1].txid, rows[-1].id
+    db.commit()
+    return len(rows)
+
+
+def purge(db: Session, retention_hours: int = OUTBOX_RETENTION_HOURS) -> int:
+    """Delete events past retention that every shared subscriber has read."""
+    query = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.created_at < datetime.utcnow() - timedelta(hours=retention_hours)
+    )
+    shared = [subscriber.name for subscriber in SUBSCRIBERS.values() if subscriber.shared]
+    if shared:
+        positions = db.query(models.OutboxCursor.last_txid, models.OutboxCursor.last_id).filter(
+            models.OutboxCursor.subscriber.in_(shared)
+        ).all()
+        if len(positions) < len(shared):
+            # A subscriber that has never run would still read everything
+            db.rollback()
+            return 0
+        slowest = min(positions)
+        query = query.filter(~_after(slowest))
+    deleted = query.delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+class Dispatcher:
+    """Runs the shared subscribers and purges old events, until stopped."""
+
+    def __init__(self, poll_seconds: float = OUTBOX_POLL_SECONDS, purge_every_seconds: float = 3600):
+        self.poll_seconds = poll_seconds
+        self.purge_every_seconds = purge_every_seconds
+        self.stopping = threading.Event()
+
+    def run_once(self) -> int:
+        delivered = 0
+        for shard in shard_engines:
+            for subscriber in list(SUBSCRIBERS.values()):
+                if not subscriber.shared:
+                    continue
+                try:
+                    with shard_session(shard) as db:
+                        delivered += dispatch_batch(db, subscriber)
+                except Exception:
+                    logger.exception(
+                        "Outbox subscriber %s failed on shard %s; the batch will be retried", subscriber.name, shard
+                    )
+        return delivered
+
+    def run(self):
+        last_purge = 0.0
+        while not self.stopping.is_set():
+            if time.monotonic() - last_purge >= self.purge_every_seconds:
+                last_purge = time.monotonic()
+                for shard in shard_engines:
+                    try:
+                        with shard_session(shard) as db:
+                            purged = purge(db)
+                        if purged:
+                            logger.info("Purged %d outbox event(s) on shard %s", purged, shard)
+                    except Exception:
+                        logger.exception("Purging the outbox of shard %s failed", shard)
+            if not self.run_once():
+                self.stopping.wait(self.poll_seconds)
+
+    def stop(self, *args):
+        self.stopping.set()
+
+
+def main(argv=None):
+    import signal
+    import argparse
+    parser = argparse.ArgumentParser(description="Nivra change outbox")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("dispatch", help="Run shared subscribers until stopped")
+    subparsers.add_parser("status", help="Show subscriber positions and backlog")
+    subparsers.add_parser("purge", help="Delete events older than OUTBOX_RETENTION_HOURS")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "dispatch":
+        dispatcher = Dispatcher()
+        signal.signal(signal.SIGTERM, dispatcher.stop)
+        signal.signal(signal.SIGINT, dispatcher.stop)
+        logger.info("Dispatching to: %s", ", ".join(name for name, s in SUBSCRIBERS.items() if s.shared) or "no shared subscribers")
+        dispatcher.run()
+        return 0
+
+    for shard in shard_engines:
+        if len(shard_engines) > 1:
+            print(f"[{shard}]")
+        with shard_session(shard) as db:
+            if args.command == "purge":
+                print(f"Purged {purge(db)} event(s).")
+                continue
+            total = db.query(func.count(models.OutboxEvent.id)).scalar()
+            print(f"{total} event(s) in the outbox.")
+            for cursor in db.query(models.OutboxCursor).order_by(models.OutboxCursor.subscriber):
+                backlog = db.query(func.count(models.OutboxEvent.id)).filter(
+                    _after((cursor.last_txid, cursor.last_id))
+                ).scalar()
+                print(f"{cursor.subscriber}: {backlog} event(s) behind")
+    return 0
+
+
+if __name__ == "__main__":
+    # Run the imported module so subscribers registered elsewhere share its registry
+    import outbox
+    sys.exit(outbox.main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Range partitions of the finance ledgers.
+
+resident_finances is partitioned by due_date and society_finances by
+expense_date (migration 0008), one partition per year or month. Queries that
+filter on those dates read only the partitions in range, and old years can
+be detached in a moment instead of being deleted row by row.
+
+Each table has a DEFAULT partition for rows whose partition does not exist
+yet. ensure_partitions() creates the current period and
+FINANCE_PARTITIONS_AHEAD periods after it, plus a partition for every period
+that has rows waiting in the DEFAULT partition, moving those rows across.
+migrate.py upgrade runs it after migrating, and job workers run it on start
+and every FINANCE_PARTITION_CHECK_HOURS.
+
+Usage:
+    python partitions.py status                                  # partitions of each table and their row estimates
+    python partitions.py ensure                                  # create upcoming and missing partitions
+    python partitions.py detach resident_finances --before 2020-01-01
+"""
+
+import os
+import re
+import sys
+import logging
+from datetime import date
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import text
+
+# Configuration
+FINANCE_PARTITION_INTERVAL = os.getenv("FINANCE_PARTITION_INTERVAL", "year")  # year or month
+# Periods created ahead of the current one
+FINANCE_PARTITIONS_AHEAD = int(os.getenv("FINANCE_PARTITIONS_AHEAD", "2"))
+FINANCE_PARTITION_CHECK_HOURS = float(os.getenv("FINANCE_PARTITION_CHECK_HOURS", "6"))
+
+# Partitioned tables and their partition key
+PARTITIONED_TABLES = {
+    "resident_finances": "due_date",
+    "society_finances": "expense_date",
+}
+# Arbitrary constant so concurrent job workers do not create the same partition
+PARTITION_LOCK_ID = 4_817_264
+
+BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+logger = logging.getLogger(__name__)
+
+
+class Partition(NamedTuple):
+    name: str
+    start: Optional[date]  # None for the DEFAULT partition
+    end: Optional[date]  # exclusive
+    estimated_rows: int = 0
+
+    @property
+    def is_default(self) -> bool:
+        return self.start is None
+
+
+def period_start(day: date, interval: str = FINANCE_PARTITION_INTERVAL) -> date:
+    if interval == "month":
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def next_period(start: date, interval: str = FINANCE_PARTITION_INTERVAL) -> date:
+    if interval == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return date(start.year + 1, 1, 1)
+
+
+def partition_name(table: str, start: date, interval: str = FINANCE_PARTITION_INTERVAL) -> str:
+    return f"{table}_{start:%Y_%m}" if interval == "month" else f"{table}_{start:%Y}"
+
+
+def _parse_bound(value: str, unbounded: date) -> date:
+    value = value.strip()
+    if value in ("MINVALUE", "MAXVALUE"):
+        return unbounded
+    return date.fromisoformat(value.strip("'"))
+
+
+def list_partitions(connection, table: str) -> List[Partition]:
+    """Partitions of a table, ranged ones by start date and the DEFAULT partition last."""
+    rows = connection.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) AS bound, child.reltuples
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:table)
+    """), {"table": table}).all()
+    partitions = []
+    for name, bound, reltuples in rows:
+        estimated_rows = max(int(reltuples), 0)  # -1 until the partition is first analyzed
+        match = BOUND_PATTERN.search(bound)
+        if match is None:
+            partitions.append(Partition(name, None, None, estimated_rows))
+        else:
+            start, end = _parse_bound(match.group(1), date.min), _parse_bound(match.group(2), date.max)
+            partitions.append(Partition(name, start, end, estimated_rows))
+    return sorted(partitions, key=lambda partition: (partition.is_default, partition.start or date.min))
+
+
+def create_partition(connection, table: str, start: date, end: date, name: str) -> int:
+    """
+    Create and attach the partition for [start, end), moving its rows out of
+    the DEFAULT partition. Returns the number of rows moved.
+    """
+    key = PARTITIONED_TABLES[table]
+    default = next((partition for partition in list_partitions(connection, table) if partition.is_default), None)
+    # Filled as a standalone table, then attached: a partition cannot be
+    # created while the DEFAULT partition still holds rows in its range
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = 0
+    if default is not None:
+        moved = connection.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {default.name} WHERE {key} >= :start AND {key} < :end RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """), {"start": start, "end": end}).rowcount
+    connection.execute(text(
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return moved
+
+
+def _periods_needed(connection, table: str, default: Optional[Partition], today: date, interval: str, ahead: int) -> List[date]:
+    starts = set()
+    start = period_start(today, interval)
+    for _ in range(ahead + 1):
+        starts.add(start)
+        start = next_period(start, interval)
+    if default is not None:
+        # Periods with rows that arrived before their partition existed
+        key = PARTITIONED_TABLES[table]
+        starts.update(connection.execute(text(
+            f"SELECT DISTINCT date_trunc(:interval, {key})::date FROM {default.name} WHERE {key} IS NOT NULL"
+        ), {"interval": interval}).scalars())
+    return sorted(starts)
+
+
+def ensure_partitions(
+    engine,
+    today: Optional[date] = None,
+    interval: str = FINANCE_PARTITION_INTERVAL,
+    ahead: int = FINANCE_PARTITIONS_AHEAD
+) -> List[str]:
+    """
+    Create the partitions of the current and upcoming periods, and of every
+    period with rows in a DEFAULT partition. Periods overlapping an existing
+    partition (e.g. months of a year created before FINANCE_PARTITION_INTERVAL
+    changed) are skipped. Each partition is created in its own transaction.
+    Returns the names of the partitions created.
+    """
+    if interval not in ("year", "month"):
+        raise ValueError(f"FINANCE_PARTITION_INTERVAL must be year or month, not {interval!r}")
+    today = today or date.today()
+    created = []
+    for table in PARTITIONED_TABLES:
+        with engine.connect() as connection:
+            partitions = list_partitions(connection, table)
+            if not partitions:
+                # Not partitioned: migration 0008 has not been applied
+                continue
+            default = next((partition for partition in partitions if partition.is_default), None)
+            starts = _periods_needed(connection, table, default, today, interval, ahead)
+
+        for start in starts:
+            end = next_period(start, interval)
+            name = partition_name(table, start, interval)
+            with engine.begin() as connection:
+                connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID})
+                # Listed again under the lock, in case another worker got here first
+                if any(
+                    not partition.is_default and partition.start < end and start < partition.end
+                    for partition in list_partitions(connection, table)
+                ):
+                    continue
+                if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+                    logger.warning("Not creating partition %s: a table of that name exists (a detached partition?)", name)
+                    continue
+                moved = create_partition(connection, table, start, end, name)
+            created.append(name)
+            logger.info("Created partition %s (%d row(s) moved from the default partition)", name, moved)
+    return created
+
+
+def detach_partitions(engine, table: str, before: date) -> List[str]:
+    """
+    Detach the partitions of a table that end on or before a date. Detaching
+    only changes the catalog; the rows stay in a standalone table of the same
+    name, which can be archived (pg_dump -t) and dropped, or attached again.
+    """
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"{table} is not a partitioned table")
+    detached = []
+    with engine.connect() as connection:
+        partitions = list_partitions(connection, table)
+    for partition in partitions:
+        if partition.is_default or partition.end > before:
+            continue
+        with engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition.name}"))
+        detached.append(partition.name)
+        logger.info("Detached partition %s", partition.name)
+    return detached
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Nivra finance table partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Show the partitions of each table")
+    subparsers.add_parser("ensure", help="Create upcoming partitions and partitions for rows in the default partition")
+    detach_parser = subparsers.add_parser("detach", help="Detach partitions ending on or before a date")
+    detach_parser.add_argument("table", choices=sorted(PARTITIONED_TABLES))
+    detach_parser.add_argument("--before", type=date.fromisoformat, required=True, help="YYYY-MM-DD")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # Every shard database has the same tables and is partitioned the same way
+    from sharding import shard_engines
+
+    for shard, engine in shard_engines.items():
+        if len(shard_engines) > 1:
+            print(f"[{shard}]")
+        if args.command == "status":
+            with engine.connect() as connection:
+                for table in PARTITIONED_TABLES:
+                    print(f"{table}:")
+                    for partition in list_partitions(connection, table):
+                        bounds = "DEFAULT" if partition.is_default else f"{partition.start} to {partition.end}"
+                        print(f"  {partition.name}: {bounds}, ~{partition.estimated_rows} row(s)")
+        elif args.command == "ensure":
+            created = ensure_partitions(engine)
+            print(f"Created {len(created)} partition(s).")
+        else:
+            detached = detach_partitions(engine, args.table, args.before)
+            print(f"Detached {len(detached)} partition(s): {', '.join(detached) or 'none'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Deleting societies in the background.
+
+Deleting a society or resident removes the rows that reference it in the
+database, with ON DELETE CASCADE (migration 0010), so SQLAlchemy no longer
+loads every child row to delete it. One DELETE of a society with hundreds of
+thousands of ledger rows still runs as one long transaction, though, so
+DELETE /societies/{id} hands societies with more than SOCIETY_PURGE_THRESHOLD
+dependent rows to the society_purge job (job_handlers.py): the society is
+marked inactive at once, and the job deletes its rows in committed batches
+before deleting the society itself.
+
+The change outbox only sees rows deleted through the ORM, not those removed
+by a cascade, so purge_batch() and delete_dependents() delete with
+DELETE ... RETURNING and record a deleted change for each row they remove.
+The cascade then only catches rows written during the delete.
+"""
+
+import os
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import delete, func, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+import jobs
+from outbox import TRACKED_MODELS, Change, record_changes
+from sharding import DEFAULT_SHARD, shard_session, update_users
+
+# Configuration
+# Societies with more dependent rows than this are deleted by a job
+SOCIETY_PURGE_THRESHOLD = int(os.getenv("SOCIETY_PURGE_THRESHOLD", "10000"))
+
+# Children before their parents, so no batch cascades to an unbounded
+# number of rows
+PURGE_ORDER = (
+    models.ResidentFinance,
+    models.ArchivedResidentFinance,
+    models.SocietyFinance,
+    models.ArchivedSocietyFinance,
+    models.Resident,
+)
+# Everything deleting a society cascades to; society admins and join
+# requests live in the directory, next to the society's directory copy
+SOCIETY_DEPENDENTS = PURGE_ORDER + (
+    models.SocietyAdmin,
+    models.SocietyJoinRequest,
+)
+
+
+def society_rows(model, society_id: UUID):
+    """Condition selecting the rows of a SOCIETY_DEPENDENTS table that belong to a society."""
+    if model in (models.ResidentFinance, models.ArchivedResidentFinance):
+        residents = select(models.Resident.id).where(models.Resident.society_id == society_id)
+        return model.resident_id.in_(residents)
+    return model.society_id == society_id
+
+
+def exceeds_purge_threshold(db: Session, society_id: UUID, threshold: int = SOCIETY_PURGE_THRESHOLD) -> bool:
+    """Whether a society has more than threshold dependent rows; stops counting past it."""
+    rows = union_all(*[
+        select(model.id).where(society_rows(model, society_id)) for model in PURGE_ORDER
+    ]).limit(threshold + 1).subquery()
+    return db.execute(select(func.count()).select_from(rows)).scalar() > threshold
+
+
+def _delete_recorded(db: Session, model, condition, society_id: UUID) -> int:
+    """Delete rows of model matching condition, recording each as deleted in the outbox."""
+    table = model.__table__
+    deleted: List[UUID] = db.execute(delete(table).where(condition).returning(table.c.id)).scalars().all()
+    entity = TRACKED_MODELS.get(model)
+    if entity is not None:
+        record_changes(db, [Change("deleted", entity, row_id, society_id) for row_id in deleted])
+    if model is models.Resident and deleted:
+        unlink_residents(db, deleted)
+    return len(deleted)
+
+
+def unlink_residents(db: Session, resident_ids: List[UUID]):
+    """Unlink users from deleted residents, so they lose access to the residents' society."""
+    update_users(db, models.User.resident_id.in_(resident_ids), resident_id=None, resident_society_id=None)
+
+
+def purge_batch(db: Session, model, society_id: UUID, batch_size: int) -> int:
+    """
+    Delete up to batch_size of a society's rows of model and return how many
+    went. Rows locked by a concurrent write are skipped; whatever is left
+    goes with the society's own row at the end.
+    """
+    table = model.__table__
+    batch = select(table.c.id).where(society_rows(model, society_id)).limit(batch_size).with_for_update(skip_locked=True)
+    return _delete_recorded(db, model, table.c.id.in_(batch), society_id)
+
+
+def delete_dependents(db: Session, society_id: UUID, resident_id: Optional[UUID] = None):
+    """
+    Delete the rows that ON DELETE CASCADE would remove with a society, or
+    with one of its residents when resident_id is given, recording them in
+    the outbox. Call in the deleting transaction, just before deleting the
+    society or resident.
+    """
+    if resident_id is not None:
+        for model in (models.ResidentFinance, models.ArchivedResidentFinance):
+            _delete_recorded(db, model, model.resident_id == resident_id, society_id)
+        unlink_residents(db, [resident_id])
+        return
+    for model in SOCIETY_DEPENDENTS:
+        _delete_recorded(db, model, society_rows(model, society_id), society_id)
+
+
+def queue_society_purge(society_id: UUID) -> models.Job:
+    """
+    Enqueue the society_purge job for a society, or return the one already
+    queued or running. The job is not linked to the society (jobs.society_id),
+    whose deletion would cascade to it.
+    """
+    with shard_session(DEFAULT_SHARD) as db:
+        job: Optional[models.Job] = (
+            db.query(models.Job)
+            .filter(
+                models.Job.kind == "society_purge",
+                models.Job.status.in_((jobs.QUEUED, jobs.RUNNING)),
+                models.Job.payload["society_id"].astext == str(society_id),
+            )
+            .first()
+        )
+        if job is None:
+            job = jobs.enqueue(db, "society_purge", {"society_id": str(society_id)})
+            db.commit()
+            db.refresh(job)
+        return job
@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from admission import HEAVY_PATH_PATTERN, READ_METHODS
+
+# Configuration
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory or database
+# Budgets as requests per period (s, min or h); a bucket holds one period's requests
+RATE_LIMIT_USER_READ = os.getenv("RATE_LIMIT_USER_READ", "600/min")
+RATE_LIMIT_USER_WRITE = os.getenv("RATE_LIMIT_USER_WRITE", "120/min")
+RATE_LIMIT_USER_HEAVY = os.getenv("RATE_LIMIT_USER_HEAVY", "10/min")
+RATE_LIMIT_SOCIETY_READ = os.getenv("RATE_LIMIT_SOCIETY_READ", "3000/min")
+RATE_LIMIT_SOCIETY_WRITE = os.getenv("RATE_LIMIT_SOCIETY_WRITE", "600/min")
+RATE_LIMIT_SOCIETY_HEAVY = os.getenv("RATE_LIMIT_SOCIETY_HEAVY", "30/min")
+# Buckets kept per worker by the memory backend; the least recently used are dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# The database backend has its own small pool per worker, so checking limits
+# never waits behind, or adds to, the requests queued on the main pool
+RATE_LIMIT_DB_POOL_SIZE = int(os.getenv("RATE_LIMIT_DB_POOL_SIZE", "2"))
+RATE_LIMIT_DB_POOL_TIMEOUT = float(os.getenv("RATE_LIMIT_DB_POOL_TIMEOUT", "1"))
+
+READ = "read"
+WRITE = "write"
+HEAVY = "heavy"
+ROUTE_CLASSES = (READ, WRITE, HEAVY)
+
+PERIOD_SECONDS = {"s": 1, "sec": 1, "min": 60, "h": 3600, "hour": 3600}
+SOCIETY_PATH_PATTERN = re.compile(r"/societies/([0-9a-fA-F-]{36})(?:/|$)")
+SOCIETY_HEADER = "x-society-id"
+
+logger = logging.getLogger(__name__)
+
+
+class Budget(NamedTuple):
+    capacity: float  # bucket size: requests allowed in a burst
+    rate: float  # tokens added per second
+
+    @property
+    def description(self) -> str:
+        return f"{self.capacity:g};w={self.capacity / self.rate:g}"
+
+
+def parse_budget(value: str) -> Budget:
+    """Parse "120/min" into a bucket of 120 tokens refilled at 2 per second."""
+    count, _, period = value.strip().partition("/")
+    seconds = PERIOD_SECONDS.get(period.strip().lower())
+    if seconds is None or not count.strip().isdigit() or int(count) <= 0:
+        raise ValueError(f"Invalid rate limit {value!r}; expected e.g. 120/min")
+    return Budget(float(count), int(count) / seconds)
+
+
+BUDGETS: Dict[Tuple[str, str], Budget] = {
+    ("user", READ): parse_budget(RATE_LIMIT_USER_READ),
+    ("user", WRITE): parse_budget(RATE_LIMIT_USER_WRITE),
+    ("user", HEAVY): parse_budget(RATE_LIMIT_USER_HEAVY),
+    ("society", READ): parse_budget(RATE_LIMIT_SOCIETY_READ),
+    ("society", WRITE): parse_budget(RATE_LIMIT_SOCIETY_WRITE),
+    ("society", HEAVY): parse_budget(RATE_LIMIT_SOCIETY_HEAVY),
+}
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Return the budget class of a request, or None for requests that are never limited."""
+    if not path.startswith("/api/"):
+        # Probes, docs and the root endpoint
+        return None
+    if path.endswith("/events"):
+        # Event streams are long-lived; connecting is not a repeated cost
+        return None
+    if HEAVY_PATH_PATTERN.search(path):
+        return HEAVY
+    if method in READ_METHODS:
+        return READ
+    return WRITE
+
+
+class Decision(NamedTuple):
+    allowed: bool  # whether this bucket had a token; a request needs all of its buckets to
+    budget: Budget
+    remaining: int
+    reset_seconds: int  # until the bucket is full again, or until one token is back if rejected
+
+
+def _decision(allowed: bool, budget: Budget, tokens: float) -> Decision:
+    if allowed:
+        return Decision(True, budget, int(tokens), math.ceil((budget.capacity - tokens) / budget.rate))
+    return Decision(False, budget, 0, max(1, math.ceil((1 - tokens) / budget.rate)))
+
+
+class MemoryRateLimitStore:
+    """
+    Per-process token buckets. The middleware calls it from the event loop
+    only, so no locking is needed. Buckets are stored as (tokens, updated)
+    and refilled lazily when next used.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def take(self, checks: List[Tuple[str, Budget]]) -> List[Decision]:
+        """Take a token from every bucket, or from none if any is empty."""
+        now = time.monotonic()
+        levels = []
+        for key, budget in checks:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                levels.append(budget.capacity)
+            else:
+                self._buckets.move_to_end(key)
+                levels.append(min(budget.capacity, bucket[0] + (now - bucket[1]) * budget.rate))
+        allowed = all(level >= 1 for level in levels)
+        decisions = []
+        for (key, budget), level in zip(checks, levels):
+            if allowed:
+                level -= 1
+            self._buckets[key] = [level, now]
+            decisions.append(_decision(level >= 1 or allowed, budget, level))
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return decisions
+
+
+class DatabaseRateLimitStore:
+    """
+    Token buckets shared by all workers, in the unlogged rate_limit_buckets
+    table. Each request costs one statement: an upsert that refills each
+    bucket and takes a token where one is available, returning the buckets
+    it took from. A token taken from one bucket is not returned when
+    another bucket of the same request turns out to be empty.
+
+    Statements run on a dedicated engine of RATE_LIMIT_DB_POOL_SIZE
+    connections, created on first use in each worker. When all of them are
+    busy for RATE_LIMIT_DB_POOL_TIMEOUT, the request is let through rather
+    than queued, as it is when the database fails in any other way.
+    """
+
+    TAKE = text("""
+        INSERT INTO rate_limit_buckets AS b (key, tokens, capacity, rate, updated_at)
+        SELECT key, capacity - 1, capacity, rate, now()
+        FROM unnest(CAST(:keys AS text[]), CAST(:capacities AS float8[]), CAST(:rates AS float8[])) AS t(key, capacity, rate)
+        ON CONFLICT (key) DO UPDATE
+        SET tokens = LEAST(EXCLUDED.capacity, b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * EXCLUDED.rate) - 1,
+            capacity = EXCLUDED.capacity,
+            rate = EXCLUDED.rate,
+            updated_at = now()
+        WHERE LEAST(EXCLUDED.capacity, b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * EXCLUDED.rate) >= 1
+        RETURNING key, tokens
+    """)
+    # A bucket that has refilled completely is the same as no bucket
+    PURGE = text("DELETE FROM rate_limit_buckets WHERE tokens + EXTRACT(EPOCH FROM now() - updated_at) * rate >= capacity")
+
+    def __init__(self, purge_every: int = 1000, pool_size: int = RATE_LIMIT_DB_POOL_SIZE, pool_timeout: float = RATE_LIMIT_DB_POOL_TIMEOUT):
+        self.purge_every = purge_every
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.engine = None
+        self._engine_lock = threading.Lock()
+        self._takes = 0
+
+    def _connect(self):
+        if self.engine is None:
+            with self._engine_lock:
+                if self.engine is None:
+                    from database import DATABASE_URL, DB_POOL_RECYCLE
+                    self.engine = create_engine(
+                        DATABASE_URL,
+                        pool_size=self.pool_size,
+                        max_overflow=0,
+                        pool_timeout=self.pool_timeout,
+                        pool_recycle=DB_POOL_RECYCLE,
+                        pool_pre_ping=True,
+                    )
+        return self.engine.begin()
+
+    def take(self, checks: List[Tuple[str, Budget]]) -> List[Decision]:
+        try:
+            with self._connect() as connection:
+                self._takes += 1
+                if self._takes % self.purge_every == 0:
+                    connection.execute(self.PURGE)
+                rows = dict(connection.execute(self.TAKE, {
+                    "keys": [key for key, _ in checks],
+                    "capacities": [budget.capacity for _, budget in checks],
+                    "rates": [budget.rate for _, budget in checks],
+                }).all())
+        except SQLAlchemyError as exc:
+            logger.warning("Rate limit store unavailable (%s); letting the request through", type(exc).__name__)
+            return [_decision(True, budget, budget.capacity - 1) for _, budget in checks]
+        return [_decision(key in rows, budget, rows.get(key, 0.0)) for key, budget in checks]
+
+
+def create_store():
+    if RATE_LIMIT_BACKEND == "database":
+        return DatabaseRateLimitStore()
+    return MemoryRateLimitStore()
+
+
+def _caller(scope: Scope, headers: Headers) -> str:
+    """The token's subject, or the client address for anonymous or unverifiable requests."""
+    principal = scope.get("batch_principal")
+    if principal is not None:
+        return f"user:{principal.username}"
+    authorization = headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        from endpoints.auth import SECRET_KEY, ALGORITHM
+        try:
+            subject = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            subject = None
+        if subject:
+            return f"user:{subject}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def _society(scope: Scope, headers: Headers) -> Optional[str]:
+    """The society named in the path, the society_id query parameter or the X-Society-ID header."""
+    match = SOCIETY_PATH_PATTERN.search(scope["path"])
+    if match:
+        return match.group(1).lower()
+    society_id = QueryParams(scope.get("query_string", b"")).get("society_id") or headers.get(SOCIETY_HEADER)
+    return society_id.lower() if society_id else None
+
+
+class RateLimitMiddleware:
+    """
+    Token-bucket rate limits per caller and per society, with separate
+    budgets for reads, writes and heavy report/export/import requests, so a
+    looping script exhausts its own budget before it can saturate the
+    database for other tenants.
+
+    Limited responses carry RateLimit-Limit, RateLimit-Remaining and
+    RateLimit-Reset for the tightest bucket; rejected requests get 429 with
+    Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp, enabled: bool = RATE_LIMIT_ENABLED, store=None):
+        self.app = app
+        self.enabled = enabled
+        self.store = store if store is not None else create_store()
+        self.allowed: Dict[str, int] = {route: 0 for route in ROUTE_CLASSES}
+        self.limited: Dict[str, int] = {route: 0 for route in ROUTE_CLASSES}
+
+    def stats(self) -> dict:
+        return {"backend": RATE_LIMIT_BACKEND, "allowed": dict(self.allowed), "limited": dict(self.limited)}
+
+    async def _take(self, checks: List[Tuple[str, Budget]]) -> List[Decision]:
+        if isinstance(self.store, MemoryRateLimitStore):
+            return self.store.take(checks)
+        return await run_in_threadpool(self.store.take, checks)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        route = route_class(scope["method"], scope["path"])
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        checks = [(f"{_caller(scope, headers)}:{route}", BUDGETS[("user", route)])]
+        society_id = _society(scope, headers)
+        if society_id is not None:
+            checks.append((f"society:{society_id}:{route}", BUDGETS[("society", route)]))
+
+        decisions = await self._take(checks)
+        allowed = all(decision.allowed for decision in decisions)
+        if allowed:
+            # Report the bucket that runs out first
+            tightest = min(range(len(decisions)), key=lambda index: decisions[index].remaining)
+        else:
+            # Report the empty bucket that takes longest to allow a request again
+            tightest = max(
+                (index for index, decision in enumerate(decisions) if not decision.allowed),
+                key=lambda index: decisions[index].reset_seconds
+            )
+        decision = decisions[tightest]
+        rate_headers = [
+            (b"ratelimit-limit", str(int(decision.budget.capacity)).encode()),
+            (b"ratelimit-remaining", str(decision.remaining).encode()),
+            (b"ratelimit-reset", str(decision.reset_seconds).encode()),
+            (b"ratelimit-policy", decision.budget.description.encode()),
+        ]
+
+        if not allowed:
+            self.limited[route] += 1
+            await self._reject(send, decision, rate_headers, "society" if tightest == 1 else "caller")
+            return
+
+        self.allowed[route] += 1
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + rate_headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    async def _reject(self, send: Send, decision: Decision, rate_headers: list, bucket: str):
+        body = json.dumps({"detail": {
+            "code": "RATE_LIMITED",
+            "message": f"Too many requests for this {bucket}; retry in {decision.reset_seconds}s"
+        }}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(decision.reset_seconds).encode()),
+            ] + rate_headers,
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,11 +1,12 @@
 from typing import Optional, List, Dict, Any, Callable
 from functools import wraps
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
 from endpoints.auth import get_current_active_user
-from database import get_db
+from database import get_async_db
 import models
 
 
@@ -32,10 +33,10 @@ class RBACDependency:
         self.action = action
         self.check_society_access = check_society_access
     
-    def __call__(
+    async def __call__(
         self, 
         user = Depends(get_current_active_user), 
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
     ):
         """
         Check if the user has the required permission.
@@ -46,23 +47,23 @@ class RBACDependency:
         :raises: HTTPException if permission check fails
         """
         # System admins have all permissions
-        is_system_admin = db.query(models.Role).filter(
+        is_system_admin = (await db.execute(select(models.Role.id).filter(
             models.Role.id == user.role_id,
             models.Role.name == "system_admin"
-        ).first() is not None
+        ))).first() is not None
         
         if is_system_admin:
             return user
         
         # Check for specific permission
-        permission = db.query(models.Permission).join(
+        permission = (await db.execute(select(models.Permission.id).join(
             models.RolePermission,
             models.Permission.id == models.RolePermission.permission_id
         ).filter(
             models.RolePermission.role_id == user.role_id,
             models.Permission.resource_type == self.resource_type,
             models.Permission.action == self.action
-        ).first()
+        ))).first()
         
         if not permission:
             raise HTTPException(
@@ -74,10 +75,10 @@ class RBACDependency:
 
 
 # Helper function to check if a user has access to a specific society
-def check_society_access(
+async def check_society_access(
     user: models.User, 
     society_id: UUID, 
-    db: Session,
+    db: AsyncSession,
     role_names: Optional[List[str]] = None
 ) -> bool:
     """
@@ -85,43 +86,37 @@ def check_society_access(
     
     :param user: User model
     :param society_id: Society UUID
-    :param db: Database session
+    :param db: Async database session
     :param role_names: Optional list of role names to check against
     :return: True if user has access, False otherwise
     """
     # System admin has access to all societies
-    is_system_admin = db.query(models.Role).filter(
+    is_system_admin = (await db.execute(select(models.Role.id).filter(
         models.Role.id == user.role_id,
         models.Role.name == "system_admin"
-    ).first() is not None
+    ))).first() is not None
     
     if is_system_admin:
         return True
     
     # If specific roles are provided, check if user has one of these roles
     if role_names:
-        user_role = db.query(models.Role).filter(models.Role.id == user.role_id).first()
-        if not user_role or user_role.name not in role_names:
+        user_role_name = (await db.execute(select(models.Role.name).filter(models.Role.id == user.role_id))).scalar()
+        if not user_role_name or user_role_name not in role_names:
             return False
     
     # Society admin case - check if user is admin for this society
-    is_society_admin = db.query(models.SocietyAdmin).filter(
+    is_society_admin = (await db.execute(select(models.SocietyAdmin.id).filter(
         models.SocietyAdmin.user_id == user.id,
         models.SocietyAdmin.society_id == society_id
-    ).first() is not None
+    ))).first() is not None
     
     if is_society_admin:
         return True
     
-    # Check if user is linked to a resident in this society
-    # Need to verify resident_id is not None without using the column directly in a conditional
-    resident_query = db.query(models.Resident).filter(
-        models.Resident.id == user.resident_id,
-        models.Resident.society_id == society_id
-    )
-    
-    resident_in_society = resident_query.first() is not None
-    if resident_in_society:
+    # Check if user is linked to a resident in this society; the resident may
+    # live on another shard, so the user records the resident's society
+    if user.resident_society_id is not None and user.resident_society_id == society_id:
         return True
     
     return False
@@ -131,6 +126,7 @@ def check_society_access(
 def require_society_access(society_id_param: str = 'society_id'):
     """
     Decorator to check if a user has access to a specific society.
+    The decorated endpoint must take `current_user` and an async `db` session.
     
     :param society_id_param: Name of the path parameter containing the society_id
     """
@@ -147,7 +143,7 @@ def require_society_access(society_id_param: str = 'society_id'):
                     detail="Missing required dependencies for society access check"
                 )
             
-            if not check_society_access(user, society_id, db):
+            if not await check_society_access(user, society_id, db):
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail=f"No access to society {society_id}"
@@ -0,0 +1,288 @@
+import os
+import io
+import re
+import csv
+from collections import defaultdict, deque
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import update, values, column, String, Date
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.orm import Session
+
+import models
+from outbox import Change, record_changes, resident_society_ids
+
+# Configuration
+RECONCILIATION_UPDATE_BATCH_SIZE = int(os.getenv("RECONCILIATION_UPDATE_BATCH_SIZE", "1000"))
+
+DUE_TRANSACTION_TYPES = ["maintenance", "penalty", "special_charge"]
+OPEN_PAYMENT_STATUSES = ["pending", "overdue"]
+PAID_COLUMNS = ["payment_date", "payment_method", "payment_status", "receipt_number"]
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d-%b-%Y", "%d %b %Y", "%d/%m/%y"]
+
+# Common bank statement column names mapped to the names used here
+COLUMN_ALIASES = {
+    "credit": "amount",
+    "credit_amount": "amount",
+    "deposit": "amount",
+    "deposit_amount": "amount",
+    "txn_date": "date",
+    "transaction_date": "date",
+    "value_date": "date",
+    "narration": "description",
+    "remarks": "description",
+    "particulars": "description",
+    "ref": "reference",
+    "ref_no": "reference",
+    "reference_number": "reference",
+    "utr": "reference",
+    "cheque_no": "reference",
+    "unit": "unit_number",
+    "flat": "unit_number",
+    "flat_number": "unit_number",
+    "invoice": "invoice_number",
+    "invoice_no": "invoice_number",
+}
+
+# Candidate tokens for invoice and unit numbers inside free-text narrations
+TOKEN_PATTERN = re.compile(r"[A-Z0-9][A-Z0-9\-/]*[A-Z0-9]")
+
+
+class StatementFormatError(ValueError):
+    """Raised when an uploaded file cannot be read as a bank statement."""
+
+
+class OpenDue:
+    __slots__ = ("id", "invoice_number", "amount", "unit_number")
+
+    def __init__(self, finance_id: UUID, invoice_number: Optional[str], amount: Decimal, unit_number: str):
+        self.id = finance_id
+        self.invoice_number = invoice_number
+        self.amount = amount
+        self.unit_number = unit_number
+
+
+class DueIndex:
+    """
+    In-memory hash indexes of a society's open dues, keyed by invoice number
+    and by (unit, amount). Each due can be claimed by one statement line only.
+    """
+
+    def __init__(self, dues: List[OpenDue]):
+        self.by_invoice: Dict[str, OpenDue] = {}
+        self.by_unit_amount: Dict[Tuple[str, Decimal], Deque[OpenDue]] = defaultdict(deque)
+        self.units = set()
+        self.claimed = set()
+        self.count = len(dues)
+        for due in dues:
+            if due.invoice_number:
+                self.by_invoice[due.invoice_number.upper()] = due
+            unit = due.unit_number.upper()
+            self.by_unit_amount[(unit, due.amount)].append(due)
+            self.units.add(unit)
+
+    def find_invoice(self, candidates: List[str]) -> Optional[OpenDue]:
+        for candidate in candidates:
+            due = self.by_invoice.get(candidate)
+            if due is not None and due.id not in self.claimed:
+                return due
+        return None
+
+    def claim_unit_amount(self, candidates: List[str], amount: Decimal) -> Optional[OpenDue]:
+        for candidate in candidates:
+            if candidate not in self.units:
+                continue
+            queue = self.by_unit_amount.get((candidate, amount))
+            while queue:
+                due = queue.popleft()
+                if due.id not in self.claimed:
+                    self.claimed.add(due.id)
+                    return due
+        return None
+
+    def claim(self, due: OpenDue):
+        self.claimed.add(due.id)
+
+
+def load_open_dues(db: Session, society_id: UUID) -> DueIndex:
+    """Load every open due of a society in one query, oldest first."""
+    rows = db.query(
+        models.ResidentFinance.id,
+        models.ResidentFinance.invoice_number,
+        models.ResidentFinance.amount,
+        models.Resident.unit_number
+    ).join(
+        models.Resident, models.ResidentFinance.resident_id == models.Resident.id
+    ).filter(
+        models.Resident.society_id == society_id,
+        models.ResidentFinance.is_active == True,
+        models.ResidentFinance.transaction_type.in_(DUE_TRANSACTION_TYPES),
+        models.ResidentFinance.payment_status.in_(OPEN_PAYMENT_STATUSES)
+    ).order_by(
+        models.ResidentFinance.due_date.asc().nulls_last(),
+        models.ResidentFinance.created_at.asc()
+    ).all()
+    return DueIndex([OpenDue(*row) for row in rows])
+
+
+def _normalize_header(value: str) -> str:
+    name = (value or "").strip().lower().replace(" ", "_").replace("-", "_").replace(".", "")
+    return COLUMN_ALIASES.get(name, name)
+
+
+def parse_amount(value: str) -> Optional[Decimal]:
+    cleaned = re.sub(r"[^0-9.\-]", "", value or "")
+    if not cleaned:
+        return None
+    try:
+        return Decimal(cleaned).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        return None
+
+
+def parse_date(value: str) -> Optional[date]:
+    value = (value or "").strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def iter_statement_rows(file_obj) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Yield (row number, row) for each line of a CSV bank statement."""
+    reader = csv.reader(io.TextIOWrapper(file_obj, encoding="utf-8-sig", newline=""))
+    try:
+        header = [_normalize_header(column_name) for column_name in next(reader)]
+    except StopIteration:
+        raise StatementFormatError("The file is empty")
+    if "amount" not in header:
+        raise StatementFormatError("The statement must have an amount (or credit) column")
+    if not {"reference", "description", "invoice_number", "unit_number"} & set(header):
+        raise StatementFormatError("The statement must have a reference, description, invoice_number or unit_number column")
+    for row_number, cells in enumerate(reader, start=2):
+        if any(cell.strip() for cell in cells):
+            yield row_number, dict(zip(header, cells))
+
+
+def _tokens(*texts: Optional[str]) -> List[str]:
+    tokens = []
+    for text in texts:
+        if not text:
+            continue
+        for token in TOKEN_PATTERN.findall(text.upper()):
+            tokens.append(token)
+            # Narrations such as NEFT/INV-1001/SHARMA embed the reference between slashes
+            if "/" in token:
+                tokens.extend(part for part in token.split("/") if part)
+    return tokens
+
+
+def match_statement(index: DueIndex, rows: Iterator[Tuple[int, Dict[str, str]]]) -> Tuple[List[dict], List[dict]]:
+    """
+    Match statement credits to open dues in a single pass.
+
+    A line matches by invoice number when one appears in the invoice_number,
+    reference or description column and the amount equals the due. Otherwise
+    it matches the oldest open due of a unit mentioned on the line with the
+    same amount.
+    """
+    matched = []
+    unmatched = []
+    for row_number, row in rows:
+        amount = parse_amount(row.get("amount", ""))
+        if amount is None or amount <= 0:
+            # Debits and blank lines are not resident payments
+            continue
+
+        reference = (row.get("reference") or "").strip()
+        description = (row.get("description") or "").strip()
+        payment_date = parse_date(row.get("date", "")) or date.today()
+
+        due = None
+        match_type = None
+        invoice_candidates = _tokens(row.get("invoice_number"), reference, description)
+        invoice_due = index.find_invoice(invoice_candidates)
+        if invoice_due is not None:
+            if invoice_due.amount == amount:
+                index.claim(invoice_due)
+                due, match_type = invoice_due, "invoice"
+            else:
+                unmatched.append({
+                    "row": row_number,
+                    "amount": amount,
+                    "reference": reference or None,
+                    "reason": f"Invoice {invoice_due.invoice_number} is due for {invoice_due.amount}",
+                })
+                continue
+
+        if due is None:
+            unit_candidates = _tokens(row.get("unit_number"), description, reference)
+            due = index.claim_unit_amount(unit_candidates, amount)
+            match_type = "unit_amount" if due is not None else None
+
+        if due is None:
+            unmatched.append({
+                "row": row_number,
+                "amount": amount,
+                "reference": reference or None,
+                "reason": "No open due with a matching invoice number or unit and amount",
+            })
+            continue
+
+        matched.append({
+            "row": row_number,
+            "finance_id": due.id,
+            "invoice_number": due.invoice_number,
+            "unit_number": due.unit_number,
+            "amount": amount,
+            "payment_date": payment_date,
+            "receipt_number": reference[:100] if reference else None,
+            "match_type": match_type,
+        })
+    return matched, unmatched
+
+
+def mark_paid(db: Session, matched: List[dict], payment_method: str = "bank_transfer") -> int:
+    """
+    Mark matched dues as paid with one UPDATE ... FROM (VALUES ...) per batch.
+    Dues settled concurrently by someone else are left untouched.
+    """
+    updated = 0
+    for start in range(0, len(matched), RECONCILIATION_UPDATE_BATCH_SIZE):
+        batch = matched[start:start + RECONCILIATION_UPDATE_BATCH_SIZE]
+        payments = values(
+            column("id", PG_UUID(as_uuid=True)),
+            column("payment_date", Date),
+            column("receipt_number", String),
+            name="payments"
+        ).data([(item["finance_id"], item["payment_date"], item["receipt_number"]) for item in batch])
+
+        result = db.execute(
+            update(models.ResidentFinance)
+            .where(
+                models.ResidentFinance.id == payments.c.id,
+                models.ResidentFinance.payment_status.in_(OPEN_PAYMENT_STATUSES)
+            )
+            .values(
+                payment_status="paid",
+                payment_date=payments.c.payment_date,
+                receipt_number=payments.c.receipt_number,
+                payment_method=payment_method,
+                updated_at=datetime.utcnow()
+            )
+            .returning(models.ResidentFinance.id, models.ResidentFinance.resident_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        societies = resident_society_ids(db, (resident_id for _, resident_id in result))
+        record_changes(db, [
+            Change("updated", "resident_finance", finance_id, societies.get(resident_id), PAID_COLUMNS)
+            for finance_id, resident_id in result
+        ])
+        updated += len(result)
+    db.commit()
+    return updated
@@ -0,0 +1,228 @@
+import os
+import io
+import csv
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from pydantic import ValidationError
+from sqlalchemy import insert, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from outbox import Change, record_changes
+
+# Optional dependency for .xlsx uploads
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover
+    openpyxl = None
+
+# Configuration
+RESIDENT_IMPORT_CHUNK_SIZE = int(os.getenv("RESIDENT_IMPORT_CHUNK_SIZE", "500"))
+RESIDENT_IMPORT_MAX_ERRORS = int(os.getenv("RESIDENT_IMPORT_MAX_ERRORS", "100"))
+
+REQUIRED_COLUMNS = {"first_name", "last_name", "unit_number"}
+IMPORT_COLUMNS = [
+    "first_name", "last_name", "email", "phone", "unit_number", "is_owner",
+    "is_committee_member", "committee_role", "move_in_date", "move_out_date",
+]
+
+
+class ImportFormatError(ValueError):
+    """Raised when an uploaded file cannot be read as a resident import."""
+
+
+def _normalize_header(value) -> str:
+    return str(value or "").strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def _check_header(header: List[str]):
+    missing = REQUIRED_COLUMNS - set(header)
+    if missing:
+        raise ImportFormatError(f"Missing required columns: {', '.join(sorted(missing))}")
+
+
+def iter_csv_rows(file_obj) -> Iterator[Dict[str, str]]:
+    """Yield rows of a CSV upload as dicts keyed by normalized column name."""
+    text = io.TextIOWrapper(file_obj, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    try:
+        header = [_normalize_header(column) for column in next(reader)]
+    except StopIteration:
+        raise ImportFormatError("The file is empty")
+    _check_header(header)
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        yield dict(zip(header, values))
+
+
+def iter_xlsx_rows(file_obj) -> Iterator[Dict[str, str]]:
+    """Yield rows of the first sheet of an XLSX upload, streaming in read-only mode."""
+    if openpyxl is None:
+        raise ImportFormatError("XLSX import requires the openpyxl package")
+    try:
+        workbook = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+    except Exception:
+        raise ImportFormatError("The file is not a valid XLSX workbook")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        try:
+            header = [_normalize_header(column) for column in next(rows)]
+        except StopIteration:
+            raise ImportFormatError("The file is empty")
+        _check_header(header)
+        for values in rows:
+            if all(value is None or str(value).strip() == "" for value in values):
+                continue
+            yield {column: value for column, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+def iter_upload_rows(filename: str, file_obj) -> Iterator[Dict[str, str]]:
+    if filename.lower().endswith(".xlsx"):
+        return iter_xlsx_rows(file_obj)
+    if filename.lower().endswith(".csv"):
+        return iter_csv_rows(file_obj)
+    raise ImportFormatError("Only .csv and .xlsx files can be imported")
+
+
+def _chunks(rows: Iterator[Dict[str, str]], size: int) -> Iterator[List[Tuple[int, Dict[str, str]]]]:
+    chunk = []
+    # Row 1 is the header, so data starts on row 2 as seen in a spreadsheet
+    for row_number, row in enumerate(rows, start=2):
+        chunk.append((row_number, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _cell_value(value):
+    """Normalize a CSV/XLSX cell so it validates like a JSON value."""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets store unit numbers such as 101 as floats
+        return str(int(value))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def _validate_row(society_id: UUID, row: Dict[str, str]) -> schemas.ResidentCreate:
+    data = {"society_id": society_id}
+    for column in IMPORT_COLUMNS:
+        value = _cell_value(row.get(column))
+        if value is None or value == "":
+            continue
+        data[column] = value
+    return schemas.ResidentCreate(**data)
+
+
+def _resident_key(unit_number: str, first_name: str, last_name: str) -> Tuple[str, str, str]:
+    return unit_number, first_name.lower(), last_name.lower()
+
+
+def _existing_keys(db: Session, society_id: UUID, unit_numbers: List[str]) -> set:
+    """Fetch (unit, first name, last name) of residents already in these units, in one query."""
+    if not unit_numbers:
+        return set()
+    rows = db.query(
+        models.Resident.unit_number,
+        func.lower(models.Resident.first_name),
+        func.lower(models.Resident.last_name)
+    ).filter(
+        models.Resident.society_id == society_id,
+        models.Resident.unit_number.in_(unit_numbers)
+    ).all()
+    return {tuple(row) for row in rows}
+
+
+def _insert_rows(db: Session, rows: List[Tuple[int, dict]], errors: List[dict]) -> int:
+    """
+    Insert a chunk with one multi-row INSERT. If the chunk violates a
+    constraint, fall back to row-by-row inserts so only the bad rows fail.
+    Bulk INSERTs bypass the unit of work, so the new residents are recorded
+    in the change outbox here.
+    """
+    if not rows:
+        return 0
+    statement = insert(models.Resident).returning(models.Resident.id, models.Resident.society_id)
+    try:
+        with db.begin_nested():
+            created = db.execute(statement, [values for _, values in rows]).all()
+        record_changes(db, [Change("created", "resident", id, society_id) for id, society_id in created])
+        return len(rows)
+    except IntegrityError:
+        pass
+
+    created = []
+    for row_number, values in rows:
+        try:
+            with db.begin_nested():
+                created.extend(db.execute(statement, [values]).all())
+        except IntegrityError as e:
+            errors.append({"row": row_number, "message": f"Database error: {str(e.orig).splitlines()[0]}"})
+    record_changes(db, [Change("created", "resident", id, society_id) for id, society_id in created])
+    return len(created)
+
+
+def import_residents(
+    db: Session,
+    society_id: UUID,
+    rows: Iterator[Dict[str, str]],
+    chunk_size: int = RESIDENT_IMPORT_CHUNK_SIZE
+) -> Iterator[dict]:
+    """
+    Validate and load residents chunk by chunk, yielding a progress report
+    after each chunk is committed. The last report has "done": True.
+
+    Rows matching an existing resident of the society (same unit and name),
+    or an earlier row of the same file, are skipped as duplicates, so
+    re-uploading a file does not create the same residents twice.
+    """
+    report = {"processed": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "errors": [], "done": False}
+    seen_keys = set()
+
+    for chunk in _chunks(rows, chunk_size):
+        valid = []
+        for row_number, row in chunk:
+            try:
+                valid.append((row_number, _validate_row(society_id, row)))
+            except ValidationError as e:
+                report["invalid"] += 1
+                if len(report["errors"]) < RESIDENT_IMPORT_MAX_ERRORS:
+                    first_error = e.errors()[0]
+                    field = ".".join(str(part) for part in first_error["loc"])
+                    report["errors"].append({"row": row_number, "field": field, "message": first_error["msg"]})
+
+        existing = _existing_keys(db, society_id, list({resident.unit_number for _, resident in valid}))
+
+        to_insert = []
+        for row_number, resident in valid:
+            key = _resident_key(resident.unit_number, resident.first_name, resident.last_name)
+            if key in existing or key in seen_keys:
+                report["duplicates"] += 1
+                continue
+            seen_keys.add(key)
+            to_insert.append((row_number, resident.dict()))
+
+        chunk_errors = []
+        report["inserted"] += _insert_rows(db, to_insert, chunk_errors)
+        report["invalid"] += len(chunk_errors)
+        report["errors"].extend(chunk_errors[:max(0, RESIDENT_IMPORT_MAX_ERRORS - len(report["errors"]))])
+        db.commit()
+
+        report["processed"] += len(chunk)
+        yield dict(report, errors=list(report["errors"]))
+
+    report["done"] = True
+    yield report
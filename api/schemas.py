@@ -1,7 +1,7 @@
-from typing import Optional, List
+from typing import Optional, List, Any, Dict
 from datetime import date, datetime
 from uuid import UUID
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, field_validator, validator
 from pydantic.networks import EmailStr
 from decimal import Decimal
 
@@ -101,7 +101,8 @@ class ResidentFinanceBase(BaseModel):
     transaction_type: str
     amount: Decimal = Field(..., decimal_places=2)
     currency: str = "INR"
-    due_date: Optional[date] = None
+    # Records without a due date are due on the day they are created
+    due_date: date = Field(default_factory=date.today)
     payment_date: Optional[date] = None
     payment_method: Optional[str] = None
     payment_status: str = "pending"
@@ -126,9 +127,19 @@ class ResidentFinanceUpdate(BaseModel):
     invoice_number: Optional[str] = None
     receipt_number: Optional[str] = None
 
+    @field_validator("due_date")
+    @classmethod
+    def due_date_not_null(cls, value):
+        # Leave due_date out to keep it; every record has one
+        if value is None:
+            raise ValueError("due_date cannot be null")
+        return value
+
 
 class ResidentFinance(ResidentFinanceBase):
     id: UUID
+    # due_date was filled in when due dates became required, not agreed
+    due_date_estimated: bool = False
     is_active: bool
     created_at: datetime
     updated_at: datetime
@@ -138,6 +149,11 @@ class ResidentFinance(ResidentFinanceBase):
         from_attributes = True
 
 
+class ResidentFinanceWithRelations(ResidentFinance):
+    # Populated only when requested via the include parameter
+    resident: Optional[Resident] = None
+
+
 # RBAC Schemas
 # Role Schemas
 class RoleBase(BaseModel):
@@ -271,6 +287,68 @@ class SocietyAdmin(SocietyAdminBase):
         from_attributes = True
 
 
+class SocietyAdminWithRelations(SocietyAdmin):
+    # Populated only when requested via the include parameter
+    user: Optional[User] = None
+    society: Optional[Society] = None
+
+
+# Society Join Request Schemas
+class SocietyJoinRequestBase(BaseModel):
+    user_id: UUID
+    society_id: UUID
+    request_type: str = "join"  # join, invite
+    requested_unit_number: Optional[str] = None
+    is_owner: bool = False
+    request_message: Optional[str] = None
+
+
+class SocietyJoinRequestCreate(SocietyJoinRequestBase):
+    pass
+
+
+class SocietyJoinRequest(SocietyJoinRequestBase):
+    id: UUID
+    is_owner: Optional[bool] = None
+    status: str
+    reviewed_by: Optional[UUID] = None
+    reviewed_at: Optional[datetime] = None
+    review_message: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PendingJoinRequest(SocietyJoinRequest):
+    username: str
+    email: str
+    user_full_name: str
+
+
+class PendingJoinRequestPage(BaseModel):
+    items: List[PendingJoinRequest]
+    next_cursor: Optional[str] = None  # pass as `after` to get the next page; None on the last page
+
+
+class JoinRequestReview(BaseModel):
+    request_ids: List[UUID] = Field(..., min_length=1, max_length=500)
+    reviewed_by: Optional[UUID] = None
+    review_message: Optional[str] = None
+
+
+class JoinRequestSkipped(BaseModel):
+    id: UUID
+    code: str
+    message: str
+
+
+class JoinRequestReviewResult(BaseModel):
+    reviewed: List[SocietyJoinRequest]
+    skipped: List[JoinRequestSkipped]
+
+
 # Authentication Schemas
 class Token(BaseModel):
     access_token: str
@@ -339,6 +417,11 @@ class SocietyFinance(SocietyFinanceBase):
         from_attributes = True
 
 
+class SocietyFinanceWithRelations(SocietyFinance):
+    # Populated only when requested via the include parameter
+    society: Optional[Society] = None
+
+
 class SignupRequest(BaseModel):
     username: str
     email: EmailStr
@@ -350,3 +433,130 @@ class SignupRequest(BaseModel):
 class LoginRequest(BaseModel):
     username: str
     password: str
+
+
+# Sync Schemas
+class ResidentSyncChanges(BaseModel):
+    changed: List[Resident]
+    deleted: List[UUID]
+    watermark: Optional[str] = None
+    has_more: bool
+
+
+class ResidentFinanceSyncChanges(BaseModel):
+    changed: List[ResidentFinance]
+    deleted: List[UUID]
+    watermark: Optional[str] = None
+    has_more: bool
+
+
+class SocietyFinanceSyncChanges(BaseModel):
+    changed: List[SocietyFinance]
+    deleted: List[UUID]
+    watermark: Optional[str] = None
+    has_more: bool
+
+
+class SyncResponse(BaseModel):
+    server_time: datetime
+    residents: Optional[ResidentSyncChanges] = None
+    resident_finances: Optional[ResidentFinanceSyncChanges] = None
+    society_finances: Optional[SocietyFinanceSyncChanges] = None
+
+
+# Batch Schemas
+class BatchSubRequest(BaseModel):
+    method: str = "GET"
+    path: str  # e.g. /api/v1/roles/?limit=10
+    body: Optional[Any] = None
+    headers: Optional[Dict[str, str]] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+
+
+class BatchSubResponse(BaseModel):
+    status: int
+    headers: Dict[str, str]
+    body: Optional[Any] = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[BatchSubResponse]
+
+
+# Resident Import Schemas
+class ResidentImportError(BaseModel):
+    row: int
+    field: Optional[str] = None
+    message: str
+
+
+class ResidentImportReport(BaseModel):
+    processed: int
+    inserted: int
+    duplicates: int
+    invalid: int
+    errors: List[ResidentImportError]
+    done: bool
+
+
+# Reconciliation Schemas
+class ReconciliationMatch(BaseModel):
+    row: int
+    finance_id: UUID
+    invoice_number: Optional[str] = None
+    unit_number: str
+    amount: Decimal
+    payment_date: date
+    receipt_number: Optional[str] = None
+    match_type: str  # invoice, unit_amount
+
+
+class ReconciliationUnmatched(BaseModel):
+    row: int
+    amount: Decimal
+    reference: Optional[str] = None
+    reason: str
+
+
+class ReconciliationReport(BaseModel):
+    open_dues: int
+    matched_count: int
+    updated_count: int
+    unmatched_count: int
+    dry_run: bool
+    matched: List[ReconciliationMatch]
+    unmatched: List[ReconciliationUnmatched]
+
+
+# Job Schemas
+class JobCreate(BaseModel):
+    kind: str  # billing_run, overdue_sweep, recurring_expenses
+    society_id: Optional[UUID] = None
+    payload: Dict[str, Any] = {}
+    run_at: Optional[datetime] = None  # defaults to now
+    max_attempts: Optional[int] = Field(None, ge=1, le=10)
+
+
+class Job(BaseModel):
+    id: UUID
+    kind: str
+    status: str
+    society_id: Optional[UUID] = None
+    payload: Dict[str, Any]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    progress_done: int
+    progress_total: Optional[int] = None
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
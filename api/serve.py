@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Production entry point for the Nivra API.
+
+Runs one master process with a pool of uvicorn workers under gunicorn:
+- the worker count defaults to the number of CPUs available to the process
+- the app is imported once in the master (preload) and forked into workers
+- on SIGTERM workers stop accepting connections and finish in-flight
+  requests for up to SERVER_GRACEFUL_TIMEOUT seconds
+- uvloop and httptools are used when installed (SERVER_FAST_PATH)
+- each worker sizes its DB pools from DB_MAX_CONNECTIONS (see database.py)
+
+Where gunicorn is not available (Windows), uvicorn's own process manager
+runs the workers instead, without preloading.
+
+Usage:
+    python serve.py                       # production, one worker per CPU
+    python serve.py --workers 4 --port 8080
+    python serve.py --reload              # development, single process with auto-reload
+"""
+
+import argparse
+import os
+import sys
+
+# Optional dependencies
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # pragma: no cover
+    BaseApplication = None
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None
+
+try:
+    import httptools
+except ImportError:  # pragma: no cover
+    httptools = None
+
+# Configuration
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", "5"))
+# Restart a worker after this many requests (0 = never), to cap slow memory growth
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "0"))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "100"))
+SERVER_FAST_PATH = os.getenv("SERVER_FAST_PATH", "auto")  # auto, on or off
+
+APP = "main:app"
+
+
+def cpu_count() -> int:
+    """CPUs this process may run on, which honours container and taskset limits."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def default_workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY") or cpu_count())
+
+
+def fast_path_options(mode: str = SERVER_FAST_PATH) -> dict:
+    """uvicorn event loop and HTTP parser settings for the chosen fast path mode."""
+    if mode == "off":
+        return {"loop": "asyncio", "http": "h11"}
+    if mode == "on":
+        missing = [name for name, module in (("uvloop", uvloop), ("httptools", httptools)) if module is None]
+        if missing:
+            sys.exit(f"SERVER_FAST_PATH=on requires: pip install {' '.join(missing)}")
+        return {"loop": "uvloop", "http": "httptools"}
+    # uvicorn picks uvloop and httptools by itself when they are installed
+    return {"loop": "auto", "http": "auto"}
+
+
+def _post_fork(server, worker):
+    # Connections opened by the master while preloading (the schema check of
+    # every shard) must not be shared with the children; drop them from the
+    # pools without closing them
+    from database import async_engine
+    from sharding import shard_engines
+    for shard_engine in shard_engines.values():
+        shard_engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+def _worker_exit(server, worker):
+    # The async engine is disposed by the app's lifespan, on its event loop
+    from sharding import shard_engines
+    for shard_engine in shard_engines.values():
+        shard_engine.dispose()
+
+
+def _load_app():
+    from main import app
+    return app
+
+
+if BaseApplication is not None:
+    from uvicorn.workers import UvicornWorker
+
+    class NivraUvicornWorker(UvicornWorker):
+        """uvicorn worker with the fast path and graceful shutdown settings applied."""
+        CONFIG_KWARGS = dict(fast_path_options(), timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT)
+
+
+def run_gunicorn(workers: int, host: str, port: int):
+    class NivraApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": "serve.NivraUvicornWorker",
+                "preload_app": True,
+                # The master waits a little longer than the workers so they can drain cleanly
+                "graceful_timeout": SERVER_GRACEFUL_TIMEOUT + 5,
+                "keepalive": SERVER_KEEPALIVE,
+                "max_requests": SERVER_MAX_REQUESTS,
+                "max_requests_jitter": SERVER_MAX_REQUESTS_JITTER if SERVER_MAX_REQUESTS else 0,
+                "post_fork": _post_fork,
+                "worker_exit": _worker_exit,
+                "accesslog": "-",
+                "errorlog": "-",
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return _load_app()
+
+    NivraApplication().run()
+
+
+def run_uvicorn(workers: int, host: str, port: int, reload: bool = False):
+    import uvicorn
+    uvicorn.run(
+        APP,
+        host=host,
+        port=port,
+        reload=reload,
+        workers=None if reload else workers,
+        timeout_keep_alive=SERVER_KEEPALIVE,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        limit_max_requests=SERVER_MAX_REQUESTS or None,
+        **({} if reload else fast_path_options()),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Nivra API server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--reload", action="store_true", help="Development mode: one process, reload on code changes")
+    args = parser.parse_args(argv)
+
+    if args.reload:
+        print(f"Starting development server on http://{args.host}:{args.port}")
+        run_uvicorn(1, args.host, args.port, reload=True)
+        return
+
+    workers = args.workers or default_workers()
+    # database.py reads this to size each worker's share of DB_MAX_CONNECTIONS,
+    # once, when it is first imported
+    database = sys.modules.get("database")
+    if database is not None and database.WEB_CONCURRENCY != workers:
+        sys.exit(
+            f"database.py was imported before serve.py set WEB_CONCURRENCY={workers}, so its pools are sized "
+            f"for {database.WEB_CONCURRENCY} worker(s); start the server with python serve.py or python main.py"
+        )
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    print(f"Starting Nivra API on http://{args.host}:{args.port} with {workers} workers")
+
+    if BaseApplication is not None:
+        run_gunicorn(workers, args.host, args.port)
+    else:
+        run_uvicorn(workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Placement of societies on separate databases (shards).
+
+The main database (DATABASE_URL) is the "default" shard and the directory. It
+holds the RBAC tables, society admins, join requests and jobs, plus a copy
+of every society row, and it keeps the ledger of every society that has not
+been placed elsewhere. Societies placed on another shard keep their ledger on
+that shard: the society row itself, residents, resident finances and society
+finances. Every shard records its own changes in its own outbox (outbox.py).
+The society_shards table in the directory maps a society to its shard.
+
+Requests are routed by the society they name: the society_id path or query
+parameter, the X-Society-ID header for routes that only carry a record ID
+(e.g. /residents/{resident_id}), or the society_id field of a JSON body.
+Requests that name no society use the default shard. List endpoints of
+callers who may see several societies read every shard involved concurrently
+and merge the results.
+
+Usage:
+    python sharding.py status                       # shards and how many societies each holds
+    python sharding.py assign <society_id> <shard>  # place a society that has no ledger rows yet
+    python sharding.py memberships                  # record the society of users' residents on other shards
+"""
+
+import os
+import sys
+import heapq
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import create_engine, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, sessionmaker
+
+import models
+from database import engine, SessionLocal, MonitoredQueuePool, POOL_OPTIONS
+
+# Configuration
+# Shard databases besides the main one, as comma-separated name=url pairs,
+# e.g. "large1=postgresql://...,large2=postgresql://..."
+SHARD_DATABASE_URLS = os.getenv("SHARD_DATABASE_URLS", "")
+# Shard new societies are created on
+SHARD_NEW_SOCIETIES = os.getenv("SHARD_NEW_SOCIETIES", "default")
+# How long a society's placement is cached by each worker
+SHARD_MAP_TTL_SECONDS = float(os.getenv("SHARD_MAP_TTL_SECONDS", "60"))
+# Threads reading shards concurrently for cross-shard list requests
+SHARD_FAN_OUT_THREADS = int(os.getenv("SHARD_FAN_OUT_THREADS", "8"))
+
+DEFAULT_SHARD = "default"
+SOCIETY_HEADER = "X-Society-ID"
+
+
+def parse_shard_urls(value: str) -> Dict[str, str]:
+    urls = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        name, _, url = pair.partition("=")
+        name, url = name.strip(), url.strip()
+        if not name or not url or name == DEFAULT_SHARD:
+            raise ValueError(f"Invalid SHARD_DATABASE_URLS entry: {pair.strip()!r}")
+        urls[name] = url
+    return urls
+
+
+shard_engines = {DEFAULT_SHARD: engine}
+for _name, _url in parse_shard_urls(SHARD_DATABASE_URLS).items():
+    shard_engines[_name] = create_engine(_url, poolclass=MonitoredQueuePool, **POOL_OPTIONS)
+
+_session_makers = {DEFAULT_SHARD: SessionLocal}
+for _name, _engine in shard_engines.items():
+    _session_makers.setdefault(_name, sessionmaker(autocommit=False, autoflush=False, bind=_engine))
+
+if SHARD_NEW_SOCIETIES not in shard_engines:
+    raise ValueError(f"SHARD_NEW_SOCIETIES names an unknown shard: {SHARD_NEW_SOCIETIES}")
+
+
+def sharding_enabled() -> bool:
+    return len(shard_engines) > 1
+
+
+def shard_session(shard: str, request: Optional[Request] = None) -> Session:
+    db = _session_makers[shard]()
+    db.info["shard"] = shard
+    if request is not None:
+        db.info["request"] = request
+    return db
+
+
+class ShardMap:
+    """
+    Per-process cache of society placements, read from society_shards in the
+    directory. Societies without a row live on the default shard. Placements
+    change rarely and only for societies without ledger rows, so entries are
+    cached for SHARD_MAP_TTL_SECONDS.
+    """
+
+    def __init__(self, ttl_seconds: float = SHARD_MAP_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[UUID, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, society_id: UUID) -> Optional[str]:
+        entry = self._entries.get(society_id)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl_seconds:
+            return entry[0]
+        return None
+
+    def shards_for(self, society_ids: Iterable[UUID]) -> Dict[UUID, str]:
+        """The shard of each society, with at most one directory query for the uncached ones."""
+        society_ids = set(society_ids)
+        if not sharding_enabled():
+            return {society_id: DEFAULT_SHARD for society_id in society_ids}
+        with self._lock:
+            placements = {society_id: self._cached(society_id) for society_id in society_ids}
+        missing = [society_id for society_id, shard in placements.items() if shard is None]
+        if missing:
+            with SessionLocal() as db:
+                rows = dict(db.execute(
+                    select(models.SocietyShard.society_id, models.SocietyShard.shard)
+                    .where(models.SocietyShard.society_id.in_(missing))
+                ).all())
+            now = time.monotonic()
+            with self._lock:
+                for society_id in missing:
+                    shard = rows.get(society_id, DEFAULT_SHARD)
+                    self._entries[society_id] = (shard, now)
+                    placements[society_id] = shard
+        return placements
+
+    def shard_for(self, society_id: UUID) -> str:
+        return self.shards_for([society_id])[society_id]
+
+    def assign(self, db: Session, society_id: UUID, shard: str):
+        """Record a placement in the directory session's transaction."""
+        if shard not in shard_engines:
+            raise ValueError(f"Unknown shard: {shard}")
+        db.execute(
+            pg_insert(models.SocietyShard)
+            .values(society_id=society_id, shard=shard)
+            .on_conflict_do_update(index_elements=[models.SocietyShard.society_id], set_={"shard": shard})
+        )
+        self.forget(society_id)
+
+    def forget(self, society_id: UUID):
+        with self._lock:
+            self._entries.pop(society_id, None)
+
+
+shard_map = ShardMap()
+
+
+def _as_uuid(value) -> Optional[UUID]:
+    try:
+        return value if isinstance(value, UUID) else UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+async def request_society_id(request: Request) -> Optional[UUID]:
+    """The society a request is about, from its path, query, X-Society-ID header or body."""
+    for value in (request.path_params.get("society_id"), request.query_params.get("society_id")):
+        if value is not None:
+            return _as_uuid(value)
+    header = request.headers.get(SOCIETY_HEADER)
+    if header:
+        society_id = _as_uuid(header)
+        if society_id is None:
+            raise HTTPException(status_code=400, detail={
+                "code": "INVALID_SOCIETY_HEADER",
+                "message": f"{SOCIETY_HEADER} must be a society ID",
+                "field": SOCIETY_HEADER
+            })
+        return society_id
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            # FastAPI has already read and cached the body for the endpoint
+            body = await request.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and body.get("society_id") is not None:
+            return _as_uuid(body["society_id"])
+    return None
+
+
+async def request_shard(request: Request) -> str:
+    if not sharding_enabled():
+        return DEFAULT_SHARD
+    society_id = await request_society_id(request)
+    if society_id is None:
+        return DEFAULT_SHARD
+    return shard_map.shard_for(society_id)
+
+
+# Dependency to get a session on the shard of the request's society
+def get_shard_db(request: Request, shard: str = Depends(request_shard)):
+    db = shard_session(shard, request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def copy_society(society: models.Society, shard: str, deleted: bool = False):
+    """
+    Write a society row, or its deletion, to another shard's database. The
+    directory keeps a copy of every society for the society admins, join
+    requests and jobs that reference it; the society's own shard keeps the
+    row its ledger references.
+    """
+    with shard_session(shard) as db:
+        if deleted:
+            target = db.get(models.Society, society.id)
+            if target is not None:
+                from purge import delete_dependents
+                delete_dependents(db, society.id)
+                db.delete(target)
+        else:
+            values = {column.key: getattr(society, column.key) for column in models.Society.__table__.columns}
+            db.execute(
+                pg_insert(models.Society).values(**values)
+                .on_conflict_do_update(index_elements=[models.Society.id], set_=values)
+            )
+        db.commit()
+
+
+def require_same_shard(db: Session, society_id: UUID):
+    """Reject writes that would move a record to a society on another shard."""
+    if shard_map.shard_for(society_id) != db.info.get("shard", DEFAULT_SHARD):
+        raise HTTPException(status_code=400, detail={
+            "code": "CROSS_SHARD_MOVE",
+            "message": "Records cannot be moved to a society on another shard",
+            "field": "society_id"
+        })
+
+
+# Cross-shard reads
+
+_fan_out_pool = ThreadPoolExecutor(max_workers=SHARD_FAN_OUT_THREADS, thread_name_prefix="shard-fan-out")
+
+
+def shards_of(society_ids: Optional[Iterable[UUID]]) -> Set[str]:
+    """Shards holding the given societies; None means every society, so every shard."""
+    if society_ids is None:
+        return set(shard_engines)
+    return set(shard_map.shards_for(society_ids).values())
+
+
+def fan_out(shards: Iterable[str], read: Callable[[Session], List], request: Optional[Request] = None) -> Dict[str, List]:
+    """
+    Run read(session) on each shard concurrently, each in its own session, and
+    return the results by shard. Loaded objects stay usable after their
+    sessions close; relations that were not loaded eagerly are not available.
+    """
+    def run(shard: str):
+        with shard_session(shard, request) as db:
+            return read(db)
+
+    shards = sorted(shards)
+    if len(shards) == 1:
+        return {shards[0]: run(shards[0])}
+    futures = {shard: _fan_out_pool.submit(run, shard) for shard in shards}
+    return {shard: future.result() for shard, future in futures.items()}
+
+
+def read_page(
+    db: Session,
+    society_ids: Optional[Iterable[UUID]],
+    query: Callable[[Session], object],
+    skip: int,
+    limit: int,
+    key: Callable,
+    reverse: bool = False,
+) -> List:
+    """
+    One page of a list query over the shards holding society_ids (None for
+    every shard). query(session) builds the ordered query for a session and
+    key sorts its rows the same way. With one shard involved the page is read
+    with the request's own session; otherwise each shard returns its first
+    skip + limit rows and the pages are merged.
+    """
+    shards = shards_of(society_ids)
+    if shards <= {db.info.get("shard", DEFAULT_SHARD)}:
+        return query(db).offset(skip).limit(limit).all()
+    results = fan_out(shards, lambda session: query(session).limit(skip + limit).all(), db.info.get("request"))
+    merged = heapq.merge(*results.values(), key=key, reverse=reverse)
+    return list(islice(merged, skip, skip + limit))
+
+
+def nulls_last(value):
+    """Sort key part ordering None after every value, like NULLS LAST."""
+    return (value is None, value if value is not None else "")
+
+
+# Resident memberships: users.resident_society_id in the directory records
+# the society of a user's resident, wherever the resident lives
+
+def resident_society(resident_id: UUID) -> Optional[UUID]:
+    """The society of a resident on any shard, or None if no shard has it."""
+    found = fan_out(shards_of(None), lambda session: session.query(models.Resident.society_id).filter(
+        models.Resident.id == resident_id
+    ).scalar())
+    return next((society_id for society_id in found.values() if society_id is not None), None)
+
+
+def update_users(db: Session, condition, **values):
+    """
+    Update the directory's users matching condition, e.g. to unlink residents
+    db is deleting: in db's own transaction when db is on the directory,
+    otherwise in a directory transaction committed before db's.
+    """
+    statement = update(models.User).where(condition).values(**values).execution_options(synchronize_session=False)
+    if db.info.get("shard", DEFAULT_SHARD) == DEFAULT_SHARD:
+        db.execute(statement)
+        return
+    with shard_session(DEFAULT_SHARD) as directory:
+        directory.execute(statement)
+        directory.commit()
+
+
+def backfill_memberships(batch_size: int = 1000) -> int:
+    """Set resident_society_id for users linked to residents on other shards; returns how many."""
+    updated = 0
+    with SessionLocal() as directory:
+        resident_ids = directory.execute(select(models.User.resident_id).where(
+            models.User.resident_id.isnot(None), models.User.resident_society_id.is_(None)
+        )).scalars().all()
+        for start in range(0, len(resident_ids), batch_size):
+            batch = resident_ids[start:start + batch_size]
+            found = fan_out(shards_of(None), lambda session: session.query(
+                models.Resident.id, models.Resident.society_id
+            ).filter(models.Resident.id.in_(batch)).all())
+            for rows in found.values():
+                for resident_id, society_id in rows:
+                    updated += directory.execute(
+                        update(models.User).where(models.User.resident_id == resident_id).values(resident_society_id=society_id)
+                    ).rowcount
+            directory.commit()
+    return updated
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Nivra society placement on shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Show shards and how many societies each holds")
+    assign_parser = subparsers.add_parser("assign", help="Place a society that has no ledger rows yet on a shard")
+    assign_parser.add_argument("society_id", type=UUID)
+    assign_parser.add_argument("shard")
+    subparsers.add_parser("memberships", help="Record the society of users' residents on other shards in the directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        with SessionLocal() as db:
+            placed = dict(db.execute(
+                select(models.SocietyShard.shard, func.count()).group_by(models.SocietyShard.shard)
+            ).all())
+            total = db.query(func.count(models.Society.id)).scalar()
+        placed[DEFAULT_SHARD] = total - sum(count for shard, count in placed.items() if shard != DEFAULT_SHARD)
+        print(json.dumps({shard: placed.get(shard, 0) for shard in shard_engines}, indent=2))
+        return 0
+
+    if args.command == "memberships":
+        print(f"Recorded the society of {backfill_memberships()} user(s)")
+        return 0
+
+    if args.shard not in shard_engines:
+        print(f"Unknown shard: {args.shard}")
+        return 1
+    with SessionLocal() as directory:
+        society = directory.query(models.Society).filter(models.Society.id == args.society_id).first()
+        if society is None:
+            print(f"Society {args.society_id} not found")
+            return 1
+        current = shard_map.shard_for(args.society_id)
+        if current == args.shard:
+            print(f"Society {args.society_id} is already on {args.shard}")
+            return 0
+        with shard_session(current) as db:
+            if db.query(models.Resident.id).filter(models.Resident.society_id == args.society_id).first() or \
+                    db.query(models.SocietyFinance.id).filter(models.SocietyFinance.society_id == args.society_id).first():
+                print(f"Society {args.society_id} has ledger rows on {current}; moving them is not supported")
+                return 1
+        if args.shard != DEFAULT_SHARD:
+            copy_society(society, args.shard)
+        shard_map.assign(directory, args.society_id, args.shard)
+        directory.commit()
+        if current != DEFAULT_SHARD:
+            copy_society(society, current, deleted=True)
+    print(f"Placed society {args.society_id} on {args.shard}; workers pick it up within {SHARD_MAP_TTL_SECONDS:g}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import os
+from typing import FrozenSet, Optional
+from uuid import UUID
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from fastapi.security import OAuth2PasswordBearer
+from fastapi.security.utils import get_authorization_scheme_param
+from jose import JWTError, jwt
+from sqlalchemy import event, or_, select, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from database import engine, get_async_db
+from endpoints.auth import get_current_user, get_current_active_user, SECRET_KEY, ALGORITHM
+
+# Configuration
+# enforce: list endpoints require a token; token: requests with a token are
+# scoped and anonymous ones see no rows; off: no scoping
+TENANT_SCOPING = os.getenv("TENANT_SCOPING", "enforce")
+# Enforce the scope with Postgres row-level security (migration 0005) instead
+# of filtering list queries in the application
+TENANT_RLS = os.getenv("TENANT_RLS", "false").lower() == "true"
+
+TENANT_ROLE = "nivra_tenant"
+# ASGI scope key of a SocietyScope set by in-process requests
+SCOPE_KEY = "society_scope"
+
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token", auto_error=False)
+
+
+class SocietyScope:
+    """
+    The societies a request may read. Applied to list queries as a
+    `society_id IN (...)` condition, so filtering happens in the same query
+    and can use the society_id indexes instead of checking rows one by one.
+    """
+
+    def __init__(self, society_ids: Optional[FrozenSet[UUID]] = None, user_id: Optional[UUID] = None):
+        # None means unrestricted (system admins, or scoping disabled)
+        self.society_ids = society_ids
+        self.user_id = user_id
+
+    @property
+    def unrestricted(self) -> bool:
+        return self.society_ids is None
+
+    def allows(self, society_id: UUID) -> bool:
+        return self.society_ids is None or society_id in self.society_ids
+
+    def filter(self, query, society_id_column):
+        if self.society_ids is None:
+            return query
+        return query.filter(society_id_column.in_(self.society_ids))
+
+    def filter_residents(self, query, resident_id_column):
+        """Scope rows that reach their society through a resident, such as resident finances."""
+        if self.society_ids is None:
+            return query
+        return query.filter(resident_id_column.in_(
+            select(models.Resident.id).where(models.Resident.society_id.in_(self.society_ids))
+        ))
+
+
+UNRESTRICTED = SocietyScope()
+# Callers who may see no society at all
+NO_SOCIETIES = SocietyScope(frozenset())
+
+
+def _administered_society_ids_query(user_id: UUID):
+    return select(models.SocietyAdmin.society_id).where(models.SocietyAdmin.user_id == user_id)
+
+
+def _with_residence(society_ids, resident_society_id: Optional[UUID]) -> FrozenSet[UUID]:
+    # The user's own society is recorded on the user (resident_society_id),
+    # as the resident may live on another shard
+    society_ids = set(society_ids)
+    if resident_society_id is not None:
+        society_ids.add(resident_society_id)
+    return frozenset(society_ids)
+
+
+async def accessible_society_ids(db: AsyncSession, user: models.User) -> FrozenSet[UUID]:
+    """Societies a user administers or lives in, with one query."""
+    rows = await db.execute(_administered_society_ids_query(user.id))
+    return _with_residence(rows.scalars(), user.resident_society_id)
+
+
+async def get_society_scope(
+    request: Request,
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> SocietyScope:
+    """Dependency resolving the societies the caller may list rows of."""
+    # In-process callers such as the warm-up set the scope themselves; a
+    # client cannot put anything in the ASGI scope
+    preset = request.scope.get(SCOPE_KEY)
+    if preset is not None:
+        return preset
+    if TENANT_SCOPING == "off":
+        return UNRESTRICTED
+    if token is None and request.scope.get("batch_principal") is None:
+        if TENANT_SCOPING == "enforce":
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return NO_SOCIETIES
+    if TENANT_RLS:
+        if _request_username(request) == "":
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        # Postgres applies the scope to every query of the request's session
+        return UNRESTRICTED
+
+    user = await get_current_active_user(await get_current_user(request, token, db), db)
+    role_name = (await db.execute(select(models.Role.name).where(models.Role.id == user.role_id))).scalar()
+    if role_name == "system_admin":
+        return UNRESTRICTED
+    return SocietyScope(await accessible_society_ids(db, user), user.id)
+
+
+# Row-level security mode
+
+def _request_username(request: Request) -> Optional[str]:
+    """The caller's username, or "" for a token that does not verify."""
+    principal = request.scope.get("batch_principal")
+    if principal is not None:
+        return principal.username
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub") or ""
+    except JWTError:
+        return ""
+
+
+def _resolve_scope(request: Request, connection) -> SocietyScope:
+    """The scope of a request, resolved on first use with the session's own connection."""
+    if TENANT_SCOPING == "off":
+        return UNRESTRICTED
+    username = _request_username(request)
+    if not username:
+        # Anonymous callers and tokens that do not verify
+        return NO_SOCIETIES
+
+    user = connection.execute(
+        select(models.User.id, models.User.resident_society_id, models.Role.name)
+        .join(models.Role, models.Role.id == models.User.role_id)
+        .where(or_(models.User.username == username, models.User.email == username), models.User.is_active == True)
+        .order_by((models.User.username == username).desc())
+        .limit(1)
+    ).first()
+    if user is None:
+        return NO_SOCIETIES
+    if user.name == "system_admin":
+        return UNRESTRICTED
+    society_ids = connection.execute(_administered_society_ids_query(user.id)).scalars()
+    return SocietyScope(_with_residence(society_ids, user.resident_society_id), user.id)
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_row_level_security(session, transaction, connection):
+    """
+    Switch each transaction of a request's session to the tenant role with
+    the caller's societies. The settings are transaction-local, so they
+    end with the transaction and never leak to the next user of a pooled
+    connection.
+    """
+    if not TENANT_RLS:
+        return
+    request = session.info.get("request")
+    if request is None:
+        return
+    scope = getattr(request.state, "society_scope", None)
+    if scope is None:
+        if session.info.get("shard", "default") == "default":
+            scope = _resolve_scope(request, connection)
+        else:
+            # Users live in the main database, not on other shards
+            with engine.connect() as directory:
+                scope = _resolve_scope(request, directory)
+        request.state.society_scope = scope
+    if scope.unrestricted:
+        return
+    connection.execute(
+        text(
+            "SELECT set_config('app.society_ids', :society_ids, true), "
+            "set_config('app.user_id', :user_id, true), "
+            "set_config('role', :role, true)"
+        ),
+        {
+            "society_ids": "{" + ",".join(str(society_id) for society_id in scope.society_ids) + "}",
+            "user_id": str(scope.user_id or ""),
+            "role": TENANT_ROLE,
+        },
+    )
+
+
+async def row_level_security_error_handler(request: Request, exc: ProgrammingError):
+    """Answer writes rejected by a row-level security policy with 403 instead of 500."""
+    if getattr(exc.orig, "pgcode", None) != "42501":  # insufficient_privilege
+        raise exc
+    return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": {
+        "code": "SOCIETY_ACCESS_DENIED",
+        "message": "No access to the society of this record"
+    }})
@@ -0,0 +1,26 @@
+"""
+Batch requests: sub-requests run in-process through the full middleware
+stack.
+"""
+
+from conftest import create_resident, create_society, unique
+
+
+def test_sub_request_accept_encoding_is_not_forwarded(client, admin):
+    society = create_society(client, admin, "Batched")
+    for number in range(10):
+        create_resident(client, admin, society, f"H-{number}", unique("Batched"))
+    path = f"/api/v1/residents/?society_id={society['id']}"
+    # Large enough to be compressed when asked for
+    direct = client.get(path, headers={**admin, "Accept-Encoding": "gzip"})
+    assert direct.headers["content-encoding"] == "gzip"
+
+    response = client.post("/api/v1/batch", headers=admin, json={"requests": [
+        {"method": "GET", "path": path, "headers": {"Accept-Encoding": "gzip", "Connection": "close"}}
+    ]})
+
+    assert response.status_code == 200, response.text
+    result = response.json()["responses"][0]
+    assert result["status"] == 200
+    assert "content-encoding" not in result["headers"]
+    assert len(result["body"]) == 10
@@ -0,0 +1,55 @@
+"""
+Vary: Accept-Encoding is set on every response with a compressible content
+type, whether it was compressed or not.
+"""
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from compression import CompressionMiddleware
+
+
+async def large(request):
+    return PlainTextResponse("x" * 4096)
+
+
+async def small(request):
+    return PlainTextResponse("ok")
+
+
+async def streamed(request):
+    async def chunks():
+        yield b"x" * 4096
+        yield b"y" * 4096
+    return StreamingResponse(chunks(), media_type="text/csv")
+
+
+async def image(request):
+    return Response(b"\x89PNG" * 1024, media_type="image/png")
+
+
+@pytest.fixture(scope="module")
+def app_client():
+    app = Starlette(routes=[Route(f"/{endpoint.__name__}", endpoint) for endpoint in (large, small, streamed, image)])
+    # Streams are passed through untouched
+    app.add_middleware(CompressionMiddleware, streaming=False)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path", ["/large", "/small", "/streamed"])
+@pytest.mark.parametrize("accept_encoding", ["gzip", "identity"])
+def test_compressible_responses_vary_on_accept_encoding(app_client, path, accept_encoding):
+    response = app_client.get(path, headers={"Accept-Encoding": accept_encoding})
+    assert response.status_code == 200
+    assert response.headers["vary"] == "Accept-Encoding"
+    compressed = path == "/large" and accept_encoding == "gzip"
+    assert ("content-encoding" in response.headers) == compressed
+
+
+def test_excluded_content_types_do_not_vary(app_client):
+    response = app_client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "vary" not in response.headers
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,25 @@
+"""
+The database rate-limit store lets requests through when it cannot reach
+the database, whatever the failure.
+"""
+
+import pytest
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+from ratelimit import Budget, DatabaseRateLimitStore
+
+
+@pytest.mark.parametrize("error", [
+    PoolTimeoutError("pool exhausted"),
+    OperationalError("INSERT INTO rate_limit_buckets", {}, Exception("connection refused")),
+])
+def test_database_store_fails_open(monkeypatch, error):
+    store = DatabaseRateLimitStore()
+
+    def fail():
+        raise error
+
+    monkeypatch.setattr(store, "_connect", fail)
+    budget = Budget(capacity=10, rate=1.0)
+    decisions = store.take([("user:ravi", budget), ("society:1", budget)])
+    assert [decision.allowed for decision in decisions] == [True, True]
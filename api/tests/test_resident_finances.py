@@ -0,0 +1,59 @@
+"""
+Resident finance due dates: every record has one, and the overdue sweep
+leaves records whose due date was estimated by migration 0012 alone.
+"""
+
+import uuid
+
+import jobs
+import models
+from sharding import DEFAULT_SHARD, shard_session
+from conftest import create_resident, create_society, unique
+
+
+def create_finance(client, admin, resident: dict, **fields) -> dict:
+    response = client.post("/api/v1/resident_finances/", headers=admin, json={
+        "resident_id": resident["id"], "transaction_type": "maintenance", "amount": "1500.00", **fields
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_due_date_is_required(client, admin):
+    society = create_society(client, admin, "Dated")
+    resident = create_resident(client, admin, society, "J-1", unique("Dated"))
+    finance = create_finance(client, admin, resident)
+    assert finance["due_date"] is not None and finance["due_date_estimated"] is False
+
+    response = client.put(f"/api/v1/resident_finances/{finance['id']}", headers=admin, json={"due_date": None})
+    assert response.status_code == 422
+
+
+def test_overdue_sweep_skips_estimated_due_dates(client, admin):
+    society = create_society(client, admin, "Swept")
+    resident = create_resident(client, admin, society, "K-1", unique("Swept"))
+    agreed = create_finance(client, admin, resident, due_date="2021-01-01")
+    estimated = create_finance(client, admin, resident, due_date="2021-01-01")
+    with shard_session(DEFAULT_SHARD) as db:
+        # As migration 0012 leaves a record that had no due date
+        db.query(models.ResidentFinance).filter(models.ResidentFinance.id == uuid.UUID(estimated["id"])).update(
+            {"due_date_estimated": True}
+        )
+        job = jobs.enqueue(db, "overdue_sweep", {"society_id": society["id"]})
+        db.commit()
+        job_id = job.id
+    with shard_session(DEFAULT_SHARD) as db:
+        job = jobs.claim_next(db, "test-worker")
+    assert job.id == job_id
+    jobs.run_job(job, "test-worker")
+
+    statuses = {
+        finance["id"]: client.get(f"/api/v1/resident_finances/{finance['id']}", headers=admin).json()["payment_status"]
+        for finance in (agreed, estimated)
+    }
+    assert statuses == {agreed["id"]: "overdue", estimated["id"]: "pending"}
+
+    # Setting a due date makes it agreed
+    response = client.put(f"/api/v1/resident_finances/{estimated['id']}", headers=admin, json={"due_date": "2021-02-01"})
+    assert response.status_code == 200, response.text
+    assert response.json()["due_date_estimated"] is False
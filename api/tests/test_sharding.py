@@ -0,0 +1,203 @@
+"""
+Societies placed on a second shard: placement, request routing, merged list
+pages, join-request approval, the directory's copy of each society and the
+shard's change outbox.
+"""
+
+import asyncio
+import uuid
+
+import pytest
+
+import migrate
+import models
+import join_requests
+import outbox
+import sharding
+from sharding import DEFAULT_SHARD, SOCIETY_HEADER, shard_map, shard_session
+from conftest import auth_headers, create_resident, create_society, signup, unique
+
+SHARD = "shard1"
+
+
+def find(shard: str, model, row_id):
+    with shard_session(shard) as db:
+        return db.get(model, uuid.UUID(str(row_id)))
+
+
+def test_every_shard_has_the_full_schema(databases):
+    for engine in sharding.shard_engines.values():
+        assert migrate.find_drift(engine) == []
+
+
+def test_assign_places_society_on_shard(client, admin):
+    society = create_society(client, admin, "Placed", SHARD)
+    society_id = uuid.UUID(society["id"])
+
+    assert shard_map.shard_for(society_id) == SHARD
+    # The shard holds the row its ledger references, the directory its copy
+    assert find(SHARD, models.Society, society_id) is not None
+    assert find(DEFAULT_SHARD, models.Society, society_id) is not None
+    assert find(DEFAULT_SHARD, models.SocietyShard, society_id).shard == SHARD
+
+
+def test_assign_refuses_society_with_ledger_rows(client, admin):
+    society = create_society(client, admin, "Busy")
+    create_resident(client, admin, society, "A-1", unique("Busy"))
+
+    assert sharding.main(["assign", society["id"], SHARD]) == 1
+    assert shard_map.shard_for(uuid.UUID(society["id"])) == DEFAULT_SHARD
+
+
+def test_writes_and_reads_are_routed_to_the_society_shard(client, admin):
+    society = create_society(client, admin, "Routed", SHARD)
+    resident = create_resident(client, admin, society, "B-1", unique("Routed"))
+
+    assert find(SHARD, models.Resident, resident["id"]) is not None
+    assert find(DEFAULT_SHARD, models.Resident, resident["id"]) is None
+
+    # Routes that carry only a record ID need the society in the header
+    assert client.get(f"/api/v1/residents/{resident['id']}", headers=admin).status_code == 404
+    response = client.get(f"/api/v1/residents/{resident['id']}", headers={**admin, SOCIETY_HEADER: society["id"]})
+    assert response.status_code == 200
+    assert response.json()["society_id"] == society["id"]
+
+    response = client.get(f"/api/v1/residents/{resident['id']}", headers={**admin, SOCIETY_HEADER: "not-a-uuid"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == "INVALID_SOCIETY_HEADER"
+
+
+def test_list_pages_merge_every_shard(client, admin):
+    last_name = unique("Merged")
+    local = create_society(client, admin, "Local")
+    placed = create_society(client, admin, "Remote", SHARD)
+    # Interleaved unit numbers, so every page needs rows from both shards
+    for number in range(6):
+        create_resident(client, admin, placed if number % 2 else local, f"C-{number}", last_name)
+
+    pages = [
+        client.get("/api/v1/residents/", headers=admin, params={"name": last_name, "skip": skip, "limit": 2}).json()
+        for skip in (0, 2, 4, 6)
+    ]
+
+    assert [[resident["unit_number"] for resident in page] for page in pages] == [
+        ["C-0", "C-1"], ["C-2", "C-3"], ["C-4", "C-5"], []
+    ]
+    assert {resident["society_id"] for resident in pages[0]} == {local["id"], placed["id"]}
+
+
+def test_society_changes_are_mirrored_to_the_directory(client, admin):
+    society = create_society(client, admin, "Mirrored", SHARD)
+
+    response = client.put(f"/api/v1/societies/{society['id']}", headers=admin, json={"name": "Mirrored Heights"})
+    assert response.status_code == 200, response.text
+    assert find(SHARD, models.Society, society["id"]).name == "Mirrored Heights"
+    assert find(DEFAULT_SHARD, models.Society, society["id"]).name == "Mirrored Heights"
+
+    response = client.delete(f"/api/v1/societies/{society['id']}", headers=admin)
+    assert response.status_code in (200, 204), response.text
+    assert find(SHARD, models.Society, society["id"]) is None
+    assert find(DEFAULT_SHARD, models.Society, society["id"]) is None
+
+
+def test_join_request_approval_creates_resident_on_shard(client, admin):
+    society = create_society(client, admin, "Joined", SHARD)
+    other = create_society(client, admin, "Other", SHARD)
+    create_resident(client, admin, other, "D-1", unique("Other"))
+    username = unique("joiner")
+    user = signup(client, username)
+
+    response = client.post("/api/v1/join-requests/", headers=admin, json={
+        "user_id": user["id"], "society_id": society["id"], "requested_unit_number": "D-9"
+    })
+    assert response.status_code == 201, response.text
+    response = client.post(
+        f"/api/v1/societies/{society['id']}/join-requests/approve", headers=admin,
+        json={"request_ids": [response.json()["id"]]}
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["skipped"] == []
+
+    linked = find(DEFAULT_SHARD, models.User, user["id"])
+    assert linked.resident_society_id == uuid.UUID(society["id"])
+    resident = find(SHARD, models.Resident, linked.resident_id)
+    assert resident.unit_number == "D-9"
+    assert client.get(f"/api/v1/users/{user['id']}/resident", headers=admin).json()["id"] == str(resident.id)
+
+    # The new resident sees their own society's residents, not the other's
+    own = client.get("/api/v1/residents/", headers=auth_headers(client, username, "secret123")).json()
+    assert [row["id"] for row in own] == [str(resident.id)]
+
+    # Deleting the resident unlinks the user in the directory
+    response = client.delete(f"/api/v1/residents/{resident.id}", headers={**admin, SOCIETY_HEADER: society["id"]})
+    assert response.status_code == 204, response.text
+    unlinked = find(DEFAULT_SHARD, models.User, user["id"])
+    assert unlinked.resident_id is None and unlinked.resident_society_id is None
+
+
+def test_failed_shard_commit_undoes_approval(client, admin, monkeypatch):
+    society = create_society(client, admin, "Failing", SHARD)
+    user = signup(client, unique("failing"))
+    response = client.post("/api/v1/join-requests/", headers=admin, json={
+        "user_id": user["id"], "society_id": society["id"], "requested_unit_number": "E-1"
+    })
+    request_id = uuid.UUID(response.json()["id"])
+
+    def fail():
+        raise RuntimeError("shard unavailable")
+
+    with shard_session(DEFAULT_SHARD) as db, shard_session(SHARD) as residents_db:
+        monkeypatch.setattr(residents_db, "commit", fail)
+        with pytest.raises(RuntimeError):
+            join_requests.review(db, uuid.UUID(society["id"]), [request_id], True, residents_db=residents_db)
+
+    assert find(DEFAULT_SHARD, models.SocietyJoinRequest, request_id).status == join_requests.PENDING
+    unlinked = find(DEFAULT_SHARD, models.User, user["id"])
+    assert unlinked.resident_id is None and unlinked.resident_society_id is None
+    with shard_session(SHARD) as db:
+        assert db.query(models.Resident).filter(models.Resident.society_id == uuid.UUID(society["id"])).count() == 0
+
+
+def test_memberships_backfills_shard_residents(client, admin):
+    society = create_society(client, admin, "Backfilled", SHARD)
+    resident = create_resident(client, admin, society, "F-1", unique("Backfilled"))
+    user = signup(client, unique("backfilled"))
+    with shard_session(DEFAULT_SHARD) as db:
+        # As left by migration 0013, which only sees directory residents
+        db.query(models.User).filter(models.User.id == uuid.UUID(user["id"])).update(
+            {"resident_id": uuid.UUID(resident["id"]), "resident_society_id": None}
+        )
+        db.commit()
+
+    assert sharding.main(["memberships"]) == 0
+    assert find(DEFAULT_SHARD, models.User, user["id"]).resident_society_id == uuid.UUID(society["id"])
+
+
+def test_shard_changes_reach_outbox_subscribers(client, admin):
+    society = create_society(client, admin, "Outboxed", SHARD)
+    local, shared = [], []
+    outbox.outbox_subscriber("test_local")(local.extend)
+    outbox.outbox_subscriber("test_shared", shared=True)(lambda db, events: shared.extend(events))
+    tail = outbox.OutboxTail()
+    try:
+        # Start the tail at the end of each feed, and create the shared cursors
+        asyncio.run(tail.poll())
+        outbox.Dispatcher().run_once()
+
+        resident = create_resident(client, admin, society, "G-1", unique("Outboxed"))
+        with shard_session(SHARD) as db:
+            recorded = db.query(models.OutboxEvent).filter(models.OutboxEvent.entity_id == uuid.UUID(resident["id"])).all()
+        assert [event.op for event in recorded] == ["created"]
+
+        asyncio.run(tail.poll())
+        while outbox.Dispatcher().run_once():
+            pass
+    finally:
+        outbox.SUBSCRIBERS.pop("test_local")
+        outbox.SUBSCRIBERS.pop("test_shared")
+
+    assert set(tail.cursors) == {DEFAULT_SHARD, SHARD}
+    for delivered in (local, shared):
+        assert [(event["entity"], event["op"]) for event in delivered if event["entity_id"] == resident["id"]] == [
+            ("resident", "created")
+        ]
@@ -0,0 +1,70 @@
+"""
+Delta sync: initial pages and the change feed are limited to the caller's
+societies, and read from the shard of the society synced.
+"""
+
+import uuid
+
+import models
+from sharding import DEFAULT_SHARD, shard_session
+from conftest import auth_headers, create_resident, create_society, signup, unique
+
+
+def resident_user(client, admin, society: dict) -> dict:
+    """Headers of a new user living in society."""
+    resident = create_resident(client, admin, society, "S-1", unique("Synced"))
+    username = unique("syncer")
+    user = signup(client, username)
+    with shard_session(DEFAULT_SHARD) as db:
+        db.query(models.User).filter(models.User.id == uuid.UUID(user["id"])).update(
+            {"resident_id": uuid.UUID(resident["id"]), "resident_society_id": uuid.UUID(society["id"])}
+        )
+        db.commit()
+    return auth_headers(client, username, "secret123")
+
+
+def synced_residents(client, headers: dict, params: dict) -> dict:
+    response = client.get("/api/v1/sync", headers=headers, params={"entities": "residents", **params})
+    assert response.status_code == 200, response.text
+    return response.json()["residents"]
+
+
+def test_sync_requires_a_token(client):
+    response = client.get("/api/v1/sync", params={"society_id": str(uuid.uuid4())})
+    assert response.status_code == 401
+
+
+def test_sync_returns_only_the_callers_societies(client, admin):
+    own = create_society(client, admin, "Own")
+    other = create_society(client, admin, "Other")
+    create_resident(client, admin, other, "S-2", unique("Hidden"))
+    headers = resident_user(client, admin, own)
+    params = {"society_id": own["id"]}
+
+    initial = synced_residents(client, headers, params)
+    assert {row["society_id"] for row in initial["changed"]} == {own["id"]}
+
+    create_resident(client, admin, other, "S-3", unique("Hidden"))
+    added = create_resident(client, admin, own, "S-4", unique("Synced"))
+    changes = synced_residents(client, headers, {**params, "residents_since": initial["watermark"]})
+    assert [row["id"] for row in changes["changed"]] == [added["id"]]
+
+    response = client.get("/api/v1/sync", headers=headers, params={"society_id": other["id"]})
+    assert response.status_code == 403
+    assert response.json()["detail"]["code"] == "SOCIETY_FORBIDDEN"
+
+
+def test_sync_of_a_shard_society(client, admin):
+    society = create_society(client, admin, "Sharded", "shard1")
+    headers = resident_user(client, admin, society)
+    params = {"society_id": society["id"]}
+
+    initial = synced_residents(client, headers, params)
+    added = create_resident(client, admin, society, "S-5", unique("Synced"))
+    changes = synced_residents(client, headers, {**params, "residents_since": initial["watermark"]})
+    assert [row["id"] for row in changes["changed"]] == [added["id"]]
+
+    # One shard's watermark means nothing on another, so a society is required
+    response = client.get("/api/v1/sync", headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == "SOCIETY_REQUIRED"
@@ -0,0 +1,19 @@
+"""
+Worker warm-up: every step runs the queries it is meant to compile.
+"""
+
+import main
+import warmup
+
+
+def test_warm_up_paths_run_their_queries(client):
+    for path in warmup.DEFAULT_WARMUP_PATHS:
+        status = client.portal.call(warmup._request, main.app, path)
+        # Lists answer 200; placeholder ids answer 404 after their query ran
+        assert status in (200, 404), (path, status)
+
+
+def test_warm_up_completes(client):
+    state = warmup.WarmupState()
+    client.portal.call(warmup.warm_up, main.app, state)
+    assert set(state.steps) == {"sync_pool", "async_pool", "auth_statements", "hot_queries"}
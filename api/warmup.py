@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import logging
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from database import engine, async_engine, AsyncSessionLocal, POOL_SIZE
+
+# Configuration
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+# Connections opened per engine (sync and async) before the worker reports ready
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", str(POOL_SIZE)))
+WARMUP_RETRY_SECONDS = int(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+# Placeholder id for routes with a path parameter; the 404 still compiles the query
+NIL_ID = "00000000-0000-0000-0000-000000000000"
+
+# Hot read endpoints of the finance and resident routers. Requesting each
+# once compiles its SQL into the engine's statement cache and builds the
+# response serializers, so the first real request does not pay for it.
+DEFAULT_WARMUP_PATHS = [
+    "/api/v1/societies/?limit=1",
+    "/api/v1/residents/?limit=1",
+    f"/api/v1/residents/{NIL_ID}",
+    f"/api/v1/societies/{NIL_ID}/residents?limit=1",
+    "/api/v1/resident_finances/?limit=1",
+    f"/api/v1/resident_finances/{NIL_ID}",
+    f"/api/v1/residents/{NIL_ID}/finances?limit=1",
+    "/api/v1/society_finances/?limit=1",
+    f"/api/v1/society_finances/{NIL_ID}",
+    f"/api/v1/societies/{NIL_ID}/finances?limit=1",
+]
+WARMUP_PATHS = [path for path in os.getenv("WARMUP_PATHS", ",".join(DEFAULT_WARMUP_PATHS)).split(",") if path]
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    """Progress of this worker's warm-up, reported by the readiness endpoint."""
+
+    def __init__(self):
+        self.status = "pending"  # pending, warming, ready, failed
+        self.attempts = 0
+        self.started_at: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "attempts": self.attempts,
+            "duration_ms": self.duration_ms,
+            "steps_ms": dict(self.steps),
+            "error": self.error,
+        }
+
+
+warmup_state = WarmupState()
+
+
+def _prime_sync_pool(connections: int):
+    # Hold all connections at once so the pool really opens that many
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            opened.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in opened:
+            connection.close()
+
+
+async def _prime_async_pool(connections: int):
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = await async_engine.connect()
+            opened.append(connection)
+            await connection.execute(text("SELECT 1"))
+    finally:
+        for connection in opened:
+            await connection.close()
+
+
+async def _compile_auth_statements():
+    """
+    Compile the login and RBAC queries into the async engine's statement
+    cache. Roles and permissions are read live on every request, so no
+    reference data is loaded.
+    """
+    from endpoints.auth import get_user_by_username_or_email, has_permission
+    async with AsyncSessionLocal() as db:
+        await get_user_by_username_or_email(db, "")
+        await has_permission("societies", "read", SimpleNamespace(role_id=UUID(NIL_ID)), db)
+
+
+async def _request(app, path: str) -> int:
+    """
+    Send a GET through the full ASGI stack in-process and return its status.
+    The request carries no credentials; it lists with an unrestricted scope,
+    so the list endpoints run their queries instead of answering 401. With
+    TENANT_RLS the database still applies an anonymous (empty) scope.
+    """
+    from tenancy import SCOPE_KEY, UNRESTRICTED
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [(b"host", b"warmup"), (b"user-agent", b"nivra-warmup")],
+        "client": ("127.0.0.1", 0),
+        "server": ("warmup", 80),
+        SCOPE_KEY: UNRESTRICTED,
+    }
+    response = {"status": 500}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+
+    await app(scope, receive, send)
+    return response["status"]
+
+
+async def _compile_hot_queries(app, paths: List[str]):
+    for path in paths:
+        status = await _request(app, path)
+        # 401 and 403 are answered before the endpoint's queries run
+        if status >= 500 or status in (401, 403):
+            raise RuntimeError(f"Warm-up request GET {path} returned {status}")
+
+
+async def warm_up(app, state: WarmupState = warmup_state, connections: int = WARMUP_CONNECTIONS, paths: List[str] = WARMUP_PATHS):
+    """Run each warm-up step once, recording how long each took."""
+    steps = [
+        ("sync_pool", lambda: run_in_threadpool(_prime_sync_pool, connections)),
+        ("async_pool", lambda: _prime_async_pool(connections)),
+        ("auth_statements", _compile_auth_statements),
+        ("hot_queries", lambda: _compile_hot_queries(app, paths)),
+    ]
+    state.steps = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        await step()
+        state.steps[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def run_warmup(app, state: WarmupState = warmup_state):
+    """
+    Warm this worker up in the background, retrying until it succeeds, so a
+    database that is briefly unavailable at deploy time delays readiness
+    instead of failing the worker.
+    """
+    if not WARMUP_ENABLED:
+        state.status = "ready"
+        return
+    state.started_at = time.perf_counter()
+    while True:
+        state.status = "warming"
+        state.attempts += 1
+        try:
+            await warm_up(app, state)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            state.status = "failed"
+            state.error = f"{type(e).__name__}: {e}"
+            logger.warning("Warm-up attempt %d failed: %s", state.attempts, state.error)
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+            continue
+        state.status = "ready"
+        state.error = None
+        state.duration_ms = round((time.perf_counter() - state.started_at) * 1000, 1)
+        return
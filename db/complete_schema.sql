@@ -37,7 +37,7 @@ CREATE TABLE societies (
 -- Create residents table
 CREATE TABLE residents (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    society_id UUID NOT NULL REFERENCES societies(id),
+    society_id UUID NOT NULL REFERENCES societies(id) ON DELETE CASCADE,
     first_name VARCHAR(100) NOT NULL,
     last_name VARCHAR(100) NOT NULL,
     email VARCHAR(255), -- Removed UNIQUE constraint to allow same person to have multiple units or family members to share
@@ -53,14 +53,16 @@ CREATE TABLE residents (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
--- Create resident_finances table
+-- Create resident_finances table, range-partitioned by due_date (see
+-- api/partitions.py); records without a due date are due on the day they
+-- are created
 CREATE TABLE resident_finances (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    resident_id UUID NOT NULL REFERENCES residents(id),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    resident_id UUID NOT NULL REFERENCES residents(id) ON DELETE CASCADE,
     transaction_type VARCHAR(50) NOT NULL, -- maintenance, penalty, special_charge, etc.
     amount DECIMAL(10, 2) NOT NULL,
     currency VARCHAR(3) DEFAULT 'INR',
-    due_date DATE,
+    due_date DATE NOT NULL DEFAULT CURRENT_DATE,
     payment_date DATE,
     payment_method VARCHAR(50),
     payment_status VARCHAR(20) DEFAULT 'pending', -- pending, paid, overdue, etc.
@@ -69,13 +71,21 @@ CREATE TABLE resident_finances (
     receipt_number VARCHAR(100),
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- due_date was filled in by migration 0012, not agreed; the overdue sweep skips these
+    due_date_estimated BOOLEAN NOT NULL DEFAULT FALSE,
+    CONSTRAINT resident_finances_pkey PRIMARY KEY (id, due_date)
+) PARTITION BY RANGE (due_date);
 
--- Create society_finances table for common amenities and services
+-- Rows whose partition does not exist yet;
+-- yearly or monthly partitions are created by api/partitions.py
+CREATE TABLE resident_finances_default PARTITION OF resident_finances DEFAULT;
+
+-- Create society_finances table for common amenities and services,
+-- range-partitioned by expense_date
 CREATE TABLE society_finances (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    society_id UUID NOT NULL REFERENCES societies(id),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    society_id UUID NOT NULL REFERENCES societies(id) ON DELETE CASCADE,
     expense_type VARCHAR(50) NOT NULL CHECK (expense_type IN ('income', 'expense', 'regular', 'adhoc', 'maintenance_fees', 'parking_fees', 'amenity_fees', 'late_fees', 'interest_income', 'rental_income', 'deposits', 'other_income')),
     category VARCHAR(50) NOT NULL, -- security, housekeeping, gardener, electricity, water, event, maintenance, parking, etc.
     vendor_name VARCHAR(255),
@@ -94,7 +104,59 @@ CREATE TABLE society_finances (
     transaction_category VARCHAR(20) DEFAULT 'expense' CHECK (transaction_category IN ('income', 'expense')),
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT society_finances_pkey PRIMARY KEY (id, expense_date)
+) PARTITION BY RANGE (expense_date);
+
+-- Rows whose partition does not exist yet
+CREATE TABLE society_finances_default PARTITION OF society_finances DEFAULT;
+
+-- Soft-deleted finance records and settled records of closed financial
+-- years, moved out of the hot tables by the finance_archive job (see
+-- api/archive.py). Same columns as the hot tables, plus when each row moved.
+CREATE TABLE resident_finances_archive (
+    id UUID PRIMARY KEY,
+    resident_id UUID NOT NULL REFERENCES residents(id) ON DELETE CASCADE,
+    transaction_type VARCHAR(50) NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    currency VARCHAR(3),
+    due_date DATE,
+    payment_date DATE,
+    payment_method VARCHAR(50),
+    payment_status VARCHAR(20),
+    description TEXT,
+    invoice_number VARCHAR(100),
+    receipt_number VARCHAR(100),
+    is_active BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    due_date_estimated BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE society_finances_archive (
+    id UUID PRIMARY KEY,
+    society_id UUID NOT NULL REFERENCES societies(id) ON DELETE CASCADE,
+    expense_type VARCHAR(50) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    vendor_name VARCHAR(255),
+    expense_date DATE NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    currency VARCHAR(3),
+    payment_status VARCHAR(20) NOT NULL,
+    payment_date DATE,
+    payment_method VARCHAR(50),
+    invoice_number VARCHAR(100),
+    receipt_number VARCHAR(100),
+    description TEXT,
+    recurring BOOLEAN,
+    recurring_frequency VARCHAR(20),
+    next_due_date DATE,
+    transaction_category VARCHAR(20),
+    is_active BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
 -- ================================================
@@ -118,7 +180,8 @@ CREATE TABLE users (
     email VARCHAR(255) NOT NULL UNIQUE,
     full_name VARCHAR(255) NOT NULL,
     role_id UUID NOT NULL REFERENCES roles(id),
-    resident_id UUID REFERENCES residents(id), -- Link to resident if applicable
+    resident_id UUID, -- Link to resident if applicable; no foreign key as it may live on another shard
+    resident_society_id UUID, -- Society of that resident, for tenant scoping without a lookup on its shard
     user_status VARCHAR(20) DEFAULT 'pending_society', -- 'pending_society', 'active', 'inactive'
     is_active BOOLEAN DEFAULT TRUE,
     last_login TIMESTAMP WITH TIME ZONE,
@@ -150,7 +213,7 @@ CREATE TABLE role_permissions (
 CREATE TABLE society_admins (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id),
-    society_id UUID NOT NULL REFERENCES societies(id),
+    society_id UUID NOT NULL REFERENCES societies(id) ON DELETE CASCADE,
     is_primary_admin BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
@@ -165,7 +228,7 @@ CREATE TABLE society_admins (
 CREATE TABLE society_join_requests (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id),
-    society_id UUID NOT NULL REFERENCES societies(id),
+    society_id UUID NOT NULL REFERENCES societies(id) ON DELETE CASCADE,
     request_type VARCHAR(20) NOT NULL DEFAULT 'join', -- 'join' or 'invite'
     requested_unit_number VARCHAR(50),
     is_owner BOOLEAN DEFAULT FALSE,
@@ -175,8 +238,84 @@ CREATE TABLE society_join_requests (
     reviewed_at TIMESTAMP WITH TIME ZONE,
     review_message TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE (user_id, society_id, status) -- Prevent duplicate pending requests
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ================================================
+-- API SUPPORT TABLES
+-- ================================================
+
+-- Shard of each society placed outside the main database (see api/sharding.py);
+-- societies without a row live on the default shard
+CREATE TABLE society_shards (
+    society_id UUID PRIMARY KEY REFERENCES societies(id) ON DELETE CASCADE,
+    shard VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Token buckets shared by all workers (used when RATE_LIMIT_BACKEND=database);
+-- unlogged because they are rewritten on almost every request
+CREATE UNLOGGED TABLE rate_limit_buckets (
+    key VARCHAR(200) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    capacity DOUBLE PRECISION NOT NULL,
+    rate DOUBLE PRECISION NOT NULL, -- tokens added per second
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Stored responses for requests sent with an Idempotency-Key header
+-- (used when IDEMPOTENCY_BACKEND=database)
+CREATE TABLE idempotency_keys (
+    key VARCHAR(64) PRIMARY KEY, -- SHA-256 of caller, method, path and client key
+    fingerprint VARCHAR(64) NOT NULL, -- SHA-256 of the request body
+    status_code INTEGER, -- NULL while the original request is in progress
+    response_headers TEXT,
+    response_body BYTEA,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Change events written in the same transaction as the change itself
+CREATE TABLE outbox_events (
+    id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(), -- writing transaction; events are read in (txid, id) order
+    entity VARCHAR(50) NOT NULL, -- e.g. resident_finance
+    entity_id UUID NOT NULL,
+    op VARCHAR(10) NOT NULL, -- 'created', 'updated', 'deleted'
+    society_id UUID,
+    changed JSONB, -- names of the changed columns, for updates
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Read position of each shared outbox subscriber
+CREATE TABLE outbox_cursors (
+    subscriber VARCHAR(100) PRIMARY KEY,
+    last_txid BIGINT NOT NULL DEFAULT 0,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Background jobs, claimed by job workers with SELECT ... FOR UPDATE SKIP LOCKED
+CREATE TABLE jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    kind VARCHAR(50) NOT NULL, -- handler name, e.g. billing_run
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'cancelling', 'succeeded', 'failed', 'cancelled'
+    society_id UUID REFERENCES societies(id) ON DELETE CASCADE,
+    payload JSONB NOT NULL DEFAULT '{}',
+    result JSONB,
+    error TEXT,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP, -- not claimed before this time
+    locked_by VARCHAR(255), -- worker id while running
+    locked_at TIMESTAMP WITH TIME ZONE, -- refreshed on progress; stale locks are requeued
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
 -- ================================================
@@ -238,6 +377,16 @@ CREATE TRIGGER update_society_join_requests_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+CREATE TRIGGER update_society_shards_updated_at
+    BEFORE UPDATE ON society_shards
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_jobs_updated_at
+    BEFORE UPDATE ON jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
 -- ================================================
 -- INDEXES FOR PERFORMANCE
 -- ================================================
@@ -254,9 +403,29 @@ CREATE INDEX idx_society_finances_expense_date ON society_finances(expense_date)
 CREATE INDEX idx_society_finances_payment_status ON society_finances(payment_status);
 CREATE INDEX idx_society_finances_transaction_category ON society_finances(transaction_category);
 
+-- Finance archive indexes
+CREATE INDEX idx_resident_finances_archive_resident_id ON resident_finances_archive(resident_id);
+CREATE INDEX idx_resident_finances_archive_due_date ON resident_finances_archive(due_date);
+CREATE INDEX idx_society_finances_archive_society_id ON society_finances_archive(society_id, expense_date);
+
+-- API support table indexes
+CREATE INDEX idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- Outbox indexes
+CREATE INDEX idx_outbox_events_txid_id ON outbox_events(txid, id);
+CREATE INDEX idx_outbox_events_created_at ON outbox_events(created_at);
+CREATE INDEX idx_outbox_events_entity_txid_id ON outbox_events(entity, txid, id);
+
+-- Job queue indexes; workers claim the oldest due job and only queued rows are indexed
+CREATE INDEX idx_jobs_claim ON jobs(run_at) WHERE status = 'queued';
+CREATE INDEX idx_jobs_locked_at ON jobs(locked_at) WHERE status IN ('running', 'cancelling');
+CREATE INDEX idx_jobs_society_id ON jobs(society_id);
+CREATE INDEX idx_jobs_kind_status ON jobs(kind, status);
+
 -- RBAC table indexes
 CREATE INDEX idx_users_role_id ON users(role_id);
 CREATE INDEX idx_users_resident_id ON users(resident_id);
+CREATE INDEX idx_users_resident_society_id ON users(resident_society_id);
 CREATE INDEX idx_role_permissions_role_id ON role_permissions(role_id);
 CREATE INDEX idx_role_permissions_permission_id ON role_permissions(permission_id);
 CREATE INDEX idx_society_admins_user_id ON society_admins(user_id);
@@ -265,7 +434,10 @@ CREATE INDEX idx_society_admins_society_id ON society_admins(society_id);
 -- Join request table indexes
 CREATE INDEX idx_society_join_requests_user_id ON society_join_requests(user_id);
 CREATE INDEX idx_society_join_requests_society_id ON society_join_requests(society_id);
-CREATE INDEX idx_society_join_requests_status ON society_join_requests(status);
+-- At most one pending request per user and society
+CREATE UNIQUE INDEX idx_society_join_requests_one_pending ON society_join_requests(user_id, society_id) WHERE status = 'pending';
+-- The approval queue of a society, oldest first; only pending rows are indexed
+CREATE INDEX idx_society_join_requests_pending ON society_join_requests(society_id, created_at, id) WHERE status = 'pending';
 CREATE INDEX idx_society_join_requests_reviewed_by ON society_join_requests(reviewed_by);
 
 -- ================================================
@@ -300,6 +472,72 @@ JOIN users u ON sjr.user_id = u.id
 JOIN societies s ON sjr.society_id = s.id
 LEFT JOIN users reviewer ON sjr.reviewed_by = reviewer.id;
 
+-- ================================================
+-- ROW-LEVEL SECURITY (used when TENANT_RLS=true)
+-- ================================================
+
+-- API requests of users restricted to some societies run as nivra_tenant
+-- with app.society_ids set for the transaction; the table owner is not
+-- subject to the policies.
+
+-- Societies the current transaction may see, from app.society_ids ('{id,...}')
+CREATE OR REPLACE FUNCTION app_society_ids() RETURNS UUID[]
+LANGUAGE sql STABLE AS $$
+    SELECT coalesce(nullif(current_setting('app.society_ids', true), ''), '{}')::uuid[]
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'nivra_tenant') THEN
+        CREATE ROLE nivra_tenant NOLOGIN;
+    END IF;
+    -- Lets the API's login role switch to nivra_tenant with SET LOCAL ROLE
+    GRANT nivra_tenant TO CURRENT_USER;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'Could not create role nivra_tenant; TENANT_RLS needs a role with CREATEROLE to rerun this block';
+END
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'nivra_tenant') THEN
+        RETURN;
+    END IF;
+
+    GRANT USAGE ON SCHEMA public TO nivra_tenant;
+    GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA public TO nivra_tenant;
+    GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA public TO nivra_tenant;
+    ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO nivra_tenant;
+    ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT USAGE, SELECT ON SEQUENCES TO nivra_tenant;
+
+    -- The policies are plain society_id predicates, so the planner can use
+    -- the society_id indexes for them
+    ALTER TABLE residents ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON residents TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+
+    ALTER TABLE resident_finances ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON resident_finances TO nivra_tenant
+        USING (resident_id IN (SELECT id FROM residents WHERE society_id = ANY (app_society_ids())));
+
+    ALTER TABLE society_finances ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON society_finances TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+
+    ALTER TABLE resident_finances_archive ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON resident_finances_archive TO nivra_tenant
+        USING (resident_id IN (SELECT id FROM residents WHERE society_id = ANY (app_society_ids())));
+
+    ALTER TABLE society_finances_archive ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON society_finances_archive TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+
+    ALTER TABLE society_admins ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY tenant_isolation ON society_admins TO nivra_tenant
+        USING (society_id = ANY (app_society_ids()));
+END
+$$;
+
 -- ================================================
 -- COMMENTS FOR SCHEMA DOCUMENTATION
 -- ================================================
@@ -64,8 +64,12 @@ $backendJob = Start-Job -ScriptBlock {
     # Set PYTHONPATH to include the virtual environment's site-packages
     $env:PYTHONPATH = Join-Path -Path $using:API_DIR -ChildPath "venv\Lib\site-packages"
     
-    # Start the FastAPI server
-    & $venvPython -m uvicorn main:app --reload
+    # Start the FastAPI server (one worker per CPU; set NIVRA_RELOAD=1 for auto-reload)
+    if ($env:NIVRA_RELOAD -eq "1") {
+        & $venvPython serve.py --reload
+    } else {
+        & $venvPython serve.py
+    }
 }
 
 # Give the backend a moment to start
@@ -88,7 +88,12 @@ elif [ -f "venv/Scripts/python.exe" ]; then
     PYTHON_CMD="./venv/Scripts/python.exe"
 fi
 
-$PYTHON_CMD -m uvicorn main:app --reload &
+# serve.py runs one worker per CPU; set NIVRA_RELOAD=1 for a single auto-reloading dev process
+if [ "${NIVRA_RELOAD:-0}" = "1" ]; then
+    $PYTHON_CMD serve.py --reload &
+else
+    $PYTHON_CMD serve.py &
+fi
 BACKEND_PID=$!
 
 # Give the backend a moment to start
@@ -126,9 +131,10 @@ FRONTEND_PID=$!
 cleanup() {
     echo -e "\n${BLUE}Shutting down servers...${NC}"
     
-    # Kill backend process
+    # Kill backend process; SIGTERM lets the workers finish in-flight requests
     if [ ! -z "$BACKEND_PID" ]; then
-        kill $BACKEND_PID 2>/dev/null
+        kill -TERM $BACKEND_PID 2>/dev/null
+        wait $BACKEND_PID 2>/dev/null
         echo -e "${GREEN}Backend server stopped${NC}"
     fi
     
@@ -140,6 +146,7 @@ cleanup() {
     
     # Kill any remaining uvicorn or npm processes
     pkill -f "uvicorn main:app" 2>/dev/null
+    pkill -f "serve.py" 2>/dev/null
     pkill -f "npm start" 2>/dev/null
     
     echo -e "${GREEN}Servers stopped successfully.${NC}"